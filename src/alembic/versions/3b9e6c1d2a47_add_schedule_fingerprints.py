@@ -0,0 +1,34 @@
+"""add schedule fingerprints
+
+Revision ID: 3b9e6c1d2a47
+Revises: f285ecb31441
+Create Date: 2026-10-17 11:05:12.481203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9e6c1d2a47'
+down_revision: Union[str, Sequence[str], None] = 'f285ecb31441'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('schedule_fingerprints',
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_schedule_fingerprints_key'), 'schedule_fingerprints', ['key'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_schedule_fingerprints_key'), table_name='schedule_fingerprints')
+    op.drop_table('schedule_fingerprints')
@@ -0,0 +1,27 @@
+"""add user reminder minutes
+
+Revision ID: 5e2b8a6f3c10
+Revises: d17a4f0c9b38
+Create Date: 2026-10-17 14:10:03.518822
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b8a6f3c10'
+down_revision: Union[str, Sequence[str], None] = 'd17a4f0c9b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('reminder_minutes', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'reminder_minutes')
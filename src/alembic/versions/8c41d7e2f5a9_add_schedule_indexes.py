@@ -0,0 +1,44 @@
+"""add schedule indexes, drop surrogate id from group_lesson
+
+Revision ID: 8c41d7e2f5a9
+Revises: 3b9e6c1d2a47
+Create Date: 2026-10-17 12:20:41.913570
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8c41d7e2f5a9'
+down_revision: Union[str, Sequence[str], None] = '3b9e6c1d2a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # (group_id, lesson_id) becomes the key, drop duplicate links first
+    op.execute(
+        "DELETE FROM group_lesson a USING group_lesson b "
+        "WHERE a.id > b.id AND a.group_id = b.group_id AND a.lesson_id = b.lesson_id"
+    )
+    op.drop_constraint('group_lesson_pkey', 'group_lesson', type_='primary')
+    op.drop_column('group_lesson', 'id')
+    op.create_primary_key('group_lesson_pkey', 'group_lesson', ['group_id', 'lesson_id'])
+    op.create_index('ix_group_lesson_lesson_id', 'group_lesson', ['lesson_id'], unique=False)
+
+    op.create_index('ix_lessons_lesson_date_lesson_number', 'lessons', ['lesson_date', 'lesson_number'],
+                    unique=False, postgresql_include=['id', 'subject_id', 'lesson_type'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_lessons_lesson_date_lesson_number', table_name='lessons')
+
+    op.drop_index('ix_group_lesson_lesson_id', table_name='group_lesson')
+    op.drop_constraint('group_lesson_pkey', 'group_lesson', type_='primary')
+    op.add_column('group_lesson', sa.Column('id', sa.Integer(), autoincrement=True, nullable=False,
+                                            server_default=sa.Identity()))
+    op.create_primary_key('group_lesson_pkey', 'group_lesson', ['group_id', 'lesson_id', 'id'])
@@ -0,0 +1,29 @@
+"""add retention indexes
+
+Revision ID: a4c9e71b2d58
+Revises: 5e2b8a6f3c10
+Create Date: 2026-10-17 16:42:55.102384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c9e71b2d58'
+down_revision: Union[str, Sequence[str], None] = '5e2b8a6f3c10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_lessons_subject_id', 'lessons', ['subject_id'], unique=False)
+    op.create_index('ix_group_timetable_lesson_id', 'group_timetable', ['lesson_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_group_timetable_lesson_id', table_name='group_timetable')
+    op.drop_index('ix_lessons_subject_id', table_name='lessons')
@@ -0,0 +1,55 @@
+"""add group timetable
+
+Revision ID: d17a4f0c9b38
+Revises: 8c41d7e2f5a9
+Create Date: 2026-10-17 13:02:17.204519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'd17a4f0c9b38'
+down_revision: Union[str, Sequence[str], None] = '8c41d7e2f5a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('group_timetable',
+    sa.Column('group_id', sa.Integer(), nullable=False),
+    sa.Column('lesson_id', sa.Integer(), nullable=False),
+    sa.Column('lesson_date', sa.Date(), nullable=False),
+    sa.Column('lesson_number', sa.Integer(), nullable=True),
+    sa.Column('lesson_type', postgresql.ENUM('UNKNOWN', 'LECTURE', 'PRACTICE', 'SEMINAR', 'LAB', 'EXAM',
+                                             name='lesson_type', create_type=False), nullable=True),
+    sa.Column('subject_name', sa.Text(), nullable=False),
+    sa.Column('start_time', sa.Time(), nullable=True),
+    sa.Column('end_time', sa.Time(), nullable=True),
+    sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['lesson_id'], ['lessons.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('group_id', 'lesson_id')
+    )
+    op.create_index('ix_group_timetable_group_date', 'group_timetable', ['group_id', 'lesson_date', 'lesson_number'],
+                    unique=False, postgresql_include=['lesson_type', 'subject_name', 'start_time', 'end_time'])
+
+    op.execute(
+        "INSERT INTO group_timetable "
+        "(group_id, lesson_id, lesson_date, lesson_number, lesson_type, subject_name, start_time, end_time) "
+        "SELECT group_lesson.group_id, lessons.id, lessons.lesson_date, lessons.lesson_number, lessons.lesson_type, "
+        "subjects.name, lesson_time.start_time, lesson_time.end_time "
+        "FROM lessons "
+        "JOIN group_lesson ON group_lesson.lesson_id = lessons.id "
+        "JOIN subjects ON subjects.id = lessons.subject_id "
+        "LEFT OUTER JOIN lesson_time ON lesson_time.lesson_number = lessons.lesson_number"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_group_timetable_group_date', table_name='group_timetable')
+    op.drop_table('group_timetable')
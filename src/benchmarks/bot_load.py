@@ -0,0 +1,222 @@
+"""
+Offline load test of the bot handlers: simulated users send /today, /week, /two_weeks and /set_group and press
+a group button, at --rate updates per second. Every update is a real telegram Update (with a CallbackQuery for
+the button) handed to the real handlers.py coroutine through the bot's OrderedUpdateProcessor, replies go to a
+Bot backed by FakeBotApi. Latency runs from the moment an update is due, so a backlog shows up as latency
+instead of a lower request rate.
+
+Profiles mix the commands like the two peaks the deployment is sized for: "morning" (everyone checks
+the schedule) and "semester" (new students pick their groups). Runs against a local SQLite file:
+
+    python -m benchmarks.bot_load --users 5000 --rate 200 --duration 30 --profile morning
+    python -m benchmarks.bot_load --users 5000 --rate 100 --duration 30 --profile semester --send-queue
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from benchmarks.today_latency import LESSON_TIMES, add_query_latency, configure_database
+
+PROFILES = {
+    "morning": {"today": 70, "week": 20, "two_weeks": 10},
+    "semester": {"set_group": 40, "callback": 40, "today": 15, "week": 5},
+    "all": {"today": 1, "week": 1, "two_weeks": 1, "set_group": 1, "callback": 1},
+}
+COMMAND_TEXTS = {"today": "/today", "week": "/week", "two_weeks": "/two_weeks", "set_group": "/set_group"}
+LESSONS_PER_DAY = 4
+
+
+class Request(NamedTuple):
+    command: str
+    tg_id: int
+    callback_data: Optional[str] = None
+
+
+def iter_lessons(groups: List[str], start: date, days: int):
+    for day in range(days):
+        for index, group in enumerate(groups):
+            for lesson_number in range(1, LESSONS_PER_DAY + 1):
+                yield {
+                    'lesson_info': f"Subject {(index + lesson_number + day) % 50}",
+                    'lesson_number': lesson_number,
+                    'groups': [group],
+                    'lesson_date': start + timedelta(days=day),
+                }
+
+
+def seed(database_manager, groups: List[str], users: int) -> None:
+    """Four weeks of lessons around today and users spread over the groups."""
+    from config import now_local
+    from models.lesson import LessonTime
+
+    with database_manager.atomic() as session:
+        session.add_all(LessonTime(lesson_number=number, start_time=start, end_time=end)
+                        for number, start, end in LESSON_TIMES)
+    database_manager.bulk_create_lessons(groups, iter_lessons(groups, now_local().date() - timedelta(days=7), 28))
+    database_manager.upsert_users((tg_id, groups[tg_id % len(groups)]) for tg_id in range(1, users + 1))
+
+
+def make_requests(profile: Dict[str, int], users: int, group_ids: List[int], count: int,
+                  seed_value: int) -> List[Request]:
+    generator = random.Random(seed_value)
+    commands = generator.choices(list(profile), weights=list(profile.values()), k=count)
+    requests = []
+    for command in commands:
+        tg_id = generator.randint(1, users)
+        callback_data = f"g:{generator.choice(group_ids)}" if command == "callback" else None
+        requests.append(Request(command, tg_id, callback_data))
+    return requests
+
+
+def make_update(bot, update_id: int, request: Request):
+    from telegram import Update
+    from benchmarks.fake_bot_api import BOT_USER
+
+    user = {"id": request.tg_id, "is_bot": False, "first_name": "Student"}
+    chat = {"id": request.tg_id, "first_name": "Student", "type": "private"}
+    if request.command == "callback":
+        data = {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(request.tg_id), "data": request.callback_data,
+            "message": {"message_id": update_id, "date": int(time.time()), "chat": chat, "from": BOT_USER,
+                        "text": "Choose a group:"},
+        }}
+    else:
+        text = COMMAND_TEXTS[request.command]
+        data = {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": chat, "from": user, "text": text,
+            "entities": [{"offset": 0, "length": len(text), "type": "bot_command"}],
+        }}
+    return Update.de_json(data, bot)
+
+
+def get_handlers() -> Dict[str, Callable]:
+    from handlers import (today_command, week_command, two_week_command, set_group_command,
+                          receive_group_callback)
+
+    return {
+        "today": today_command,
+        "week": week_command,
+        "two_weeks": two_week_command,
+        "set_group": set_group_command,
+        "callback": receive_group_callback,
+    }
+
+
+async def drive(bot, requests: List[Request], rate: float, max_concurrent: int) -> Tuple[Dict[str, dict], float]:
+    """Hand the requests to the handlers at rate per second, returns latencies and errors per command
+    and the elapsed time."""
+    from utils.update_processor import OrderedUpdateProcessor
+
+    handlers = get_handlers()
+    processor = OrderedUpdateProcessor(max_concurrent)
+    results = defaultdict(lambda: {"latencies": [], "errors": 0})
+
+    async def handle(request: Request, update, due: float) -> None:
+        result = results[request.command]
+        try:
+            await handlers[request.command](update, SimpleNamespace(args=[]))
+        except Exception as e:
+            result["errors"] += 1
+            logging.getLogger("bot_load").error(f"{request.command} failed: {e}")
+        result["latencies"].append(time.perf_counter() - due)
+
+    started = time.perf_counter()
+    tasks = []
+    for index, request in enumerate(requests):
+        due = started + index / rate
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = make_update(bot, index + 1, request)
+        tasks.append(asyncio.ensure_future(processor.process_update(update, handle(request, update, due))))
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - started
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * fraction + 0.5) - 1))]
+
+
+def report(results: Dict[str, dict], elapsed: float, rate: float, replies: int) -> None:
+    print(f"offered {rate:.0f} updates/s, {replies} replies captured, elapsed {elapsed:.2f} s")
+    print(f"{'command':<10} {'calls':>6} {'errors':>6} {'per s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = sorted(results.items())
+    rows.append(("all", {"latencies": [latency for _, result in rows for latency in result["latencies"]],
+                         "errors": sum(result["errors"] for _, result in rows)}))
+    for command, result in rows:
+        latencies = sorted(result["latencies"])
+        if not latencies:
+            continue
+        print(f"{command:<10} {len(latencies):>6} {result['errors']:>6} {len(latencies) / elapsed:>8.1f} "
+              + " ".join(f"{percentile(latencies, fraction) * 1000:>9.2f}" for fraction in (0.5, 0.95, 0.99)))
+
+
+async def run(args, groups: List[str]) -> None:
+    from telegram import Bot
+    from benchmarks.fake_bot_api import FakeBotApi, FAKE_TOKEN
+    from db import async_database_manager
+    from group_picker import get_groups
+    from utils.send_queue import send_queue
+
+    add_query_latency(async_database_manager.engine.sync_engine, args.query_latency_ms / 1000)
+    api = FakeBotApi(latency=args.api_latency_ms / 1000)
+    bot = Bot(FAKE_TOKEN, request=api, get_updates_request=FakeBotApi())
+    await bot.initialize()
+    # same as the bot's post_init hook
+    await async_database_manager.warm_user_groups()
+    if args.send_queue:
+        send_queue.start()
+
+    group_ids = [group_id for group_id, _ in await get_groups()]
+    requests = make_requests(PROFILES[args.profile], args.users, group_ids, int(args.rate * args.duration),
+                             args.seed)
+    try:
+        results, elapsed = await drive(bot, requests, args.rate, args.max_concurrent)
+    finally:
+        if args.send_queue:
+            await send_queue.stop()
+        await bot.shutdown()
+        await async_database_manager.dispose()
+
+    # callbacks are answered before the picker message is edited, answers are not replies
+    report(results, elapsed, args.rate, sum(method != "answerCallbackQuery" for _, method, _ in api.sent))
+    if args.send_queue:
+        print(f"send queue: {send_queue.get_stats()}")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--users", type=int, default=5000)
+    arg_parser.add_argument("--groups", type=int, default=40)
+    arg_parser.add_argument("--rate", type=float, default=200, help="updates per second")
+    arg_parser.add_argument("--duration", type=float, default=10, help="seconds of traffic")
+    arg_parser.add_argument("--profile", choices=sorted(PROFILES), default="morning")
+    arg_parser.add_argument("--max-concurrent", type=int, default=64, help="MAX_CONCURRENT_UPDATES of the bot")
+    arg_parser.add_argument("--send-queue", action="store_true",
+                            help="send replies through the rate-limited send queue like the running bot")
+    arg_parser.add_argument("--query-latency-ms", type=float, default=0.0)
+    arg_parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database(os.path.join(directory, "bench.sqlite3"))
+        from db import database_manager
+
+        logging.getLogger().setLevel(logging.WARNING)
+        groups = [f"{25 - number % 4}-HR-{number:02d}" for number in range(1, args.groups + 1)]
+        seed(database_manager, groups, args.users)
+        database_manager.engine.dispose()
+        asyncio.run(run(args, groups))
+
+
+if __name__ == "__main__":
+    main()
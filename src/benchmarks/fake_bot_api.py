@@ -0,0 +1,100 @@
+"""
+In-process stand-in for the Telegram Bot API, plugged into python-telegram-bot as its request backend:
+
+    Application.builder().token(FAKE_TOKEN).request(FakeBotApi()).get_updates_request(FakeBotApi())
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+FAKE_TOKEN = "123456:FAKE-TOKEN"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Schedule bench", "username": "schedule_bench_bot"}
+SEND_METHODS = {"sendMessage", "editMessageText", "answerCallbackQuery"}
+FLOOD_LIMITED_METHODS = {"sendMessage", "editMessageText"}
+
+
+class FakeBotApi(BaseRequest):
+    """Answers every Bot API method successfully, optionally after latency seconds.
+    Send methods are recorded in sent as (perf_counter, method, parameters) and passed to on_send.
+
+    With flood_limit (sends per second overall) or chat_flood_limit (sends per second per chat) set, sends
+    over the limit get a 429 with retry_after, like telegram's flood control, and are counted in rejected."""
+
+    def __init__(self, latency: float = 0.0, on_send: Optional[Callable[[str, dict], None]] = None,
+                 flood_limit: Optional[int] = None, chat_flood_limit: Optional[int] = None,
+                 retry_after: int = 1) -> None:
+        self.latency = latency
+        self.on_send = on_send
+        self.flood_limit = flood_limit
+        self.chat_flood_limit = chat_flood_limit
+        self.retry_after = retry_after
+        self.sent: List[Tuple[float, str, dict]] = []
+        self.rejected = 0
+        self.message_id = 0
+        self._recent: deque = deque()
+        self._recent_by_chat: Dict[int, deque] = {}
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        return None
+
+    async def shutdown(self) -> None:
+        return None
+
+    def is_flooding(self, chat_id: int, now: float) -> bool:
+        windows = [(self._recent, self.flood_limit),
+                   (self._recent_by_chat.setdefault(chat_id, deque()), self.chat_flood_limit)]
+        for window, limit in windows:
+            while window and window[0] <= now - 1:
+                window.popleft()
+            if limit is not None and len(window) >= limit:
+                return True
+        for window, limit in windows:
+            window.append(now)
+        return False
+
+    def make_result(self, method: str, parameters: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return []
+        if method in ("sendMessage", "editMessageText"):
+            self.message_id += 1
+            return {
+                "message_id": parameters.get("message_id", self.message_id),
+                "date": int(time.time()),
+                "chat": {"id": parameters["chat_id"], "type": "private"},
+                "from": BOT_USER,
+                "text": parameters.get("text", ""),
+            }
+        return True
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         *args, **kwargs) -> Tuple[int, bytes]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        api_method = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if api_method in SEND_METHODS:
+            now = time.perf_counter()
+            if api_method in FLOOD_LIMITED_METHODS and self.is_flooding(parameters.get("chat_id"), now):
+                self.rejected += 1
+                return 429, json.dumps({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }).encode()
+
+            self.sent.append((now, api_method, parameters))
+            if self.on_send:
+                self.on_send(api_method, parameters)
+
+        return 200, json.dumps({"ok": True, "result": self.make_result(api_method, parameters)}).encode()
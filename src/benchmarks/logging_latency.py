@@ -0,0 +1,133 @@
+"""
+Latency of handle_message (two chat log records per message) under heavy message volume with the previous
+logging setup, handlers writing on the event loop, against the queued pipeline of utils.logger: plain text,
+sampled chat logs and JSON. Records go to a rotating file in a temporary directory and to a stream on
+os.devnull, --write-latency-ms adds a delay to every file write to stand in for a slow or busy disk. Replies
+are not sent anywhere. "drain" is the time the writer thread still needs after the last message.
+
+    python -m benchmarks.logging_latency --messages 20000 --write-latency-ms 0.2
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+from types import SimpleNamespace
+from typing import Callable, List, Tuple
+
+from benchmarks.bot_load import percentile
+from benchmarks.today_latency import configure_database
+
+MODES = ("sync", "queued", "sampled", "json")
+
+
+class SlowFileHandler(RotatingFileHandler):
+    def __init__(self, *args, write_latency: float = 0.0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.write_latency = write_latency
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.write_latency > 0:
+            time.sleep(self.write_latency)
+        super().emit(record)
+
+
+def make_update(number: int):
+    async def reply_text(*args, **kwargs):
+        return None
+
+    chat = SimpleNamespace(id=number % 5000, type="private")
+    return SimpleNamespace(message=SimpleNamespace(chat=chat, chat_id=chat.id, text=f"hello {number}",
+                                                   reply_text=reply_text))
+
+
+def install(mode: str, directory: str, devnull, write_latency: float, sample_rate: float) -> Callable[[], None]:
+    """Point the root logger at the handlers of mode, returns the function that flushes and detaches them."""
+    from utils.logger import CHAT_LOGGER, SamplingFilter, build_pipeline, make_formatter
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.setLevel(logging.DEBUG)
+    chat_logger = logging.getLogger(CHAT_LOGGER)
+    chat_logger.filters.clear()
+
+    file_handler = SlowFileHandler(os.path.join(directory, f"{mode}.log"), maxBytes=10 * 1024 * 1024,
+                                   backupCount=2, encoding="utf-8", write_latency=write_latency)
+    handlers: List[logging.Handler] = [file_handler, logging.StreamHandler(devnull)]
+    if mode == "sync":
+        for handler in handlers:
+            handler.setFormatter(make_formatter("text"))
+            root.addHandler(handler)
+        return lambda: [handler.close() for handler in handlers]
+
+    if mode == "sampled":
+        chat_logger.addFilter(SamplingFilter(sample_rate))
+    queue_handler, listener = build_pipeline(handlers, "json" if mode == "json" else "text",
+                                             queue_size=1_000_000)
+    root.addHandler(queue_handler)
+    listener.start()
+
+    def stop() -> None:
+        listener.stop()
+        for handler in handlers:
+            handler.close()
+        if queue_handler.dropped:
+            print(f"{mode}: {queue_handler.dropped} records dropped")
+
+    return stop
+
+
+async def drive(messages: int) -> List[float]:
+    from handlers import handle_message
+
+    latencies = []
+    for number in range(messages):
+        update = make_update(number)
+        started = time.perf_counter()
+        await handle_message(update, None)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def run_mode(mode: str, args, directory: str, devnull) -> Tuple[List[float], float]:
+    stop = install(mode, directory, devnull, args.write_latency_ms / 1000, args.sample_rate)
+    try:
+        latencies = asyncio.run(drive(args.messages))
+    finally:
+        started = time.perf_counter()
+        stop()
+    return sorted(latencies), time.perf_counter() - started
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--messages", type=int, default=20_000)
+    arg_parser.add_argument("--write-latency-ms", type=float, default=0.0,
+                            help="delay added to every record written to the file")
+    arg_parser.add_argument("--sample-rate", type=float, default=0.1, help="chat log share kept by 'sampled'")
+    arg_parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        configure_database(os.path.join(directory, "bench.sqlite3"))
+        os.environ["LOG_FILE"] = ""
+        import atexit
+        import utils.logger
+
+        # replaced by the handlers of every mode
+        utils.logger.listener.stop()
+        atexit.unregister(utils.logger.listener.stop)
+
+        print(f"{args.messages} messages, {args.write_latency_ms} ms per file write")
+        print(f"{'mode':<8} {'msg/s':>9} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'max us':>9} {'drain ms':>9}")
+        for mode in args.modes:
+            latencies, drain = run_mode(mode, args, directory, devnull)
+            print(f"{mode:<8} {len(latencies) / sum(latencies):>9.0f} "
+                  + " ".join(f"{percentile(latencies, fraction) * 1e6:>9.1f}" for fraction in (0.5, 0.95, 0.99))
+                  + f" {latencies[-1] * 1e6:>9.1f} {drain * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
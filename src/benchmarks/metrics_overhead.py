@@ -0,0 +1,71 @@
+"""
+Hot path cost of the metrics: a no-op handler called directly and through instrument_handler, and SELECT 1 on an
+in-memory SQLite engine with and without instrument_engine, plus the time to render a scrape. The overhead per
+call should stay in the low microseconds, far below a /today round-trip.
+
+    python -m benchmarks.metrics_overhead --calls 100000
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+
+async def time_handler(callback, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await callback(None, None)
+    return (time.perf_counter() - started) / calls
+
+
+def time_statements(engine, calls: int) -> float:
+    from sqlalchemy import text
+
+    statement = text("SELECT 1")
+    with engine.connect() as connection:
+        started = time.perf_counter()
+        for _ in range(calls):
+            connection.execute(statement).scalar()
+        return (time.perf_counter() - started) / calls
+
+
+def report(name: str, plain: float, instrumented: float) -> None:
+    print(f"{name:<10} plain={plain * 1e6:7.2f} us  instrumented={instrumented * 1e6:7.2f} us  "
+          f"overhead={(instrumented - plain) * 1e6:6.2f} us/call ({(instrumented / plain - 1) * 100:+.1f}%)")
+
+
+async def run(calls: int) -> None:
+    from sqlalchemy import create_engine
+    from utils.metrics import REGISTRY, instrument_engine, instrument_handler
+
+    async def handler(update, context):
+        return None
+
+    wrapped = instrument_handler("bench", handler)
+    await time_handler(handler, calls // 10)
+    await time_handler(wrapped, calls // 10)
+    report("handler", await time_handler(handler, calls), await time_handler(wrapped, calls))
+
+    plain_engine = create_engine("sqlite://")
+    instrumented_engine = create_engine("sqlite://")
+    instrument_engine(instrumented_engine, "bench")
+    time_statements(plain_engine, calls // 10)
+    time_statements(instrumented_engine, calls // 10)
+    report("statement", time_statements(plain_engine, calls), time_statements(instrumented_engine, calls))
+
+    started = time.perf_counter()
+    text = REGISTRY.render()
+    print(f"scrape     {len(text.splitlines())} lines rendered in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--calls", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(run(args.calls))
+
+
+if __name__ == "__main__":
+    main()
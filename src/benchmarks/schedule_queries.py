@@ -0,0 +1,111 @@
+"""
+Query plans and timings of the /today and /two_weeks schedule reads over a year of lessons.
+
+Runs against a local SQLite file unless ``--database-url`` points at a Postgres instance
+(migrated with ``alembic upgrade head``), in which case the plans come from EXPLAIN (ANALYZE, BUFFERS):
+
+    python -m benchmarks.schedule_queries --groups 40 --repeat 200
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.today_latency import LESSON_TIMES, configure_database
+
+LESSONS_PER_DAY = 4
+START_DATE = date(2025, 9, 1)
+
+
+def iter_year_lessons(groups: list):
+    for day in range(365):
+        lesson_date = START_DATE + timedelta(days=day)
+        for index, group in enumerate(groups):
+            for lesson_number in range(1, LESSONS_PER_DAY + 1):
+                yield {
+                    'lesson_info': f"Subject {(index + lesson_number + day) % 50}",
+                    'lesson_number': lesson_number,
+                    'groups': [group],
+                    'lesson_date': lesson_date,
+                }
+
+
+def seed(database_manager, groups: list) -> None:
+    from models.lesson import LessonTime
+
+    with database_manager.atomic() as session:
+        session.add_all(LessonTime(lesson_number=number, start_time=start, end_time=end)
+                        for number, start, end in LESSON_TIMES)
+    database_manager.bulk_create_lessons(groups, iter_year_lessons(groups))
+
+
+def explain(connection, statement) -> list:
+    from sqlalchemy import text
+
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "postgresql":
+        sql = "EXPLAIN (ANALYZE, BUFFERS) " + sql
+    else:
+        sql = "EXPLAIN QUERY PLAN " + sql
+    return [" ".join(str(column) for column in row) for row in connection.execute(text(sql))]
+
+
+def measure(connection, statement, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        connection.execute(statement).all()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name: str, plan: list, timings: list) -> None:
+    timings = sorted(timings)
+    p50 = statistics.median(timings)
+    p99 = timings[max(0, int(len(timings) * 0.99) - 1)]
+    print(f"{name}: p50={p50 * 1000:.3f} ms  p99={p99 * 1000:.3f} ms")
+    for line in plan:
+        print(f"    {line}")
+
+
+def run(database_manager, repeat: int) -> None:
+    from sqlalchemy import select
+    from db import select_group_lessons
+    from models.group import Group
+
+    today = START_DATE + timedelta(days=180)
+    with database_manager.engine.connect() as connection:
+        group_id = connection.scalar(select(Group.id).order_by(Group.id))
+        queries = (
+            ("today", select_group_lessons(group_id, today, today)),
+            ("two_weeks", select_group_lessons(group_id, today, today + timedelta(days=13))),
+        )
+        for name, statement in queries:
+            report(name, explain(connection, statement), measure(connection, statement, repeat))
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--groups", type=int, default=40)
+    arg_parser.add_argument("--repeat", type=int, default=200)
+    arg_parser.add_argument("--database-url", help="run against an existing, migrated and empty database")
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        if args.database_url:
+            os.environ["DATABASE_URL"] = args.database_url
+        else:
+            configure_database(os.path.join(directory, "bench.sqlite3"))
+        from db import database_manager
+
+        seed(database_manager, [f"BENCH-{number}" for number in range(1, args.groups + 1)])
+        run(database_manager, args.repeat)
+        database_manager.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
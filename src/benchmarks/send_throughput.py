@@ -0,0 +1,76 @@
+"""
+Broadcast throughput against a fake Bot API that enforces telegram-like flood limits: every message sent at once
+(before) versus through the rate-limited send queue (after).
+
+    python -m benchmarks.send_throughput --chats 300 --messages-per-chat 2 --api-latency-ms 30
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+
+async def broadcast(bot, chats: int, messages_per_chat: int, send) -> int:
+    """Sends every message once, returns how many were delivered."""
+    async def deliver(chat_id: int, number: int) -> bool:
+        try:
+            await send(chat_id, bot.send_message, chat_id, f"Schedule changed ({number})")
+            return True
+        except Exception:
+            return False
+
+    results = await asyncio.gather(*(
+        deliver(chat_id, number) for number in range(messages_per_chat) for chat_id in range(1, chats + 1)
+    ))
+    return sum(results)
+
+
+def report(name: str, delivered: int, total: int, rejected: int, elapsed: float) -> None:
+    print(f"{name:<7} delivered={delivered}/{total}  429s={rejected:<5} "
+          f"elapsed={elapsed:6.2f} s  throughput={delivered / elapsed:6.1f} msg/s")
+
+
+async def run(chats: int, messages_per_chat: int, latency: float, queue_size: int) -> None:
+    from telegram import Bot
+    from benchmarks.fake_bot_api import FakeBotApi, FAKE_TOKEN
+    from utils.send_queue import SendQueue
+
+    total = chats * messages_per_chat
+
+    async def send_directly(chat_id, function, *args, **kwargs):
+        return await function(*args, **kwargs)
+
+    for name in ("before", "after"):
+        api = FakeBotApi(latency=latency, flood_limit=30, chat_flood_limit=1)
+        bot = Bot(FAKE_TOKEN, request=api, get_updates_request=FakeBotApi())
+        await bot.initialize()
+
+        send_queue = SendQueue(max_size=queue_size)
+        send = send_directly
+        if name == "after":
+            send_queue.start()
+            send = send_queue.submit
+
+        started = time.perf_counter()
+        delivered = await broadcast(bot, chats, messages_per_chat, send)
+        report(name, delivered, total, api.rejected, time.perf_counter() - started)
+        if name == "after":
+            print(f"        send queue: {send_queue.get_stats()}")
+            await send_queue.stop()
+        await bot.shutdown()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--chats", type=int, default=300)
+    arg_parser.add_argument("--messages-per-chat", type=int, default=2)
+    arg_parser.add_argument("--api-latency-ms", type=float, default=30.0)
+    arg_parser.add_argument("--queue-size", type=int, default=100, help="outstanding sends before submit() waits")
+    args = arg_parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    asyncio.run(run(args.chats, args.messages_per_chat, args.api_latency_ms / 1000, args.queue_size))
+
+
+if __name__ == "__main__":
+    main()
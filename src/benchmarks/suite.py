@@ -0,0 +1,182 @@
+"""
+Time and peak Python memory of every stage of the schedule pipeline on a synthetic workbook: parsing
+(ScheduleParser.load_file and the read-only load_files used by the importer), the setup.py ingest into an empty
+and into an up-to-date database, user registration and the DBManager schedule reads.
+
+Runs against local SQLite files. Save a run with --json and compare later runs against it with --baseline,
+stages slower or heavier than the baseline by more than --threshold percent are flagged and the exit code is 1:
+
+    python -m benchmarks.suite --groups 12 --weeks 16 --sheets 4 --json baseline.json
+    python -m benchmarks.suite --groups 12 --weeks 16 --sheets 4 --baseline baseline.json
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from itertools import count
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from benchmarks.today_latency import configure_database
+from benchmarks.workbook_generator import GeneratedWorkbook, generate_workbook
+
+# setup() prepares a fresh run and returns the callable that is measured
+Stage = Callable[[], Callable[[], Any]]
+
+
+class StageResult(NamedTuple):
+    name: str
+    seconds: float
+    peak_mb: float
+
+
+def measure_stage(name: str, setup: Stage, repeat: int) -> StageResult:
+    """Best time of repeat runs, peak memory from one more run under tracemalloc, which slows code down too much
+    to be timed at the same time."""
+    timings = []
+    for _ in range(repeat):
+        run = setup()
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+
+    run = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return StageResult(name, min(timings), peak / 2 ** 20)
+
+
+def make_stages(workbook: GeneratedWorkbook, directory: str, users: int) -> Dict[str, Stage]:
+    from db import DBManager
+    from importer import import_files
+    from parser.simple_parser import ScheduleParser
+
+    databases = count()
+
+    def new_manager() -> DBManager:
+        return DBManager(f"sqlite:///{os.path.join(directory, f'suite-{next(databases)}.sqlite3')}")
+
+    def imported_manager() -> DBManager:
+        manager = new_manager()
+        import_files(ScheduleParser(), [workbook.path], manager)
+        return manager
+
+    read_manager = imported_manager()
+    registrations = [(tg_id, workbook.groups[tg_id % len(workbook.groups)]) for tg_id in range(1, users + 1)]
+    read_manager.upsert_users(registrations)
+
+    def parse():
+        return lambda: ScheduleParser().load_file(workbook.path)
+
+    def parse_read_only():
+        return lambda: ScheduleParser().load_files([workbook.path])
+
+    def ingest():
+        manager = new_manager()
+        return lambda: import_files(ScheduleParser(), [workbook.path], manager)
+
+    def reimport_unchanged():
+        manager = imported_manager()
+        return lambda: import_files(ScheduleParser(), [workbook.path], manager)
+
+    def register_users():
+        return lambda: read_manager.upsert_users(registrations)
+
+    def read_schedules():
+        # a day in the middle of the generated weeks
+        start = workbook.start + timedelta(weeks=workbook.weeks // 2)
+
+        def run():
+            for tg_id, _ in registrations:
+                read_manager.get_user_lessons_on_date(tg_id, start)
+                read_manager.get_user_lessons_on_period(tg_id, start, start + timedelta(days=13))
+        return run
+
+    return {
+        "parse load_file": parse,
+        "parse read-only": parse_read_only,
+        "ingest": ingest,
+        "re-import unchanged": reimport_unchanged,
+        "register users": register_users,
+        "read schedules": read_schedules,
+    }
+
+
+def compare(results: List[StageResult], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Names of the stages that got slower or heavier than the baseline by more than threshold percent."""
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if previous is None:
+            continue
+        if (result.seconds > previous["seconds"] * (1 + threshold / 100)
+                or result.peak_mb > previous["peak_mb"] * (1 + threshold / 100)):
+            regressions.append(result.name)
+    return regressions
+
+
+def report(results: List[StageResult], baseline: Optional[Dict[str, Dict[str, float]]],
+           regressions: List[str]) -> None:
+    for result in results:
+        line = f"{result.name:<20} time={result.seconds * 1000:9.1f} ms  peak={result.peak_mb:7.2f} MiB"
+        previous = (baseline or {}).get(result.name)
+        if previous:
+            line += (f"  ({(result.seconds / previous['seconds'] - 1) * 100:+6.1f}% time, "
+                     f"{(result.peak_mb / previous['peak_mb'] - 1) * 100 if previous['peak_mb'] else 0:+6.1f}% memory)")
+        if result.name in regressions:
+            line += "  REGRESSION"
+        print(line)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--groups", type=int, default=12, help="groups per sheet")
+    arg_parser.add_argument("--weeks", type=int, default=16)
+    arg_parser.add_argument("--sheets", type=int, default=4)
+    arg_parser.add_argument("--users", type=int, default=500)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best one is reported")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--json", help="write the results to this file")
+    arg_parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    arg_parser.add_argument("--threshold", type=float, default=20.0, help="allowed slowdown in percent")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database(os.path.join(directory, "bench.sqlite3"))
+        workbook = generate_workbook(os.path.join(directory, "Schedule.xlsx"), args.groups, args.weeks, args.sheets,
+                                     seed=args.seed)
+        print(f"workbook: {args.sheets} sheets, {len(workbook.groups)} groups, {args.weeks} weeks, "
+              f"{workbook.lessons} lessons ({workbook.merged_lessons} merged)")
+
+        stages = make_stages(workbook, directory, args.users)
+        # importing db configures the root logger
+        logging.getLogger().setLevel(logging.WARNING)
+        results = [measure_stage(name, setup, args.repeat) for name, setup in stages.items()]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+    report(results, baseline, regressions)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({result.name: result._asdict() for result in results}, file, indent=2)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
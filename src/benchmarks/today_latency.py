@@ -0,0 +1,124 @@
+"""
+p99 latency of concurrent /today calls with the blocking DBManager (before) and AsyncDBManager (after).
+
+Runs against a local SQLite file, ``--query-latency-ms`` emulates a slow Postgres round-trip:
+
+    python -m benchmarks.today_latency --calls 200 --query-latency-ms 5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import time as dt_time
+from types import SimpleNamespace
+
+LESSON_TIMES = (
+    (1, dt_time(9, 0), dt_time(10, 30)),
+    (2, dt_time(10, 40), dt_time(12, 10)),
+    (3, dt_time(12, 20), dt_time(13, 50)),
+    (4, dt_time(14, 20), dt_time(15, 50)),
+    (5, dt_time(16, 0), dt_time(17, 30)),
+    (6, dt_time(18, 0), dt_time(19, 30)),
+    (7, dt_time(19, 40), dt_time(21, 10)),
+)
+
+
+def configure_database(path: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+
+
+def add_query_latency(engine, latency: float) -> None:
+    from sqlalchemy import event
+
+    if latency <= 0:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def sleep_before_execute(*args):
+        time.sleep(latency)
+
+
+def seed(database_manager, users: int) -> None:
+    from config import now_local
+    from models.lesson import LessonTime
+
+    with database_manager.atomic() as session:
+        session.add_all(LessonTime(lesson_number=number, start_time=start, end_time=end)
+                        for number, start, end in LESSON_TIMES)
+
+    database_manager.create_group(name="BENCH-1")
+    for lesson_number in range(1, 5):
+        database_manager.create_lesson_and_add_groups(["BENCH-1"], now_local().date(), lesson_number,
+                                                      f"Subject {lesson_number}", None)
+    for tg_id in range(1, users + 1):
+        database_manager.create_user(tg_id=tg_id)
+        database_manager.attach_user_to_group(tg_id, "BENCH-1")
+
+
+def make_update(tg_id: int) -> SimpleNamespace:
+    async def reply_text(text, **kwargs):
+        return None
+
+    return SimpleNamespace(message=SimpleNamespace(from_user=SimpleNamespace(id=tg_id), chat_id=tg_id,
+                                                   reply_text=reply_text))
+
+
+async def measure(command, calls: int) -> list:
+    latencies = []
+    arrived = time.perf_counter()
+
+    async def timed(tg_id: int):
+        await command(make_update(tg_id), None)
+        latencies.append(time.perf_counter() - arrived)
+
+    await asyncio.gather(*(timed(tg_id) for tg_id in range(1, calls + 1)))
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f"{name:<8} calls={len(latencies):<5} p50={p50 * 1000:8.2f} ms  p99={p99 * 1000:8.2f} ms")
+
+
+async def run(calls: int, latency: float) -> None:
+    from config import now_local
+    from db import database_manager, async_database_manager
+    from handlers import today_command, make_day_lessons_message, send_html_message
+
+    add_query_latency(database_manager.engine, latency)
+    add_query_latency(async_database_manager.engine.sync_engine, latency)
+
+    async def blocking_today_command(update, context) -> None:
+        today_lessons = database_manager.get_user_lessons_on_date(update.message.from_user.id, now_local().date())
+        await send_html_message(update, make_day_lessons_message(today_lessons, header="<b>Today</b>"))
+
+    report("before", await measure(blocking_today_command, calls))
+    # same as the bot's post_init hook
+    await async_database_manager.warm_user_groups()
+    report("after", await measure(today_command, calls))
+    await async_database_manager.dispose()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--calls", type=int, default=200)
+    arg_parser.add_argument("--query-latency-ms", type=float, default=5.0)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database(os.path.join(directory, "bench.sqlite3"))
+        from db import database_manager
+
+        logging.getLogger().setLevel(logging.WARNING)
+        seed(database_manager, args.calls)
+        asyncio.run(run(args.calls, args.query_latency_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+End-to-end latency of the webhook endpoint: recorded Update JSON is POSTed to the bot's webhook server
+and timed until the handler's reply reaches the (fake) Bot API.
+
+Runs against a local SQLite file and needs python-telegram-bot[webhooks]:
+
+    python -m benchmarks.webhook_latency --calls 200 --port 8000
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import os
+import secrets
+import tempfile
+import time
+
+from benchmarks.today_latency import configure_database, seed, report
+
+RECORDED_UPDATES = os.path.join(os.path.dirname(__file__), "recorded_updates.json")
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def make_updates(recorded: list, calls: int) -> list:
+    # every call comes from its own user so replies can be matched by chat id
+    updates = []
+    for tg_id in range(1, calls + 1):
+        update = copy.deepcopy(recorded[(tg_id - 1) % len(recorded)])
+        update["update_id"] = tg_id
+        update["message"]["from"]["id"] = tg_id
+        update["message"]["chat"]["id"] = tg_id
+        updates.append(update)
+    return updates
+
+
+async def run(updates: list, port: int) -> None:
+    import httpx
+    from telegram.ext import Application
+    from benchmarks.fake_bot_api import FakeBotApi, FAKE_TOKEN
+    from config import WEBHOOK_PATH
+    from db import async_database_manager
+    from main import build_application
+
+    posted = {}
+    latencies = []
+    done = asyncio.Event()
+
+    def on_send(method: str, parameters: dict) -> None:
+        latencies.append(time.perf_counter() - posted[parameters["chat_id"]])
+        if len(latencies) == len(updates):
+            done.set()
+
+    secret_token = secrets.token_urlsafe(32)
+    webhook_url = f"http://127.0.0.1:{port}/{WEBHOOK_PATH}"
+    app = build_application(
+        Application.builder().token(FAKE_TOKEN).request(FakeBotApi(on_send=on_send)).get_updates_request(FakeBotApi())
+    )
+    await async_database_manager.warm_user_groups()
+    await app.initialize()
+    await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path=WEBHOOK_PATH,
+                                    webhook_url=webhook_url, secret_token=secret_token)
+    await app.start()
+
+    try:
+        async with httpx.AsyncClient() as client:
+            rejected = await client.post(webhook_url, json=updates[0], headers={SECRET_HEADER: "wrong"})
+            print(f"wrong secret token -> HTTP {rejected.status_code}")
+
+            async def post(update: dict) -> None:
+                posted[update["message"]["chat"]["id"]] = time.perf_counter()
+                response = await client.post(webhook_url, json=update, headers={SECRET_HEADER: secret_token})
+                response.raise_for_status()
+
+            await asyncio.gather(*(post(update) for update in updates))
+            await asyncio.wait_for(done.wait(), timeout=60)
+    finally:
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        await async_database_manager.dispose()
+
+    report("webhook", latencies)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--calls", type=int, default=200)
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--updates", default=RECORDED_UPDATES, help="JSON list of recorded Update objects")
+    args = arg_parser.parse_args()
+
+    with open(args.updates) as file:
+        updates = make_updates(json.load(file), args.calls)
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database(os.path.join(directory, "bench.sqlite3"))
+        from db import database_manager
+
+        logging.getLogger().setLevel(logging.WARNING)
+        seed(database_manager, args.calls)
+        asyncio.run(run(updates, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Synthetic workbooks shaped like schedules/Schedule.xlsx: per sheet a "Vilnius time"/"Group" header with the lesson
+numbers and times, then "N Week" blocks of one row per group and day (a single group-less row for Sunday).
+Lectures shared by several groups are vertically merged cells, the parser reads them as one lesson.
+
+    python -m benchmarks.workbook_generator /tmp/Schedule.xlsx --groups 12 --weeks 16 --sheets 4
+"""
+import argparse
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple
+
+import openpyxl
+
+# column of each lesson number, 9 (I) is the lunch break as in the real schedule
+LESSON_COLUMNS = {1: 6, 2: 7, 3: 8, 4: 10, 5: 11, 6: 12}
+LESSON_TIMES = {1: "9:00 - 10:30", 2: "10:40 - 12:10", 3: "12:20 - 13:50", 4: "14:20 - 15:50", 5: "16:00 - 17:30",
+                6: "18:00 - 19:30"}
+WEEK_COLUMN, DATE_COLUMN, DAY_COLUMN, GROUP_COLUMN = 2, 3, 4, 5
+HEADER_ROW = 2
+FIRST_WEEK_ROW = 4
+SUBJECTS = ("Progr Java", "Progr CS", "Intro to DT", "English", "Calculus", "Databases", "Algorithms", "Networks",
+            "Operating Systems", "Philosophy")
+LESSON_TYPES = ("Lc", "Pr", "Lab")
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat")
+
+
+class GeneratedWorkbook(NamedTuple):
+    path: str
+    groups: List[str]
+    start: date
+    weeks: int
+    # lessons the parser should find, a merged lecture counts once
+    lessons: int
+    merged_lessons: int
+
+
+def get_group_names(sheet: int, groups: int) -> List[str]:
+    return [f"{25 - sheet}-HR-{number:02d}" for number in range(1, groups + 1)]
+
+
+def make_lesson_text(generator: random.Random) -> str:
+    auditorium = "online" if generator.random() < 0.1 else f"aud {generator.randint(200, 350)}"
+    return f"{generator.choice(SUBJECTS)} {generator.choice(LESSON_TYPES)} {auditorium}"
+
+
+def write_header(worksheet, title: str) -> None:
+    worksheet.cell(1, LESSON_COLUMNS[1], title)
+    worksheet.cell(HEADER_ROW, DATE_COLUMN, "Vilnius time")
+    worksheet.cell(HEADER_ROW, GROUP_COLUMN, "Group")
+    worksheet.merge_cells(start_row=HEADER_ROW, start_column=GROUP_COLUMN, end_row=HEADER_ROW + 1,
+                          end_column=GROUP_COLUMN)
+    for lesson_number, column in LESSON_COLUMNS.items():
+        worksheet.cell(HEADER_ROW, column, lesson_number)
+        worksheet.cell(HEADER_ROW + 1, column, LESSON_TIMES[lesson_number])
+    worksheet.cell(HEADER_ROW + 1, 9, "30 min")
+
+
+def write_day(worksheet, generator: random.Random, row: int, groups: List[str], fill: float,
+              merged: float) -> Dict[str, int]:
+    """Write the lessons of one day starting at row, returns the lesson counts."""
+    counts = {"lessons": 0, "merged_lessons": 0}
+    for column in LESSON_COLUMNS.values():
+        index = 0
+        while index < len(groups):
+            span = generator.randint(2, min(4, len(groups) - index)) if len(groups) - index >= 2 else 1
+            if span > 1 and generator.random() < merged:
+                worksheet.cell(row + index, column, make_lesson_text(generator))
+                worksheet.merge_cells(start_row=row + index, start_column=column, end_row=row + index + span - 1,
+                                      end_column=column)
+                counts["lessons"] += 1
+                counts["merged_lessons"] += 1
+                index += span
+                continue
+
+            if generator.random() < fill:
+                worksheet.cell(row + index, column, make_lesson_text(generator))
+                counts["lessons"] += 1
+            index += 1
+    return counts
+
+
+def write_sheet(worksheet, generator: random.Random, groups: List[str], weeks: int, start: date, fill: float,
+                merged: float) -> Dict[str, int]:
+    counts = {"lessons": 0, "merged_lessons": 0}
+    write_header(worksheet, f"{worksheet.title} {start.year}-{start.year + 1}")
+    row = FIRST_WEEK_ROW
+    for week in range(weeks):
+        for day in range(7):
+            lesson_date = start + timedelta(weeks=week, days=day)
+            worksheet.cell(row, DATE_COLUMN, datetime.combine(lesson_date, datetime.min.time()))
+            if day == 0:
+                worksheet.cell(row, WEEK_COLUMN, f"{week + 1} Week")
+            if day == 6:
+                worksheet.cell(row, DAY_COLUMN, "Sun")
+                row += 1
+                continue
+
+            worksheet.cell(row, DAY_COLUMN, f"{DAY_NAMES[day]} 1")
+            for index, group in enumerate(groups):
+                if index:
+                    worksheet.cell(row + index, DAY_COLUMN, index + 1)
+                worksheet.cell(row + index, GROUP_COLUMN, group)
+
+            for key, value in write_day(worksheet, generator, row, groups, fill, merged).items():
+                counts[key] += value
+            row += len(groups)
+    return counts
+
+
+def generate_workbook(path: str, groups: int = 12, weeks: int = 16, sheets: int = 4, fill: float = 0.5,
+                      merged: float = 0.15, start: date = date(2025, 9, 29), seed: int = 0) -> GeneratedWorkbook:
+    """Write a schedule workbook with groups groups per sheet, fill is the share of group/lesson slots
+    with a lesson, merged the share of slots starting a lecture shared by 2-4 groups."""
+    generator = random.Random(seed)
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+
+    all_groups = []
+    lessons = merged_lessons = 0
+    for sheet in range(sheets):
+        sheet_groups = get_group_names(sheet, groups)
+        worksheet = workbook.create_sheet(f"{sheet + 1} курс HR")
+        counts = write_sheet(worksheet, generator, sheet_groups, weeks, start, fill, merged)
+        all_groups.extend(sheet_groups)
+        lessons += counts["lessons"]
+        merged_lessons += counts["merged_lessons"]
+
+    # ignored by the parser, present in the real file
+    workbook.create_sheet("Staff load").cell(1, 1, "Teacher")
+    workbook.save(path)
+    return GeneratedWorkbook(path, all_groups, start, weeks, lessons, merged_lessons)
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--groups", type=int, default=12, help="groups per sheet")
+    arg_parser.add_argument("--weeks", type=int, default=16)
+    arg_parser.add_argument("--sheets", type=int, default=4)
+    arg_parser.add_argument("--fill", type=float, default=0.5)
+    arg_parser.add_argument("--merged", type=float, default=0.15)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    workbook = generate_workbook(args.path, args.groups, args.weeks, args.sheets, args.fill, args.merged,
+                                 seed=args.seed)
+    print(f"{workbook.path}: {len(workbook.groups)} groups, {workbook.lessons} lessons "
+          f"({workbook.merged_lessons} merged)")
+
+
+if __name__ == "__main__":
+    main()
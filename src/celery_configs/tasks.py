@@ -7,3 +7,9 @@ logger = logging.getLogger(__name__)
 @app.task
 def daily_task():
     logger.info("Execute daily task")
+    # the database manager connects on import, keep it out of the beat process
+    from db import database_manager
+    from retention import run_retention
+
+    stats = run_retention(database_manager)
+    return {"lessons": stats["lessons"], "subjects": stats["subjects"]}
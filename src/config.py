@@ -1,4 +1,4 @@
-from os import getenv
+from os import getenv, cpu_count
 from datetime import datetime
 from typing import Final
 from pytz import timezone, utc
@@ -19,4 +19,80 @@ POSTGRES_PASSWORD = getenv("POSTGRES_PASSWORD", "secret_pass")
 POSTGRES_HOST = getenv("POSTGRES_HOST", "localhost")
 POSTGRES_PORT = getenv("POSTGRES_PORT", 5432)
 POSTGRES_DB = getenv("POSTGRES_DB", "app_db")
-DATABASE_URL: Final = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:{POSTGRES_PORT}/{POSTGRES_DB}"
+DATABASE_URL: Final = getenv(
+    "DATABASE_URL",
+    f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+ASYNC_DATABASE_URL: Final = getenv(
+    "ASYNC_DATABASE_URL",
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+
+# connection pool of each engine, sizing is ignored for in-memory sqlite
+DB_POOL_SIZE: Final = int(getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW: Final = int(getenv("DB_MAX_OVERFLOW", 10))
+# seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT: Final = float(getenv("DB_POOL_TIMEOUT", 10))
+# seconds before a connection is replaced, -1 keeps connections forever
+DB_POOL_RECYCLE: Final = int(getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING: Final = getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no")
+# postgres statement_timeout in milliseconds, 0 turns it off
+DB_STATEMENT_TIMEOUT: Final = int(getenv("DB_STATEMENT_TIMEOUT", 5000))
+
+# lessons older than RETENTION_DAYS are deleted by the daily celery task, 0 turns it off. Every batch is its
+# own short transaction, RETENTION_BATCH_PAUSE seconds apart
+RETENTION_DAYS: Final = int(getenv("RETENTION_DAYS", 180))
+RETENTION_BATCH_SIZE: Final = int(getenv("RETENTION_BATCH_SIZE", 1000))
+RETENTION_BATCH_PAUSE: Final = float(getenv("RETENTION_BATCH_PAUSE", 0.1))
+# gzipped CSV the deleted lessons are appended to, empty keeps no archive
+RETENTION_ARCHIVE: Final = getenv("RETENTION_ARCHIVE", "")
+
+# logging, records are written by a background thread.
+# LOG_LEVELS overrides single loggers: "aiosqlite=INFO,handlers=WARNING"
+LOG_LEVEL: Final = getenv("LOG_LEVEL", "DEBUG")
+LOG_LEVELS: Final = getenv("LOG_LEVELS", "aiosqlite=INFO")
+LOG_FILE: Final = getenv("LOG_FILE", "bot.log")
+LOG_MAX_BYTES: Final = int(getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT: Final = int(getenv("LOG_BACKUP_COUNT", 5))
+# "text" or "json" (one compact object per line)
+LOG_FORMAT: Final = getenv("LOG_FORMAT", "text")
+# records waiting for the writer thread, more are dropped instead of blocking the event loop
+LOG_QUEUE_SIZE: Final = int(getenv("LOG_QUEUE_SIZE", 10000))
+# share of the per-message chat logs that is kept, 1 keeps all
+LOG_CHAT_SAMPLE_RATE: Final = float(getenv("LOG_CHAT_SAMPLE_RATE", 1))
+
+PARSER_WORKERS: Final = int(getenv("PARSER_WORKERS", cpu_count() or 1))
+MESSAGE_CACHE_SIZE: Final = int(getenv("MESSAGE_CACHE_SIZE", 4096))
+USER_GROUP_CACHE_SIZE: Final = int(getenv("USER_GROUP_CACHE_SIZE", 100_000))
+GROUP_KEYBOARD_CACHE_SIZE: Final = int(getenv("GROUP_KEYBOARD_CACHE_SIZE", 256))
+GROUPS_PER_PAGE: Final = int(getenv("GROUPS_PER_PAGE", 24))
+
+# "webhook" serves updates on WEBHOOK_PORT, anything else (or a missing WEBHOOK_URL) falls back to polling
+BOT_MODE: Final = getenv("BOT_MODE", "polling")
+WEBHOOK_URL: Final = getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN: Final = getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT: Final = int(getenv("WEBHOOK_PORT", 8000))
+WEBHOOK_PATH: Final = getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET_TOKEN: Final = getenv("WEBHOOK_SECRET_TOKEN")
+POLL_INTERVAL: Final = float(getenv("POLL_INTERVAL", 0))
+
+# Prometheus metrics on GET /metrics, 0 turns the endpoint off. Must differ from WEBHOOK_PORT in webhook mode
+METRICS_LISTEN: Final = getenv("METRICS_LISTEN", "0.0.0.0")
+METRICS_PORT: Final = int(getenv("METRICS_PORT", 9100))
+
+MAX_CONCURRENT_UPDATES: Final = int(getenv("MAX_CONCURRENT_UPDATES", 64))
+# seconds between update processing stats in the log, 0 turns them off
+UPDATE_STATS_INTERVAL: Final = float(getenv("UPDATE_STATS_INTERVAL", 60))
+
+REMINDER_DEFAULT_MINUTES: Final = int(getenv("REMINDER_DEFAULT_MINUTES", 10))
+REMINDER_MAX_MINUTES: Final = int(getenv("REMINDER_MAX_MINUTES", 120))
+
+# outbound Bot API calls, telegram allows about 30 messages per second overall and 1 per second per chat
+SEND_RATE: Final = float(getenv("SEND_RATE", 30))
+SEND_BURST: Final = float(getenv("SEND_BURST", 1))
+CHAT_SEND_RATE: Final = float(getenv("CHAT_SEND_RATE", 1))
+CHAT_SEND_BURST: Final = float(getenv("CHAT_SEND_BURST", 1))
+SEND_WORKERS: Final = int(getenv("SEND_WORKERS", 4))
+SEND_BATCH_SIZE: Final = int(getenv("SEND_BATCH_SIZE", 8))
+SEND_MAX_RETRIES: Final = int(getenv("SEND_MAX_RETRIES", 3))
+SEND_QUEUE_SIZE: Final = int(getenv("SEND_QUEUE_SIZE", 10_000))
@@ -1,37 +1,244 @@
+import asyncio
 from collections import defaultdict
-from contextlib import contextmanager
-from datetime import time, date, datetime, timedelta
-from operator import and_
-from typing import Any, List, Dict, Optional
-
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker, InstrumentedAttribute, joinedload
+from contextlib import contextmanager, asynccontextmanager
+from datetime import time, date
+from itertools import islice
+from time import perf_counter, sleep
+from typing import Any, Callable, List, Dict, Optional, Iterable, Tuple, NamedTuple
+
+from sqlalchemy import create_engine, make_url, select, delete, insert, update, or_, literal, func, text, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from models.base import Base
 from utils.logger import logger
+from utils.single_flight import SingleFlight
+from utils.cache import LRUCache, MISSING, rendered_messages, group_keyboards
+from utils.metrics import instrument_engine
+from utils.pool_metrics import PoolMetrics
 import logging
-from config import DATABASE_URL
+from config import (DATABASE_URL, ASYNC_DATABASE_URL, USER_GROUP_CACHE_SIZE, DB_POOL_SIZE, DB_MAX_OVERFLOW,
+                    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT, RETENTION_BATCH_SIZE)
+from models.fingerprint import ScheduleFingerprint
 from models.group import Group
 from models.lesson import Lesson, LessonTime, LessonGroup
 from models.subject import Subject
+from models.timetable import GroupTimetable
 from models.user import User
 
 logger_database = logging.getLogger("database")
 
 
+NO_LESSON_TIME = ("--:--", "--:--")
+
+
+class QueryFailed(Exception):
+    """A read failed and was rolled back by atomic(), which logged the error. Raised where an empty result would
+    be taken, and cached, as "nothing found"."""
+
+
+class LessonRecord(NamedTuple):
+    lesson_number: Optional[int]
+    lesson_type: Optional[str]
+    lesson_start_time: str
+    lesson_end_time: str
+    subject_name: str
+
+
+def format_time(value: time) -> str:
+    return f"{value.hour:02d}:{value.minute:02d}"
+
+
+def insert_timetable_rows(*criteria):
+    # the normalized join that group_timetable is a copy of
+    return insert(GroupTimetable).from_select(
+        ["group_id", "lesson_id", "lesson_date", "lesson_number", "lesson_type", "subject_name",
+         "start_time", "end_time"],
+        select(LessonGroup.group_id, Lesson.id, Lesson.lesson_date, Lesson.lesson_number, Lesson.lesson_type,
+               Subject.name, LessonTime.start_time, LessonTime.end_time)
+        .join(LessonGroup, LessonGroup.lesson_id == Lesson.id)
+        .join(Subject, Subject.id == Lesson.subject_id)
+        .outerjoin(LessonTime, LessonTime.lesson_number == Lesson.lesson_number)
+        .where(*criteria)
+    )
+
+
+def refresh_timetable_statements(group_ids: Iterable[int]) -> tuple:
+    group_ids = list(group_ids)
+    return (
+        delete(GroupTimetable).where(GroupTimetable.group_id.in_(group_ids)),
+        insert_timetable_rows(LessonGroup.group_id.in_(group_ids)),
+    )
+
+
+def select_group_lessons(group_id: int, start_period: date, end_period: date):
+    return (
+        select(GroupTimetable.lesson_date, GroupTimetable.lesson_number, GroupTimetable.lesson_type,
+               GroupTimetable.subject_name, GroupTimetable.start_time, GroupTimetable.end_time)
+        .where(
+            GroupTimetable.group_id == group_id,
+            GroupTimetable.lesson_date >= start_period,
+            GroupTimetable.lesson_date <= end_period,
+        )
+        .order_by(GroupTimetable.lesson_date.asc(), GroupTimetable.lesson_number.asc())
+    )
+
+
+def make_lesson_records(rows) -> Dict[date, List[LessonRecord]]:
+    lessons_by_date = defaultdict(list)
+    for lesson_date, lesson_number, lesson_type, subject_name, start_time, end_time in rows:
+        if start_time is None or end_time is None:
+            start_time, end_time = NO_LESSON_TIME
+        else:
+            start_time, end_time = format_time(start_time), format_time(end_time)
+        lessons_by_date[lesson_date].append(
+            LessonRecord(lesson_number, lesson_type, start_time, end_time, subject_name)
+        )
+    return dict(lessons_by_date)
+
+
+def select_expired_lesson_ids(before: date, batch_size: int):
+    # a range of ix_lessons_lesson_date_lesson_number, which includes the id
+    return select(Lesson.id).where(Lesson.lesson_date < before).limit(batch_size)
+
+
+def select_archived_lessons(lesson_ids: List[int]):
+    return (
+        select(Lesson.id, Lesson.lesson_date, Lesson.lesson_number, Lesson.lesson_type, Lesson.auditorium,
+               Subject.name, Group.name)
+        .join(Subject, Subject.id == Lesson.subject_id)
+        .outerjoin(LessonGroup, LessonGroup.lesson_id == Lesson.id)
+        .outerjoin(Group, Group.id == LessonGroup.group_id)
+        .where(Lesson.id.in_(lesson_ids))
+        .order_by(Lesson.id, Group.name)
+    )
+
+
+ARCHIVE_COLUMNS = ("lesson_id", "lesson_date", "lesson_number", "lesson_type", "auditorium", "subject", "groups")
+
+
+def make_archive_rows(rows) -> List[Dict[str, Any]]:
+    """One self-contained row per lesson, the subject and group names survive the deletion of their rows."""
+    lessons = {}
+    for lesson_id, lesson_date, lesson_number, lesson_type, auditorium, subject_name, group_name in rows:
+        lesson = lessons.get(lesson_id)
+        if lesson is None:
+            lesson = lessons[lesson_id] = {
+                "lesson_id": lesson_id, "lesson_date": lesson_date, "lesson_number": lesson_number,
+                "lesson_type": lesson_type, "auditorium": auditorium, "subject": subject_name, "groups": [],
+            }
+        if group_name is not None:
+            lesson["groups"].append(group_name)
+    return list(lessons.values())
+
+
+def delete_lessons_statements(lesson_ids: List[int]) -> tuple:
+    # postgres would cascade to group_lesson and group_timetable, sqlite does not enforce foreign keys,
+    # explicit deletes keep both in step and use the lesson_id indexes
+    return (
+        delete(GroupTimetable).where(GroupTimetable.lesson_id.in_(lesson_ids)),
+        delete(LessonGroup).where(LessonGroup.lesson_id.in_(lesson_ids)),
+        delete(Lesson).where(Lesson.id.in_(lesson_ids)),
+    )
+
+
+def delete_orphan_subjects_statement(batch_size: int):
+    orphan_ids = (
+        select(Subject.id)
+        .where(~select(Lesson.id).where(Lesson.subject_id == Subject.id).exists())
+        .limit(batch_size)
+        .correlate(None)
+    )
+    return delete(Subject).where(Subject.id.in_(orphan_ids))
+
+
+def get_dialect_insert(dialect):
+    # INSERT ... ON CONFLICT is dialect specific, postgres in production and sqlite in tests share the syntax
+    return postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+
+
+def insert_user_if_missing(dialect, **values):
+    return (
+        get_dialect_insert(dialect)(User).values(**values)
+        .on_conflict_do_nothing(index_elements=[User.tg_id])
+        .returning(User.id)
+    )
+
+
+def upsert_user_group(dialect, tg_id: int, group_name: str):
+    # no row is selected for an unknown group, so nothing is written and nothing returned
+    statement = get_dialect_insert(dialect)(User).from_select(
+        [User.tg_id, User.group_id],
+        select(literal(tg_id, Integer), Group.id).where(Group.name == group_name),
+    )
+    return (
+        statement.on_conflict_do_update(index_elements=[User.tg_id], set_={"group_id": statement.excluded.group_id})
+        .returning(User.group_id)
+    )
+
+
+def upsert_users_statement(dialect, users: List[Dict[str, Any]]):
+    # users without a group keep the one they have
+    statement = get_dialect_insert(dialect)(User).values(users)
+    return statement.on_conflict_do_update(
+        index_elements=[User.tg_id],
+        set_={"group_id": func.coalesce(statement.excluded.group_id, User.group_id)},
+    )
+
+
+def resolve_user_groups(users: Iterable[Tuple[int, Optional[str]]],
+                        group_ids: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Last entry wins for repeated tg_ids, unknown group names count as no group."""
+    resolved = {tg_id: group_ids.get(group_name) for tg_id, group_name in users}
+    return [{"tg_id": tg_id, "group_id": group_id} for tg_id, group_id in resolved.items()]
+
+
+def get_engine_options(database_url: str, **overrides) -> Dict[str, Any]:
+    """create_engine arguments from the DB_POOL_* settings, overrides win."""
+    url = make_url(database_url)
+    options: Dict[str, Any] = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # in-memory sqlite keeps one connection, its pool takes no sizing
+    if url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:"):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+
+    if url.get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT > 0:
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+
+    options.update(overrides)
+    return options
+
+
+def get_pool_capacity(options: Dict[str, Any]) -> Optional[int]:
+    # max_overflow -1 lets the pool grow without a limit
+    if "pool_size" not in options or options.get("max_overflow", 0) < 0:
+        return None
+    return options["pool_size"] + options.get("max_overflow", 0)
+
+
 class DBManager:
-    def __init__(self, database_url: str) -> None:
-        self.engine = create_engine(database_url)
+    def __init__(self, database_url: str, **engine_options) -> None:
+        options = get_engine_options(database_url, **engine_options)
+        self.engine = create_engine(database_url, **options)
+        self.pool_metrics = PoolMetrics(self.engine, get_pool_capacity(options))
+        instrument_engine(self.engine, "sync")
         self.session = sessionmaker(bind=self.engine)
         Base.metadata.create_all(self.engine)
 
+    def get_pool_stats(self) -> Dict[str, Any]:
+        return self.pool_metrics.get_stats()
+
     @contextmanager
     def atomic(self):
         session = self.session()
         try:
             yield session
             session.commit()
+            session.info["committed"] = True
 
         except IntegrityError as e:
             session.rollback()
@@ -56,11 +263,20 @@ class DBManager:
         logger_database.info(f"entity for model {model.__name__} with: {kwargs} created.")
         return entity_id
 
-    def create_user(self, **kwargs) -> Base:
-        return self.create_entity(User, **kwargs)
+    def create_user(self, **kwargs) -> Optional[int]:
+        """Id of the new user, None if a user with this tg_id already exists."""
+        user_id = None
+        with self.atomic() as session:
+            user_id = session.scalar(insert_user_if_missing(self.engine.dialect, **kwargs))
+
+        if user_id is not None:
+            logger_database.info(f"User {kwargs['tg_id']} created.")
+        return user_id
 
     def create_group(self, **kwargs) -> Base:
-        return self.create_entity(Group, **kwargs)
+        group_id = self.create_entity(Group, **kwargs)
+        group_keyboards.clear()
+        return group_id
 
     def create_lesson(self, **kwargs) -> Base:
         return self.create_entity(Lesson, **kwargs)
@@ -69,11 +285,21 @@ class DBManager:
         return self.create_entity(Subject, **kwargs)
 
     def create_lesson_time(self, **kwargs) -> Base:
-        return self.create_entity(LessonTime, **kwargs)
+        lesson_time_id = self.create_entity(LessonTime, **kwargs)
+        if lesson_time_id is not None:
+            with self.atomic() as session:
+                session.execute(
+                    update(GroupTimetable)
+                    .where(GroupTimetable.lesson_number == kwargs["lesson_number"])
+                    .values(start_time=kwargs["start_time"], end_time=kwargs["end_time"])
+                )
+            rendered_messages.clear()
+        return lesson_time_id
 
     def create_lesson_and_add_groups(self, group_names: list, lesson_date: date, lesson_number: int, subject_name: str,
                                      lesson_type: str, auditorium: str = None):
         lesson_groups = None
+        group_ids = []
         with self.atomic() as session:
             subject = session.query(Subject).filter(Subject.name == subject_name).first()
             subject_id = None
@@ -101,129 +327,644 @@ class DBManager:
             ]
 
             session.add_all(lesson_groups)
+            session.flush()
+            session.execute(insert_timetable_rows(Lesson.id == lesson_id))
 
+        rendered_messages.invalidate_groups(group_ids)
         # logger_database.info(f"Lesson for groups: {group_ids} attached to lesson {lesson.id}.")
         return lesson_groups
 
-    # Read
-    def get_groups(self) -> Optional[List[type[Group]]]:
-        return self.session().query(Group).all()
-
-    def get_user_lessons_on_date(self, tg_id: int, searching_date: date):
+    @staticmethod
+    def get_or_create_ids(session, model, names: Iterable[str]) -> Dict[str, int]:
+        names = set(names)
+        ids = dict(session.execute(select(model.name, model.id).where(model.name.in_(names))).all())
+
+        missing = [name for name in names if name not in ids]
+        if missing:
+            if model is Group:
+                group_keyboards.clear()
+            session.execute(insert(model), [{"name": name} for name in missing])
+            ids.update(session.execute(select(model.name, model.id).where(model.name.in_(missing))).all())
+
+        return ids
+
+    @staticmethod
+    def insert_lessons(session, group_ids: Dict[str, int], subject_ids: Dict[str, int],
+                       lessons: List[Dict[str, Any]]) -> int:
+        lesson_ids = session.scalars(
+            insert(Lesson).returning(Lesson.id, sort_by_parameter_order=True),
+            [
+                {
+                    "subject_id": subject_ids[lesson["lesson_info"]],
+                    "lesson_type": None,
+                    "auditorium": None,
+                    "lesson_number": lesson["lesson_number"],
+                    "lesson_date": lesson["lesson_date"],
+                }
+                for lesson in lessons
+            ]
+        ).all()
+
+        lesson_groups = [
+            {"lesson_id": lesson_id, "group_id": group_ids[group_name]}
+            for lesson_id, lesson in zip(lesson_ids, lessons)
+            for group_name in dict.fromkeys(lesson["groups"])
+            if group_name in group_ids
+        ]
+        if lesson_groups:
+            session.execute(insert(LessonGroup), lesson_groups)
+
+        return len(lesson_ids) + len(lesson_groups)
+
+    def insert_lesson_chunks(self, session, group_ids: Dict[str, int], subject_ids: Dict[str, int],
+                             lessons: Iterable[Dict[str, Any]], chunk_size: int = 1000) -> int:
+        """insert_lessons chunk_size lessons at a time, subjects missing from subject_ids are created and added
+        to it chunk by chunk. Returns the number of lesson and group_lesson rows."""
+        inserted_rows = 0
+        lessons = iter(lessons)
+        while chunk := list(islice(lessons, chunk_size)):
+            new_subjects = {lesson["lesson_info"] for lesson in chunk} - subject_ids.keys()
+            if new_subjects:
+                subject_ids.update(self.get_or_create_ids(session, Subject, new_subjects))
+
+            inserted_rows += self.insert_lessons(session, group_ids, subject_ids, chunk)
+        return inserted_rows
+
+    @staticmethod
+    def refresh_timetable(session, group_ids: Iterable[int]) -> None:
+        """Rebuild the group_timetable rows of group_ids from the normalized tables."""
+        group_ids = list(group_ids)
+        if group_ids:
+            for statement in refresh_timetable_statements(group_ids):
+                session.execute(statement)
+
+    def bulk_create_lessons(self, group_names: Iterable[str], lessons: Iterable[Dict[str, Any]],
+                            chunk_size: int = 1000) -> int:
+        """Import a parsed workbook in one transaction: groups and subjects are resolved through
+        in-memory name -> id maps, lessons and group_lesson rows are inserted with executemany.
+        Lessons may be a generator, it is consumed in chunks of chunk_size."""
+        started = perf_counter()
+        inserted_rows = 0
         with self.atomic() as session:
-            user = session.scalar(select(User).where(User.tg_id == tg_id))
-            if not user:
-                logger_database.info(f"User with tg_id {tg_id} not found.")
-                return None
-
-            stmt = (
-                select(Lesson)
-                .join(LessonGroup)
-                .where(
-                    and_(
-                        LessonGroup.group_id == user.group_id,
-                        Lesson.lesson_date == searching_date,
-                    )
-                )
-                .order_by(Lesson.lesson_date.asc(), Lesson.lesson_number.asc())
+            group_ids = self.get_or_create_ids(session, Group, group_names)
+            inserted_rows = self.insert_lesson_chunks(session, group_ids, {}, lessons, chunk_size)
+            self.refresh_timetable(session, group_ids.values())
+
+        rendered_messages.invalidate_groups(group_ids.values())
+
+        elapsed = perf_counter() - started
+        logger_database.info(f"Imported {inserted_rows} rows in {elapsed:.2f}s "
+                             f"({inserted_rows / elapsed if elapsed else 0:.0f} rows/s).")
+        return inserted_rows
+
+    def sync_lessons(self, session, group_names: Iterable[str], lessons_by_date: Dict[date, List[Dict[str, Any]]],
+                     changed_group_ids: Optional[set] = None) -> Tuple[int, int, int]:
+        """Make the lessons of group_names on the given dates match the parsed ones.
+        Returns the number of inserted, updated and deleted lessons, the ids of the groups
+        are added to changed_group_ids if anything changed."""
+        group_ids = self.get_or_create_ids(session, Group, group_names)
+        group_names_by_id = {group_id: group_name for group_name, group_id in group_ids.items()}
+
+        existing = {}
+        rows = session.execute(
+            select(Lesson.id, Lesson.lesson_date, Lesson.lesson_number, Subject.name, LessonGroup.group_id)
+            .join(Subject, Subject.id == Lesson.subject_id)
+            .join(LessonGroup, LessonGroup.lesson_id == Lesson.id)
+            .where(Lesson.lesson_date.in_(list(lessons_by_date)), LessonGroup.group_id.in_(group_ids.values()))
+        )
+        for lesson_id, lesson_date, lesson_number, subject_name, group_id in rows:
+            lesson = existing.setdefault(lesson_id, (lesson_date, lesson_number, subject_name, set()))
+            lesson[3].add(group_names_by_id[group_id])
+
+        existing_ids = defaultdict(list)
+        for lesson_id, (lesson_date, lesson_number, subject_name, groups) in existing.items():
+            existing_ids[(lesson_date, lesson_number, frozenset(groups), subject_name)].append(lesson_id)
+
+        parsed = defaultdict(list)
+        for lesson_date, lessons in lessons_by_date.items():
+            for lesson in lessons:
+                groups = frozenset(group for group in lesson["groups"] if group in group_ids)
+                if groups:
+                    parsed[(lesson_date, lesson["lesson_number"], groups, lesson["lesson_info"])].append(lesson)
+
+        deleted_ids = defaultdict(list)
+        for key, lesson_ids in existing_ids.items():
+            for lesson_id in lesson_ids[len(parsed.get(key, ())):]:
+                deleted_ids[key[:3]].append(lesson_id)
+
+        inserted = []
+        updated = []
+        for key, lessons in parsed.items():
+            for lesson in lessons[len(existing_ids.get(key, ())):]:
+                free_ids = deleted_ids.get(key[:3])
+                if free_ids:
+                    updated.append((free_ids.pop(), lesson))
+                else:
+                    inserted.append(lesson)
+
+        subject_ids = self.get_or_create_ids(session, Subject, (lesson["lesson_info"] for _, lesson in updated))
+        if updated:
+            session.execute(update(Lesson), [
+                {"id": lesson_id, "subject_id": subject_ids[lesson["lesson_info"]]} for lesson_id, lesson in updated
+            ])
+
+        stale_ids = [lesson_id for lesson_ids in deleted_ids.values() for lesson_id in lesson_ids]
+        if stale_ids:
+            session.execute(delete(LessonGroup).where(LessonGroup.lesson_id.in_(stale_ids)))
+            session.execute(delete(Lesson).where(Lesson.id.in_(stale_ids)))
+
+        if inserted:
+            self.insert_lesson_chunks(session, group_ids, subject_ids, inserted)
+
+        if changed_group_ids is not None and (inserted or updated or stale_ids):
+            changed_group_ids.update(group_ids.values())
+
+        return len(inserted), len(updated), len(stale_ids)
+
+    def get_fingerprints(self, source: str) -> Dict[str, str]:
+        with self.atomic() as session:
+            return dict(session.execute(
+                select(ScheduleFingerprint.key, ScheduleFingerprint.digest)
+                .where(or_(ScheduleFingerprint.key == source, ScheduleFingerprint.key.startswith(f"{source}|", autoescape=True)))
+            ).all())
+
+    def apply_schedule_changes(self, source: str, fingerprints: Dict[str, str],
+                               sheets: List[Tuple[List[str], Dict[date, List[Dict[str, Any]]]]]
+                               ) -> Optional[Tuple[int, int, int]]:
+        """Sync the changed day blocks of every sheet and replace the stored fingerprints of source,
+        in one transaction so fingerprints never get ahead of the lessons they describe.
+        Returns None if the transaction was rolled back."""
+        started = perf_counter()
+        changes = [0, 0, 0]
+        changed_group_ids = set()
+        with self.atomic() as session:
+            for group_names, lessons_by_date in sheets:
+                sheet_changes = self.sync_lessons(session, group_names, lessons_by_date, changed_group_ids)
+                for index, count in enumerate(sheet_changes):
+                    changes[index] += count
+
+            session.execute(
+                delete(ScheduleFingerprint)
+                .where(or_(ScheduleFingerprint.key == source, ScheduleFingerprint.key.startswith(f"{source}|", autoescape=True)))
             )
+            session.execute(insert(ScheduleFingerprint), [
+                {"key": key, "digest": digest} for key, digest in fingerprints.items()
+            ])
+            self.refresh_timetable(session, changed_group_ids)
+        if not session.info.get("committed"):
+            return None
 
-            lesson_groups = session.scalars(stmt).all()
-            if not lesson_groups:
-                logger_database.info(f"No lessons found for user {tg_id} for {searching_date}")
-                return None
+        rendered_messages.invalidate_groups(changed_group_ids)
 
-            lessons_by_date = [
-                {
-                    "lesson_number": lesson.lesson_number,
-                    "lesson_type": lesson.lesson_type,
-                    "lesson_start_time": f"{lesson.lesson_time.start_time.hour:02d}:{lesson.lesson_time.start_time.minute:02d}",
-                    "lesson_end_time": f"{lesson.lesson_time.end_time.hour:02d}:{lesson.lesson_time.end_time.minute:02d}",
-                    "subject_name": lesson.subject.name,
-                }
-                for lesson in lesson_groups
-            ]
+        inserted, updated, deleted = changes
+        elapsed = perf_counter() - started
+        logger_database.info(f"{source}: {inserted} lessons inserted, {updated} updated, {deleted} deleted "
+                             f"in {elapsed:.2f}s ({sum(changes) / elapsed if elapsed else 0:.0f} lessons/s).")
+        return inserted, updated, deleted
+
+    # Read
+    def get_groups(self) -> Optional[List[type[Group]]]:
+        # closing the session detaches the groups without expiring them
+        with self.session() as session:
+            return session.scalars(select(Group)).all()
 
-            # logger_database.info(
-            #     f"Found {len(lessons_by_date)} lessons for user {tg_id} from {start_period} to {end_period}.")
-            return lessons_by_date
+    def get_user_lessons_on_date(self, tg_id: int, searching_date: date) -> Optional[List[LessonRecord]]:
+        lessons_by_date = self.get_user_lessons_on_period(tg_id, searching_date, searching_date)
+        if not lessons_by_date:
+            return None
+
+        return lessons_by_date[searching_date]
 
     def get_user_lessons_on_period(
             self, tg_id: int, start_period: date, end_period: date
-    ) -> Optional[List[Dict[str, any]]]:
+    ) -> Optional[Dict[date, List[LessonRecord]]]:
         with self.atomic() as session:
-            user = session.scalar(select(User).where(User.tg_id == tg_id))
+            user = session.execute(select(User.group_id).where(User.tg_id == tg_id)).first()
             if not user:
                 logger_database.info(f"User with tg_id {tg_id} not found.")
                 return None
 
-            stmt = (
-                select(Lesson)
-                .join(LessonGroup)
-                .where(
-                    and_(
-                        LessonGroup.group_id == user.group_id,
-                        and_(
-                            Lesson.lesson_date >= start_period,
-                            Lesson.lesson_date <= end_period
-                        )
-                    )
-                )
-                .order_by(Lesson.lesson_date.asc(), Lesson.lesson_number.asc())
-            )
-
-            lesson_groups = session.scalars(stmt).all()
-            if not lesson_groups:
+            rows = session.execute(select_group_lessons(user.group_id, start_period, end_period)).all()
+            if not rows:
                 logger_database.info(f"No lessons found for user {tg_id} from {start_period} to {end_period}.")
                 return None
 
-            lessons_by_date = defaultdict(list)
-            for lesson in lesson_groups:
-                date_key = lesson.lesson_date
-                lesson_info = {
-                    "lesson_number": lesson.lesson_number,
-                    "lesson_type": lesson.lesson_type,
-                    "lesson_start_time": f"{lesson.lesson_time.start_time.hour:02d}:{lesson.lesson_time.start_time.minute:02d}",
-                    "lesson_end_time": f"{lesson.lesson_time.end_time.hour:02d}:{lesson.lesson_time.end_time.minute:02d}",
-                    "subject_name": lesson.subject.name,
-                }
-                lessons_by_date[date_key].append(lesson_info)
+            return make_lesson_records(rows)
 
-            lessons_by_date = dict(lessons_by_date)
+    # Update
+    def attach_user_to_group(self, tg_id: int, group_name: str) -> Optional[int]:
+        """Creates the user if needed, returns the group id or None if the group does not exist."""
+        group_id = None
+        with self.atomic() as session:
+            group_id = session.scalar(upsert_user_group(self.engine.dialect, tg_id, group_name))
 
-            # logger_database.info(
-            #     f"Found {len(lessons_by_date)} lessons for user {tg_id} from {start_period} to {end_period}.")
-            return lessons_by_date
+        if group_id is None:
+            logger_database.info(f"Group {group_name} not found.")
+            return None
 
-    # Update
-    def attach_user_to_group(self, tg_id: int, group_name: str) -> None:
+        logger_database.info(f"User {tg_id} attached to group.")
+        return group_id
+
+    def upsert_users(self, users: Iterable[Tuple[int, Optional[str]]], chunk_size: int = 1000) -> int:
+        """Register (tg_id, group name or None) pairs in one transaction, one statement per chunk_size users.
+        Existing users are moved to the given group, returns the number of users written."""
+        users = list(users)
+        written = 0
         with self.atomic() as session:
-            user = session.scalar(select(User).where(User.tg_id == tg_id))
-            group = session.scalar(select(Group).where(Group.name == group_name))
+            group_names = {group_name for _, group_name in users if group_name is not None}
+            group_ids = dict(session.execute(
+                select(Group.name, Group.id).where(Group.name.in_(group_names))
+            ).all()) if group_names else {}
 
-            if not user:
-                self.create_entity(User, tg_id=tg_id)
+            rows = resolve_user_groups(users, group_ids)
+            for start in range(0, len(rows), chunk_size):
+                session.execute(upsert_users_statement(self.engine.dialect, rows[start:start + chunk_size]))
+            written = len(rows)
 
-            if not group:
-                logger_database.info(f"Group {group_name} not found.")
-                return None
+        logger_database.info(f"{written} users registered.")
+        return written
 
-            user.group_id = group.id
+    # Delete
+    def delete_lessons_before_date(self, date: date, batch_size: int = RETENTION_BATCH_SIZE,
+                                   archive: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                                   pause: float = 0.0) -> int:
+        """Delete the lessons before date batch_size at a time, every batch in its own short transaction so
+        row locks are released quickly and vacuum can reuse the space while the job runs. archive gets the rows
+        of every batch (make_archive_rows) before the batch is committed, a failing batch stops the job."""
+        deleted_count = 0
+        while True:
+            with self.atomic() as session:
+                lesson_ids = session.scalars(select_expired_lesson_ids(date, batch_size)).all()
+                if lesson_ids:
+                    if archive is not None:
+                        archive(make_archive_rows(session.execute(select_archived_lessons(lesson_ids))))
+                    for statement in delete_lessons_statements(lesson_ids):
+                        session.execute(statement)
+            if not session.info.get("committed"):
+                break
+
+            deleted_count += len(lesson_ids)
+            if len(lesson_ids) < batch_size:
+                break
+            if pause > 0:
+                sleep(pause)
+
+        rendered_messages.invalidate_before(date)
+
+        logger_database.info(f"Deleted {deleted_count} lessons before {date}.")
+        return deleted_count
+
+    def delete_orphan_subjects(self, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+        """Delete subjects no lesson refers to any more, batch_size per transaction."""
+        deleted_count = 0
+        while True:
+            with self.atomic() as session:
+                deleted = session.execute(delete_orphan_subjects_statement(batch_size)).rowcount
+            if not session.info.get("committed"):
+                break
+
+            deleted_count += deleted
+            if deleted < batch_size:
+                break
+
+        logger_database.info(f"Deleted {deleted_count} orphaned subjects.")
+        return deleted_count
+
+    def vacuum(self, tables: Iterable[str]) -> None:
+        """VACUUM (ANALYZE) on postgres, which marks the space of deleted rows reusable without blocking reads
+        or writes. Other databases are left alone."""
+        if self.engine.dialect.name != "postgresql":
+            return
+        # VACUUM cannot run inside a transaction block
+        with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            # pooled connections carry DB_STATEMENT_TIMEOUT, which would cancel VACUUM on a real table. SET
+            # lasts for the session, RESET goes back to the value given at connect for the next checkout
+            connection.execute(text("SET statement_timeout = 0"))
+            try:
+                for table in tables:
+                    connection.execute(text(f"VACUUM (ANALYZE) {table}"))
+            finally:
+                connection.execute(text("RESET statement_timeout"))
+
+
+class AsyncDBManager:
+    """Same API as DBManager on top of the asyncio engine, so handlers never block the event loop."""
+
+    def __init__(self, database_url: str, **engine_options) -> None:
+        options = get_engine_options(database_url, **engine_options)
+        self.engine = create_async_engine(database_url, **options)
+        self.pool_metrics = PoolMetrics(self.engine.sync_engine, get_pool_capacity(options))
+        instrument_engine(self.engine.sync_engine, "async")
+        self.session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        # identical (group, date range) lookups issued at the same time share one query
+        self.single_flight = SingleFlight()
+        # tg_id -> group_id, kept in sync by create_user and attach_user_to_group
+        self.user_groups = LRUCache(USER_GROUP_CACHE_SIZE)
+
+    async def create_all(self) -> None:
+        async with self.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        return self.pool_metrics.get_stats()
+
+    @asynccontextmanager
+    async def atomic(self):
+        session = self.session()
+        try:
+            yield session
+            await session.commit()
+            session.info["committed"] = True
+
+        except IntegrityError as e:
+            await session.rollback()
+            logger.error(f"Integrity error: {e}")
+
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Unexpected error: {e}")
+
+        finally:
+            await session.close()
+
+    # Create
+    async def create_entity(self, model, **kwargs) -> Base:
+        entity_id = None
+        async with self.atomic() as session:
+            entity = model(**kwargs)
+            session.add(entity)
+            await session.flush()
+            entity_id = entity.id
+
+        logger_database.info(f"entity for model {model.__name__} with: {kwargs} created.")
+        return entity_id
+
+    async def create_user(self, **kwargs) -> Optional[int]:
+        """Id of the new user, None if a user with this tg_id already exists."""
+        user_id = None
+        async with self.atomic() as session:
+            user_id = await session.scalar(insert_user_if_missing(self.engine.dialect, **kwargs))
+
+        if user_id is not None:
+            self.user_groups.put(kwargs["tg_id"], kwargs.get("group_id"))
+            logger_database.info(f"User {kwargs['tg_id']} created.")
+        return user_id
+
+    async def create_group(self, **kwargs) -> Base:
+        group_id = await self.create_entity(Group, **kwargs)
+        group_keyboards.clear()
+        return group_id
+
+    async def create_lesson(self, **kwargs) -> Base:
+        return await self.create_entity(Lesson, **kwargs)
+
+    async def create_subject(self, **kwargs) -> Base:
+        return await self.create_entity(Subject, **kwargs)
+
+    async def create_lesson_time(self, **kwargs) -> Base:
+        lesson_time_id = await self.create_entity(LessonTime, **kwargs)
+        if lesson_time_id is not None:
+            async with self.atomic() as session:
+                await session.execute(
+                    update(GroupTimetable)
+                    .where(GroupTimetable.lesson_number == kwargs["lesson_number"])
+                    .values(start_time=kwargs["start_time"], end_time=kwargs["end_time"])
+                )
+            rendered_messages.clear()
+        return lesson_time_id
+
+    async def create_lesson_and_add_groups(self, group_names: list, lesson_date: date, lesson_number: int,
+                                           subject_name: str, lesson_type: str, auditorium: str = None):
+        lesson_groups = None
+        group_ids = []
+        async with self.atomic() as session:
+            subject = await session.scalar(select(Subject).where(Subject.name == subject_name))
+            if not subject:
+                subject = Subject(name=subject_name)
+                session.add(subject)
+                await session.flush()
+
+            lesson = Lesson(subject_id=subject.id, lesson_type=lesson_type, auditorium=auditorium,
+                            lesson_number=lesson_number, lesson_date=lesson_date)
+            session.add(lesson)
+            await session.flush()
+
+            logger_database.info(f"Lesson created for subject {subject.id} of type {lesson_type}.")
+
+            group_ids = (await session.scalars(
+                select(Group.id).where(Group.name.in_(group_names))
+            )).all()
+
+            lesson_groups = [
+                LessonGroup(
+                    lesson_id=lesson.id,
+                    group_id=group_id,
+                )
+                for group_id in group_ids
+            ]
+
+            session.add_all(lesson_groups)
+            await session.flush()
+            await session.execute(insert_timetable_rows(Lesson.id == lesson.id))
+
+        rendered_messages.invalidate_groups(group_ids)
+        return lesson_groups
+
+    # Read
+    async def get_groups(self) -> Optional[List[Group]]:
+        async with self.atomic() as session:
+            return (await session.scalars(select(Group))).all()
+
+    async def get_group_names(self) -> List[Tuple[int, str]]:
+        """(id, name) of every group, ordered by name."""
+        rows = []
+        async with self.atomic() as session:
+            rows = (await session.execute(select(Group.id, Group.name).order_by(Group.name))).all()
+        return [tuple(row) for row in rows]
+
+    async def warm_user_groups(self) -> None:
+        async with self.atomic() as session:
+            rows = await session.execute(select(User.tg_id, User.group_id).limit(self.user_groups.maxsize))
+            for tg_id, group_id in rows:
+                self.user_groups.put(tg_id, group_id)
+        logger_database.info(f"User group map warmed with {len(self.user_groups)} users.")
+
+    async def get_user_group_id(self, tg_id: int) -> Optional[int]:
+        group_id = self.user_groups.get(tg_id, MISSING)
+        if group_id is not MISSING:
+            return group_id
+
+        user = None
+        async with self.atomic() as session:
+            user = (await session.execute(select(User.group_id).where(User.tg_id == tg_id))).first()
+
+        group_id = user.group_id if user else None
+        # unknown users are remembered too, create_user and attach_user_to_group overwrite the entry. A failed
+        # query is not, it would stand for "no group" until the entry is evicted
+        if session.info.get("committed"):
+            self.user_groups.put(tg_id, group_id)
+        return group_id
+
+    async def get_reminder_subscribers(self, day: date) -> list:
+        """(group_id, lesson_number, start_time, subject_name, tg_id, reminder_minutes) of every lesson on day
+        with a known start time, once per subscriber of the lesson's group. Raises QueryFailed on errors."""
+        rows = []
+        async with self.atomic() as session:
+            rows = (await session.execute(
+                select(GroupTimetable.group_id, GroupTimetable.lesson_number, GroupTimetable.start_time,
+                       GroupTimetable.subject_name, User.tg_id, User.reminder_minutes)
+                .join(User, User.group_id == GroupTimetable.group_id)
+                .where(
+                    GroupTimetable.lesson_date == day,
+                    GroupTimetable.start_time.is_not(None),
+                    User.reminder_minutes.is_not(None),
+                )
+                .order_by(GroupTimetable.group_id, GroupTimetable.lesson_number)
+            )).all()
+        if not session.info.get("committed"):
+            raise QueryFailed(f"Reminder subscribers of {day}")
+        return rows
+
+    async def query_group_lessons_on_period(
+            self, group_id: int, start_period: date, end_period: date
+    ) -> Optional[Dict[date, List[LessonRecord]]]:
+        rows = []
+        async with self.atomic() as session:
+            rows = (await session.execute(select_group_lessons(group_id, start_period, end_period))).all()
+        if not session.info.get("committed"):
+            raise QueryFailed(f"Lessons of group {group_id} from {start_period} to {end_period}")
+
+        if not rows:
+            logger_database.info(f"No lessons found for group {group_id} from {start_period} to {end_period}.")
+            return None
+
+        return make_lesson_records(rows)
+
+    async def query_group_lessons_on_date(self, group_id: int, searching_date: date) -> Optional[List[LessonRecord]]:
+        lessons_by_date = await self.query_group_lessons_on_period(group_id, searching_date, searching_date)
+        if not lessons_by_date:
+            return None
+
+        return lessons_by_date[searching_date]
+
+    async def get_group_lessons_on_date(self, group_id: int, searching_date: date) -> Optional[List[LessonRecord]]:
+        return await self.single_flight.do(("date", group_id, searching_date),
+                                           self.query_group_lessons_on_date, group_id, searching_date)
+
+    async def get_group_lessons_on_period(
+            self, group_id: int, start_period: date, end_period: date
+    ) -> Optional[Dict[date, List[LessonRecord]]]:
+        return await self.single_flight.do(("period", group_id, start_period, end_period),
+                                           self.query_group_lessons_on_period, group_id, start_period, end_period)
+
+    async def get_user_lessons_on_date(self, tg_id: int, searching_date: date) -> Optional[List[LessonRecord]]:
+        group_id = await self.get_user_group_id(tg_id)
+        if group_id is None:
+            logger_database.info(f"User with tg_id {tg_id} not found or has no group.")
+            return None
+
+        return await self.get_group_lessons_on_date(group_id, searching_date)
+
+    async def get_user_lessons_on_period(
+            self, tg_id: int, start_period: date, end_period: date
+    ) -> Optional[Dict[date, List[LessonRecord]]]:
+        group_id = await self.get_user_group_id(tg_id)
+        if group_id is None:
+            logger_database.info(f"User with tg_id {tg_id} not found or has no group.")
+            return None
+
+        return await self.get_group_lessons_on_period(group_id, start_period, end_period)
+
+    # Update
+    async def attach_user_to_group(self, tg_id: int, group_name: str) -> Optional[int]:
+        """Creates the user if needed, returns the group id or None if the group does not exist."""
+        group_id = None
+        async with self.atomic() as session:
+            group_id = await session.scalar(upsert_user_group(self.engine.dialect, tg_id, group_name))
+
+        if group_id is None:
+            logger_database.info(f"Group {group_name} not found.")
+            return None
+
+        if session.info.get("committed"):
+            self.user_groups.put(tg_id, group_id)
         logger_database.info(f"User {tg_id} attached to group.")
-        return None
+        return group_id
+
+    async def upsert_users(self, users: Iterable[Tuple[int, Optional[str]]], chunk_size: int = 1000) -> int:
+        """Register (tg_id, group name or None) pairs in one transaction, one statement per chunk_size users.
+        Existing users are moved to the given group, returns the number of users written."""
+        users = list(users)
+        rows = []
+        async with self.atomic() as session:
+            group_names = {group_name for _, group_name in users if group_name is not None}
+            group_ids = dict((await session.execute(
+                select(Group.name, Group.id).where(Group.name.in_(group_names))
+            )).all()) if group_names else {}
+
+            rows = resolve_user_groups(users, group_ids)
+            for start in range(0, len(rows), chunk_size):
+                await session.execute(upsert_users_statement(self.engine.dialect, rows[start:start + chunk_size]))
+
+        if not session.info.get("committed"):
+            return 0
+
+        for row in rows:
+            if row["group_id"] is None:
+                # the user may have kept a group, read it again on the next lookup
+                self.user_groups.pop(row["tg_id"])
+            else:
+                self.user_groups.put(row["tg_id"], row["group_id"])
+        logger_database.info(f"{len(rows)} users registered.")
+        return len(rows)
+
+    async def get_user_reminder(self, tg_id: int) -> Optional[int]:
+        """Reminder lead time of the user in minutes, None if reminders are off or the user is unknown."""
+        minutes = None
+        async with self.atomic() as session:
+            minutes = await session.scalar(select(User.reminder_minutes).where(User.tg_id == tg_id))
+        return minutes
+
+    async def set_user_reminder(self, tg_id: int, minutes: Optional[int]) -> bool:
+        """Opt the user in to reminders minutes before each lesson, or out with None.
+        Returns False if the user does not exist."""
+        updated = 0
+        async with self.atomic() as session:
+            result = await session.execute(update(User).where(User.tg_id == tg_id).values(reminder_minutes=minutes))
+            updated = result.rowcount
+
+        logger_database.info(f"User {tg_id} reminder set to {minutes} minutes.")
+        return bool(updated)
 
     # Delete
-    def delete_lessons_before_date(self, date: date) -> int:
+    async def delete_lessons_before_date(self, date: date, batch_size: int = RETENTION_BATCH_SIZE,
+                                         archive: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                                         pause: float = 0.0) -> int:
         deleted_count = 0
-        with self.atomic() as session:
-            deleted_count = (
-                session.query(Lesson)
-                .filter(Lesson.lesson_date < date)
-                .delete(synchronize_session=False)
-            )
+        while True:
+            async with self.atomic() as session:
+                lesson_ids = (await session.scalars(select_expired_lesson_ids(date, batch_size))).all()
+                if lesson_ids:
+                    if archive is not None:
+                        archive(make_archive_rows(await session.execute(select_archived_lessons(lesson_ids))))
+                    for statement in delete_lessons_statements(lesson_ids):
+                        await session.execute(statement)
+            if not session.info.get("committed"):
+                break
+
+            deleted_count += len(lesson_ids)
+            if len(lesson_ids) < batch_size:
+                break
+            await asyncio.sleep(pause)
+
+        rendered_messages.invalidate_before(date)
 
         logger_database.info(f"Deleted {deleted_count} lessons before {date}.")
         return deleted_count
 
 
 database_manager = DBManager(database_url=DATABASE_URL)
+async_database_manager = AsyncDBManager(database_url=ASYNC_DATABASE_URL)
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import date, time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ASYNC_DATABASE_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import event, select, func, text
+
+from db import AsyncDBManager, DBManager, QueryFailed
+from models.lesson import LessonTime, Lesson, LessonGroup
+from models.subject import Subject
+from models.timetable import GroupTimetable
+from utils.cache import MessageCache
+from utils.single_flight import SingleFlight
+
+
+class TestAsyncDBManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = AsyncDBManager(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}")
+        await self.manager.create_all()
+        async with self.manager.atomic() as session:
+            session.add_all([
+                LessonTime(lesson_number=1, start_time=time(9, 0), end_time=time(10, 30)),
+                LessonTime(lesson_number=2, start_time=time(10, 40), end_time=time(12, 10)),
+            ])
+        await self.manager.create_group(name="Group A")
+        await self.manager.create_group(name="Group B")
+        await self.manager.create_lesson_and_add_groups(["Group A"], date(2025, 3, 3), 2, "Physics", None)
+        await self.manager.create_lesson_and_add_groups(["Group A", "Group B"], date(2025, 3, 3), 1, "Math", None)
+        await self.manager.create_lesson_and_add_groups(["Group A"], date(2025, 3, 5), 1, "Math", None)
+
+    async def asyncTearDown(self):
+        await self.manager.dispose()
+        self.directory.cleanup()
+
+    async def test_get_groups(self):
+        groups = await self.manager.get_groups()
+        self.assertEqual(["Group A", "Group B"], sorted(group.name for group in groups))
+
+    async def test_unknown_user_has_no_lessons(self):
+        self.assertIsNone(await self.manager.get_user_lessons_on_date(1, date(2025, 3, 3)))
+
+    async def test_get_user_lessons_on_date(self):
+        await self.manager.attach_user_to_group(1, "Group A")
+        lessons = await self.manager.get_user_lessons_on_date(1, date(2025, 3, 3))
+        self.assertEqual(["Math", "Physics"], [lesson.subject_name for lesson in lessons])
+        self.assertEqual("09:00", lessons[0].lesson_start_time)
+        self.assertEqual("12:10", lessons[1].lesson_end_time)
+
+    async def test_get_user_lessons_on_period(self):
+        await self.manager.create_user(tg_id=2)
+        await self.manager.attach_user_to_group(2, "Group B")
+        lessons = await self.manager.get_user_lessons_on_period(2, date(2025, 3, 1), date(2025, 3, 7))
+        self.assertEqual([date(2025, 3, 3)], list(lessons))
+        self.assertEqual("Math", lessons[date(2025, 3, 3)][0].subject_name)
+
+    async def test_concurrent_identical_reads_are_coalesced(self):
+        await self.manager.attach_user_to_group(1, "Group A")
+        statements = []
+        event.listen(self.manager.engine.sync_engine, "before_cursor_execute",
+                     lambda connection, cursor, statement, *args: statements.append(statement))
+        results = await asyncio.gather(*(
+            self.manager.get_user_lessons_on_date(1, date(2025, 3, 3)) for _ in range(20)
+        ))
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(1, len(statements))
+        self.assertEqual({"calls": 20, "coalesced": 19, "in_flight": 0}, self.manager.single_flight.get_stats())
+
+    async def test_lesson_read_is_one_query(self):
+        await self.manager.attach_user_to_group(1, "Group A")
+        await self.manager.get_user_lessons_on_date(1, date(2025, 3, 5))
+
+        statements = []
+        event.listen(self.manager.engine.sync_engine, "before_cursor_execute",
+                     lambda connection, cursor, statement, *args: statements.append(statement))
+        lessons = await self.manager.get_user_lessons_on_period(1, date(2025, 3, 1), date(2025, 3, 14))
+        self.assertEqual(3, sum(len(day_lessons) for day_lessons in lessons.values()))
+        self.assertEqual(1, len(statements))
+
+    async def test_user_group_map(self):
+        await self.manager.create_user(tg_id=3)
+        self.assertIsNone(await self.manager.get_user_group_id(3))
+        await self.manager.attach_user_to_group(3, "Group B")
+        self.assertEqual(2, await self.manager.get_user_group_id(3))
+        self.assertEqual(2, self.manager.user_groups.hits)
+        self.assertEqual(0, self.manager.user_groups.misses)
+
+        self.manager.user_groups.clear()
+        await self.manager.warm_user_groups()
+        self.assertEqual(2, await self.manager.get_user_group_id(3))
+
+    async def test_user_registration_is_one_statement(self):
+        statements = []
+        event.listen(self.manager.engine.sync_engine, "before_cursor_execute",
+                     lambda connection, cursor, statement, *args: statements.append(statement))
+        self.assertIsNotNone(await self.manager.create_user(tg_id=4))
+        self.assertIsNone(await self.manager.create_user(tg_id=4))
+        self.assertEqual(2, await self.manager.attach_user_to_group(5, "Group B"))
+        self.assertEqual(1, await self.manager.attach_user_to_group(5, "Group A"))
+        self.assertIsNone(await self.manager.attach_user_to_group(5, "Group C"))
+        self.assertEqual(5, len(statements))
+
+        self.manager.user_groups.clear()
+        self.assertIsNone(await self.manager.get_user_group_id(4))
+        self.assertEqual(1, await self.manager.get_user_group_id(5))
+
+    async def test_upsert_users(self):
+        await self.manager.attach_user_to_group(6, "Group A")
+        users = [(6, None), (7, "Group B"), (8, "Group C"), (9, "Group A"), (9, "Group B")]
+        self.assertEqual(4, await self.manager.upsert_users(users, chunk_size=2))
+
+        self.manager.user_groups.clear()
+        self.assertEqual([1, 2, None, 2], [await self.manager.get_user_group_id(tg_id) for tg_id in (6, 7, 8, 9)])
+
+    async def test_delete_lessons_before_date(self):
+        self.assertEqual(2, await self.manager.delete_lessons_before_date(date(2025, 3, 4)))
+
+    async def test_failed_user_group_query_is_not_cached(self):
+        await self.manager.attach_user_to_group(10, "Group A")
+        self.manager.user_groups.clear()
+        async with self.manager.engine.begin() as connection:
+            await connection.execute(text("ALTER TABLE users RENAME TO users_moved"))
+        self.assertIsNone(await self.manager.get_user_group_id(10))
+
+        async with self.manager.engine.begin() as connection:
+            await connection.execute(text("ALTER TABLE users_moved RENAME TO users"))
+        self.assertEqual(1, await self.manager.get_user_group_id(10))
+
+    async def test_failed_lesson_query_is_not_empty_result(self):
+        async with self.manager.engine.begin() as connection:
+            await connection.execute(text("DROP TABLE group_timetable"))
+        with self.assertRaises(QueryFailed):
+            await self.manager.get_group_lessons_on_period(1, date(2025, 3, 1), date(2025, 3, 7))
+
+
+class TestPoolUnderLoad(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = AsyncDBManager(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}",
+                                      pool_size=4, max_overflow=0, pool_timeout=10)
+        await self.manager.create_all()
+        await self.manager.create_group(name="Group A")
+        for day in range(1, 29):
+            await self.manager.create_lesson_and_add_groups(["Group A"], date(2025, 2, day), 1, "Math", None)
+
+    async def asyncTearDown(self):
+        await self.manager.dispose()
+        self.directory.cleanup()
+
+    async def test_sustained_concurrent_load_does_not_exhaust_the_pool(self):
+        async def handle(request: int) -> int:
+            # what /set_group followed by /today costs without the message cache
+            tg_id = 1000 + request % 50
+            if request % 10 == 0:
+                await self.manager.attach_user_to_group(tg_id, "Group A")
+            self.manager.user_groups.pop(tg_id)
+            await self.manager.get_user_group_id(tg_id)
+            return len(await self.manager.get_group_lessons_on_date(1, date(2025, 2, request % 28 + 1)))
+
+        for _ in range(3):
+            results = await asyncio.gather(*(handle(request) for request in range(100)))
+            self.assertEqual([1] * 100, results)
+
+        stats = self.manager.get_pool_stats()
+        self.assertEqual(0, stats["timeouts"])
+        self.assertEqual(0, stats["checked_out"])
+        self.assertLessEqual(stats["peak_checked_out"], 4)
+        # requests queue for the 4 connections, which are reused instead of being opened per request
+        self.assertLessEqual(stats["connects"], 4)
+        self.assertEqual(0, stats["closes"])
+        self.assertGreaterEqual(stats["checkouts"], 300)
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    async def test_same_key_shares_one_call(self):
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+        executed = []
+
+        async def query(key):
+            executed.append(key)
+            await release.wait()
+            return [key]
+
+        waiting = [asyncio.ensure_future(single_flight.do(key, query, key)) for key in (1, 1, 1, 2)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiting)
+
+        self.assertEqual([[1], [1], [1], [2]], results)
+        self.assertEqual([1, 2], executed)
+        self.assertEqual({"calls": 4, "coalesced": 2, "in_flight": 0}, single_flight.get_stats())
+
+    async def test_cancelled_caller_does_not_cancel_others(self):
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def query():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(single_flight.do("key", query))
+        second = asyncio.ensure_future(single_flight.do("key", query))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        self.assertEqual("done", await second)
+
+
+class TestMessageCache(unittest.TestCase):
+    def test_least_recently_used_is_evicted(self):
+        cache = MessageCache(2)
+        cache.put((1, date(2025, 3, 3), "today"), "a")
+        cache.put((2, date(2025, 3, 3), "today"), "b")
+        cache.get((1, date(2025, 3, 3), "today"))
+        cache.put((3, date(2025, 3, 3), "today"), "c")
+        self.assertNotIn((2, date(2025, 3, 3), "today"), cache)
+        self.assertEqual({"size": 2, "maxsize": 2, "hits": 1, "misses": 0, "evictions": 1}, cache.get_stats())
+
+    def test_invalidation(self):
+        cache = MessageCache(10)
+        cache.put((1, date(2025, 3, 3), "today"), "a")
+        cache.put((1, date(2025, 3, 5), "week"), "b")
+        cache.put((2, date(2025, 3, 3), "today"), "c")
+        cache.invalidate_groups([2])
+        self.assertNotIn((2, date(2025, 3, 3), "today"), cache)
+        cache.invalidate_before(date(2025, 3, 4))
+        self.assertEqual(1, len(cache))
+        self.assertEqual("b", cache.get((1, date(2025, 3, 5), "week")))
+
+
+class TestBulkCreateLessons(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = DBManager(f"sqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}")
+        self.manager.create_group(name="Group A")
+
+    def tearDown(self):
+        self.manager.engine.dispose()
+        self.directory.cleanup()
+
+    def count(self, model) -> int:
+        with self.manager.atomic() as session:
+            return session.scalar(select(func.count()).select_from(model))
+
+    def test_bulk_create_lessons(self):
+        lessons = [
+            {'lesson_info': 'Math', 'lesson_number': 1, 'groups': ['Group A', 'Group B'], 'lesson_date': date(2025, 3, 3)},
+            {'lesson_info': 'Math', 'lesson_number': 2, 'groups': ['Group B', 'Group B'], 'lesson_date': date(2025, 3, 3)},
+            {'lesson_info': 'Physics', 'lesson_number': 1, 'groups': ['Group C'], 'lesson_date': date(2025, 3, 4)},
+        ]
+        self.assertEqual(3 + 3, self.manager.bulk_create_lessons(['Group A', 'Group B'], lessons))
+        self.assertEqual(2, self.count(Subject))
+        self.assertEqual(3, self.count(Lesson))
+        self.assertEqual(3, self.count(LessonGroup))
+        self.assertEqual(["Group A", "Group B"], sorted(group.name for group in self.manager.get_groups()))
+
+    def test_timetable_follows_import_and_lesson_times(self):
+        lessons = [
+            {'lesson_info': 'Math', 'lesson_number': 1, 'groups': ['Group A'], 'lesson_date': date(2025, 3, 3)},
+            {'lesson_info': 'Physics', 'lesson_number': 2, 'groups': ['Group A'], 'lesson_date': date(2025, 3, 3)},
+        ]
+        self.manager.bulk_create_lessons(['Group A'], lessons)
+        self.manager.create_user(tg_id=1)
+        self.manager.attach_user_to_group(1, "Group A")
+        self.assertEqual(2, self.count(GroupTimetable))
+
+        self.manager.create_lesson_time(lesson_number=1, start_time=time(9, 0), end_time=time(10, 30))
+        math, physics = self.manager.get_user_lessons_on_date(1, date(2025, 3, 3))
+        self.assertEqual(("Math", "09:00", "10:30"), (math.subject_name, math.lesson_start_time, math.lesson_end_time))
+        self.assertEqual(("Physics", "--:--"), (physics.subject_name, physics.lesson_start_time))
+
+        self.assertEqual(2, self.manager.delete_lessons_before_date(date(2025, 3, 4)))
+        self.assertEqual(0, self.count(GroupTimetable))
+
+
+if __name__ == '__main__':
+    unittest.main()
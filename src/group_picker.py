@@ -0,0 +1,142 @@
+"""
+Paginated group selection keyboard. Groups are listed per prefix (the part of the name before the first "-",
+e.g. the year in "24-HR-CS1"), both the group list and the keyboards the buttons lead to are cached in
+group_keyboards.
+
+Callback data stays far below telegram's 64 bytes:
+    "g:<group id>"          select a group
+    "p:<prefix>:<page>"     show a page of the groups starting with prefix
+    "f"                     show the prefixes
+    "Cancel"
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import GROUPS_PER_PAGE
+from db import async_database_manager
+from utils.cache import group_keyboards
+
+COLUMNS = 3
+MAX_PREFIX_BYTES = 48
+CANCEL = "Cancel"
+
+
+class GroupCallback(NamedTuple):
+    action: str
+    group_id: Optional[int] = None
+    prefix: str = ""
+    page: int = 0
+
+
+def get_group_prefix(group_name: str) -> str:
+    return group_name.split("-", 1)[0]
+
+
+def clip_prefix(prefix: str) -> str:
+    return prefix.encode()[:MAX_PREFIX_BYTES].decode(errors="ignore")
+
+
+def parse_callback_data(data: str) -> GroupCallback:
+    if data.startswith("g:") and data[2:].isdigit():
+        return GroupCallback("select", group_id=int(data[2:]))
+    if data.startswith("p:"):
+        prefix, _, page = data[2:].rpartition(":")
+        if page.isdigit():
+            return GroupCallback("page", prefix=prefix, page=int(page))
+    if data == "f":
+        return GroupCallback("prefixes")
+    return GroupCallback("cancel" if data == CANCEL else "unknown")
+
+
+def make_keyboard(buttons: Sequence[Tuple[str, str]], columns: int = 1,
+                  footer: Sequence[Tuple[str, str]] = ()) -> InlineKeyboardMarkup:
+    """buttons and footer are (text, callback data) pairs, the footer is one row above Cancel."""
+    if columns < 1 or columns > 5:
+        columns = 1
+
+    keyboard = [
+        [InlineKeyboardButton(text, callback_data=data) for text, data in buttons[index:index + columns]]
+        for index in range(0, len(buttons), columns)
+    ]
+    if footer:
+        keyboard.append([InlineKeyboardButton(text, callback_data=data) for text, data in footer])
+    keyboard.append([InlineKeyboardButton(CANCEL, callback_data=CANCEL)])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def build_prefix_keyboard(groups: Sequence[Tuple[int, str]]) -> Tuple[str, InlineKeyboardMarkup]:
+    counts: Dict[str, int] = {}
+    for group_id, group_name in groups:
+        prefix = get_group_prefix(group_name)
+        counts[prefix] = counts.get(prefix, 0) + 1
+
+    buttons = [(f"{prefix} ({count})", f"p:{clip_prefix(prefix)}:0") for prefix, count in sorted(counts.items())]
+    return "Choose a group prefix:", make_keyboard(buttons, COLUMNS)
+
+
+def build_group_keyboard(groups: Sequence[Tuple[int, str]], prefix: str,
+                         page: int) -> Tuple[str, InlineKeyboardMarkup]:
+    matching = [(group_id, group_name) for group_id, group_name in groups
+                if group_name.upper().startswith(prefix.upper())]
+    if not matching:
+        return f"No groups start with '{prefix}'.", make_keyboard([], footer=[("All groups", "f")])
+
+    pages = (len(matching) + GROUPS_PER_PAGE - 1) // GROUPS_PER_PAGE
+    page = min(max(page, 0), pages - 1)
+    buttons = [(group_name, f"g:{group_id}")
+               for group_id, group_name in matching[page * GROUPS_PER_PAGE:(page + 1) * GROUPS_PER_PAGE]]
+
+    footer = []
+    if page > 0:
+        footer.append(("« Prev", f"p:{prefix}:{page - 1}"))
+    if len(matching) < len(groups):
+        footer.append(("All groups", "f"))
+    if page < pages - 1:
+        footer.append(("Next »", f"p:{prefix}:{page + 1}"))
+
+    text = "Choose a group:" if pages == 1 else f"Choose a group ({page + 1}/{pages}):"
+    return text, make_keyboard(buttons, COLUMNS, footer)
+
+
+async def get_groups() -> List[Tuple[int, str]]:
+    groups = group_keyboards.get("groups")
+    if groups is None:
+        groups = await async_database_manager.get_group_names()
+        group_keyboards.put("groups", groups)
+    return groups
+
+
+async def get_group_name(group_id: int) -> Optional[str]:
+    return dict(await get_groups()).get(group_id)
+
+
+def get_keyboard_key(groups: Sequence[Tuple[int, str]], prefix: Optional[str], page: int) -> Optional[Tuple]:
+    """Cache key of a keyboard the picker's buttons lead to, None for prefixes typed after /set_group and pages
+    out of range, which would otherwise push the keyboards everyone uses out of group_keyboards."""
+    if prefix is None and len(groups) > GROUPS_PER_PAGE:
+        return "keyboard", None, 0
+    if prefix is not None and prefix not in {clip_prefix(get_group_prefix(group_name)) for _, group_name in groups}:
+        return None
+    matching = sum(group_name.upper().startswith((prefix or "").upper()) for _, group_name in groups)
+    if page >= (matching + GROUPS_PER_PAGE - 1) // GROUPS_PER_PAGE:
+        return None
+    return "keyboard", prefix, page
+
+
+async def get_group_keyboard(prefix: Optional[str] = None, page: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
+    """Picker message text and keyboard, prefix None shows every group or, if they do not fit on one page,
+    the prefixes to choose from."""
+    if prefix is not None:
+        prefix = clip_prefix(prefix)
+    groups = await get_groups()
+    key = get_keyboard_key(groups, prefix, page)
+    keyboard = group_keyboards.get(key) if key is not None else None
+    if keyboard is None:
+        if prefix is None and len(groups) > GROUPS_PER_PAGE:
+            keyboard = build_prefix_keyboard(groups)
+        else:
+            keyboard = build_group_keyboard(groups, prefix or "", page)
+        if key is not None:
+            group_keyboards.put(key, keyboard)
+    return keyboard
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ASYNC_DATABASE_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import event
+
+import group_picker
+from db import AsyncDBManager
+from group_picker import GroupCallback, build_group_keyboard, get_group_keyboard, parse_callback_data
+from utils.cache import group_keyboards
+
+GROUPS = [(index, name) for index, name in enumerate(
+    [f"{year}-{track}-{number}" for year in (22, 23, 24, 25) for track in ("HR", "LR") for number in range(1, 5)],
+    start=1,
+)]
+
+
+def get_callback_data(reply_markup) -> list:
+    return [button.callback_data for row in reply_markup.inline_keyboard for button in row]
+
+
+class TestGroupKeyboards(unittest.TestCase):
+    def test_pages_and_navigation(self):
+        with mock.patch.object(group_picker, "GROUPS_PER_PAGE", 3):
+            text, first = build_group_keyboard(GROUPS, "23", 0)
+            text_last, last = build_group_keyboard(GROUPS, "23", 2)
+
+        self.assertEqual("Choose a group (1/3):", text)
+        self.assertEqual(["g:9", "g:10", "g:11", "f", "p:23:1", "Cancel"], get_callback_data(first))
+        self.assertEqual("Choose a group (3/3):", text_last)
+        self.assertEqual(["g:15", "g:16", "p:23:1", "f", "Cancel"], get_callback_data(last))
+
+    def test_callback_data_round_trip(self):
+        long_prefix = "Ж" * 100
+        text, reply_markup = build_group_keyboard(GROUPS, group_picker.clip_prefix(long_prefix), 0)
+        self.assertTrue(all(len(data.encode()) <= 64 for data in get_callback_data(reply_markup)))
+
+        self.assertEqual(GroupCallback("select", group_id=12), parse_callback_data("g:12"))
+        self.assertEqual(GroupCallback("page", prefix="24-HR", page=2), parse_callback_data("p:24-HR:2"))
+        self.assertEqual(GroupCallback("prefixes"), parse_callback_data("f"))
+        self.assertEqual(GroupCallback("cancel"), parse_callback_data("Cancel"))
+        self.assertEqual(GroupCallback("unknown"), parse_callback_data("23-HO"))
+
+
+class TestGroupKeyboardCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = AsyncDBManager(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}")
+        await self.manager.create_all()
+        for group_id, group_name in GROUPS:
+            await self.manager.create_group(name=group_name)
+        self.patcher = mock.patch.object(group_picker, "async_database_manager", self.manager)
+        self.patcher.start()
+
+    async def asyncTearDown(self):
+        self.patcher.stop()
+        group_keyboards.clear()
+        await self.manager.dispose()
+        self.directory.cleanup()
+
+    async def test_picker_is_cached_until_groups_change(self):
+        text, reply_markup = await get_group_keyboard()
+        self.assertEqual("Choose a group prefix:", text)
+        self.assertEqual(["p:22:0", "p:23:0", "p:24:0", "p:25:0", "Cancel"], get_callback_data(reply_markup))
+
+        statements = []
+        event.listen(self.manager.engine.sync_engine, "before_cursor_execute",
+                     lambda connection, cursor, statement, *args: statements.append(statement))
+        self.assertIs(reply_markup, (await get_group_keyboard())[1])
+        text, reply_markup = await get_group_keyboard("24", 0)
+        self.assertEqual(8, len(get_callback_data(reply_markup)) - 2)
+        self.assertEqual([], statements)
+
+        await self.manager.create_group(name="26-HR-1")
+        text, reply_markup = await get_group_keyboard()
+        self.assertIn("p:26:0", get_callback_data(reply_markup))
+
+    async def test_typed_prefixes_are_not_cached(self):
+        await get_group_keyboard("24", 0)
+        size = len(group_keyboards)
+        for prefix in ("24-HR", "24-hr-1", "nonsense", "Ж" * 100):
+            await get_group_keyboard(prefix)
+        await get_group_keyboard("24", 50)
+        self.assertEqual(size, len(group_keyboards))
+
+        text, reply_markup = await get_group_keyboard("24-HR")
+        self.assertEqual(4, len(get_callback_data(reply_markup)) - 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,26 +1,33 @@
-from datetime import timedelta
-from typing import Optional, Sequence
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Optional
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 
 import logging
-from config import now_local
-from db import database_manager
+from config import now_local, REMINDER_DEFAULT_MINUTES, REMINDER_MAX_MINUTES
+from db import QueryFailed, async_database_manager
+from group_picker import get_group_keyboard, get_group_name, parse_callback_data
+from reminders import reminder_scheduler
+from utils.cache import rendered_messages
+from utils.send_queue import send_queue
 
 logger_handlers = logging.getLogger("handlers")
+# one record per update, LOG_CHAT_SAMPLE_RATE keeps a share of them
+logger_chat = logging.getLogger("handlers.chat")
 
 WAITING_FOR_GROUP = 1
+QUERY_FAILED_MESSAGE = "<b>I can't load the schedule right now, please try again in a minute.</b>"
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger_handlers.error(f"Exception occurred: {context.error}")
 
 async def send_html_message(update: Update, text: str):
-    await update.message.reply_text(text, parse_mode='HTML')
+    await send_queue.submit(update.message.chat_id, update.message.reply_text, text, parse_mode='HTML')
 
 # Commands
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    database_manager.create_user(tg_id=update.message.from_user.id)
+    await async_database_manager.create_user(tg_id=update.message.from_user.id)
     await send_html_message(update,
         "Hello!\n"
         "I am bot for schedule in ESDC.\n"
@@ -38,7 +45,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "/today - show today schedule (won't work if you not attached to any group);\n"
         "/tomorrow - show tomorrow schedule (won't work if you not attached to any group).\n"
         "/week - in development\n"
-        "/two_weeks - in development"
+        "/two_weeks - in development\n"
+        f"/remind [minutes|off] - remind you before each lesson ({REMINDER_DEFAULT_MINUTES} minutes by default)."
     )
 
 def make_day_lessons_message(lessons: list, header: str = "", footer: str = ""):
@@ -49,106 +57,174 @@ def make_day_lessons_message(lessons: list, header: str = "", footer: str = ""):
         return message + "\n" + footer
 
     for i, lesson in enumerate(lessons):
-        message += (f"{i + 1}. <b>{lesson["subject_name"]}</b> " +
-                    # f"({lesson["lesson_type"]}): " +
-                    f"{lesson["lesson_start_time"]} - " +
-                    f"{lesson["lesson_end_time"]}\n")
+        message += (f"{i + 1}. <b>{lesson.subject_name}</b> " +
+                    # f"({lesson.lesson_type}): " +
+                    f"{lesson.lesson_start_time} - " +
+                    f"{lesson.lesson_end_time}\n")
     return message + footer
 
+def make_day_header(day: date) -> str:
+    return day.strftime('%Y-%m-%d') + f' <b>{day.strftime('%A')[:3]}</b>'
+
+def make_period_lessons_message(lessons_by_date: dict, start_date: date, end_date: date, header: str = "") -> str:
+    message: str = header
+    current_date = start_date
+    while current_date <= end_date:
+        if current_date in lessons_by_date:
+            message += make_day_lessons_message(lessons_by_date[current_date], header=make_day_header(current_date), footer="\n")
+        elif current_date.weekday() <= 4:
+            message += make_day_lessons_message(None, header=make_day_header(current_date), footer="\n")
+        current_date += timedelta(days=1)
+    return message
+
+async def get_rendered_message(tg_id: int, view: str, start_date: date,
+                               render: Callable[[int], Awaitable[str]]) -> Optional[str]:
+    """Message for the user's group from the rendered message cache, render(group_id) builds it on a miss.
+    Returns None if the user is not attached to a group. A failed query is answered with QUERY_FAILED_MESSAGE
+    and not cached."""
+    group_id = await async_database_manager.get_user_group_id(tg_id)
+    if group_id is None:
+        return None
+
+    key = (group_id, start_date, view)
+    message = rendered_messages.get(key)
+    if message is None:
+        try:
+            message = await render(group_id)
+        except QueryFailed:
+            return QUERY_FAILED_MESSAGE
+        rendered_messages.put(key, message)
+    return message
+
 async def today_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    today_lessons = database_manager.get_user_lessons_on_date(update.message.from_user.id, now_local().date())
-    if today_lessons:
-        message: str = make_day_lessons_message(today_lessons, header="<b>Today</b> you have these lessons:")
-        await send_html_message(update, message)
-    else:
-        await send_html_message(update, "<b>I can't find any lessons for that day. Have a good day :)</b>")
+    today = now_local().date()
+    no_lessons = "<b>I can't find any lessons for that day. Have a good day :)</b>"
+
+    async def render(group_id: int) -> str:
+        today_lessons = await async_database_manager.get_group_lessons_on_date(group_id, today)
+        if today_lessons:
+            return make_day_lessons_message(today_lessons, header="<b>Today</b> you have these lessons:")
+        return no_lessons
+
+    message = await get_rendered_message(update.message.from_user.id, "today", today, render)
+    await send_html_message(update, message or no_lessons)
 
 async def tomorrow_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    tomorrow_lessons = database_manager.get_user_lessons_on_date(update.message.from_user.id, now_local().date() + timedelta(days=1))
-    if tomorrow_lessons:
-        message: str = make_day_lessons_message(tomorrow_lessons, header="<b>Tomorrow</b> you have these lessons:")
-        await send_html_message(update, message)
-    else:
-        await send_html_message(update, "<b>I can't find any lessons for that day. have a good day :)</b>")
+    tomorrow = now_local().date() + timedelta(days=1)
+    no_lessons = "<b>I can't find any lessons for that day. have a good day :)</b>"
+
+    async def render(group_id: int) -> str:
+        tomorrow_lessons = await async_database_manager.get_group_lessons_on_date(group_id, tomorrow)
+        if tomorrow_lessons:
+            return make_day_lessons_message(tomorrow_lessons, header="<b>Tomorrow</b> you have these lessons:")
+        return no_lessons
+
+    message = await get_rendered_message(update.message.from_user.id, "tomorrow", tomorrow, render)
+    await send_html_message(update, message or no_lessons)
 
 async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     current_date = now_local().date()
     weekday = current_date.weekday()
     end_date = current_date + timedelta(days= 6 - weekday)
-    week_lessons = database_manager.get_user_lessons_on_period(update.message.from_user.id, current_date, end_date)
-    message: str = "<b>Rest of this week</b> you have these lessons:\n"
-    if week_lessons:
-        while current_date <= end_date:
-            if current_date in week_lessons:
-                message += make_day_lessons_message(week_lessons[current_date], header=current_date.strftime('%Y-%m-%d') + f' <b>{current_date.strftime('%A')[:3]}</b>', footer="\n")
-            elif current_date.weekday() <= 4:
-                message += make_day_lessons_message(None, header=current_date.strftime('%Y-%m-%d') + f' <b>{current_date.strftime('%A')[:3]}</b>', footer="\n")
-            current_date += timedelta(days=1)
-
-        await send_html_message(update, message)
-    else:
-        await send_html_message(update, "I can't find any lessons for this week.")
+    no_lessons = "I can't find any lessons for this week."
+
+    async def render(group_id: int) -> str:
+        week_lessons = await async_database_manager.get_group_lessons_on_period(group_id, current_date, end_date)
+        if week_lessons:
+            return make_period_lessons_message(week_lessons, current_date, end_date,
+                                               header="<b>Rest of this week</b> you have these lessons:\n")
+        return no_lessons
+
+    message = await get_rendered_message(update.message.from_user.id, "week", current_date, render)
+    await send_html_message(update, message or no_lessons)
 
 async def two_week_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     current_date = now_local().date()
     weekday = current_date.weekday()
     end_date = current_date + timedelta(days=13-weekday)
-    two_week_lessons = database_manager.get_user_lessons_on_period(update.message.from_user.id, current_date, end_date)
-    message: str = "<b>Rest of this week and next week</b> you have these lessons:\n"
-
-    if two_week_lessons:
-        while current_date <= end_date:
-            if current_date in two_week_lessons:
-                message += make_day_lessons_message(two_week_lessons[current_date], header=current_date.strftime('%Y-%m-%d') + f' <b>{current_date.strftime('%A')[:3]}</b>', footer="\n")
-            elif current_date.weekday() <= 4:
-                message += make_day_lessons_message(None, header=current_date.strftime('%Y-%m-%d') + f' <b>{current_date.strftime('%A')[:3]}</b>', footer="\n")
-            current_date += timedelta(days=1)
-
-        await send_html_message(update, message)
+    no_lessons = "<b>I can't find any lessons for this two weeks.<b>"
+
+    async def render(group_id: int) -> str:
+        two_week_lessons = await async_database_manager.get_group_lessons_on_period(group_id, current_date, end_date)
+        if two_week_lessons:
+            return make_period_lessons_message(two_week_lessons, current_date, end_date,
+                                               header="<b>Rest of this week and next week</b> you have these lessons:\n")
+        return no_lessons
+
+    message = await get_rendered_message(update.message.from_user.id, "two_weeks", current_date, render)
+    await send_html_message(update, message or no_lessons)
+
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    tg_id = update.message.from_user.id
+    argument = context.args[0].lower() if context.args else str(REMINDER_DEFAULT_MINUTES)
+    if argument == "off":
+        minutes = None
+    elif argument.isdigit() and 1 <= int(argument) <= REMINDER_MAX_MINUTES:
+        minutes = int(argument)
     else:
-        await send_html_message(update, "<b>I can't find any lessons for this two weeks.<b>")
-
-def make_keyboard(data: Sequence[str], columns: int = 1) -> InlineKeyboardMarkup:
-    if columns < 1 or columns > 5:
-        columns = 1
-
-    keyboard = []
-
-    for index in range(0, len(data), columns):
-        buttons_in_row = [InlineKeyboardButton(data[index_new], callback_data=data[index_new]) for index_new in range(index, min(index + columns, len(data)))]
-        keyboard.append(buttons_in_row)
-
-    keyboard.append([InlineKeyboardButton("Cancel", callback_data="Cancel")])
-    return InlineKeyboardMarkup(keyboard)
+        await send_html_message(update, f"Usage: /remind [1-{REMINDER_MAX_MINUTES}|off]")
+        return
+
+    if await async_database_manager.get_user_group_id(tg_id) is None:
+        await send_html_message(update, "To get reminders you need to <b>set up your group using /set_group</b>")
+        return
+
+    previous = await async_database_manager.get_user_reminder(tg_id)
+    # reloading re-reads every subscriber of the day, skip it when nothing changed
+    if await async_database_manager.set_user_reminder(tg_id, minutes) and minutes != previous:
+        reminder_scheduler.reload()
+    if minutes is None:
+        await send_html_message(update, "<b>Reminders turned off.</b>")
+    else:
+        await send_html_message(update, f"I will remind you <b>{minutes} minutes</b> before each lesson.")
 
 async def set_group_command(update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    database_manager.create_user(tg_id=update.message.from_user.id)
-    groups = database_manager.get_groups()
-    group_names = tuple(group.name for group in groups)
-    reply_markup = make_keyboard(group_names, 3)
+    # /set_group 24 lists only the groups starting with "24"
+    prefix = context.args[0] if context.args else None
+    text, reply_markup = await get_group_keyboard(prefix)
 
-    await update.message.reply_text("Choose a group:", reply_markup=reply_markup)
+    await send_queue.submit(update.message.chat_id, update.message.reply_text, text, reply_markup=reply_markup)
     return WAITING_FOR_GROUP
 
 async def receive_group_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
     query = update.callback_query
-    logger_handlers.info(f"Callback waiting with")
+    logger_chat.info(f"Callback waiting with")
     await query.answer()
 
-    logger_handlers.info(f"Callback received with {query.data}")
-    data = query.data
-    if data == "Cancel":
-        await query.edit_message_text(f"Selection of group canceled", parse_mode='HTML')
+    logger_chat.info(f"Callback received with {query.data}")
+    callback = parse_callback_data(query.data)
+    if callback.action == "cancel":
+        await send_queue.submit(update.effective_chat.id, query.edit_message_text, f"Selection of group canceled",
+                                parse_mode='HTML')
         return ConversationHandler.END
 
+    if callback.action in ("page", "prefixes"):
+        text, reply_markup = await get_group_keyboard(callback.prefix if callback.action == "page" else None,
+                                                      callback.page)
+        await send_queue.submit(update.effective_chat.id, query.edit_message_text, text, reply_markup=reply_markup)
+        return WAITING_FOR_GROUP
+
+    if callback.action == "select":
+        user_group = await get_group_name(callback.group_id)
+        if user_group is None:
+            await send_queue.submit(update.effective_chat.id, query.edit_message_text,
+                                    "This group no longer exists, use /set_group again.")
+            return ConversationHandler.END
+    else:
+        # keyboards sent before the picker was paginated carry the group name itself
+        user_group = query.data
+
     user_info = query.from_user
-    user_group = data
-    database_manager.attach_user_to_group(user_info.id, user_group)
-    await query.edit_message_text(f"<b>Group '{user_group}' selected.</b>", parse_mode='HTML')
+    await async_database_manager.attach_user_to_group(user_info.id, user_group)
+    # only subscribers are in today's reminder batches, most users picking a group are not
+    if await async_database_manager.get_user_reminder(user_info.id) is not None:
+        reminder_scheduler.reload()
+    await send_queue.submit(update.effective_chat.id, query.edit_message_text,
+                            f"<b>Group '{user_group}' selected.</b>", parse_mode='HTML')
     return ConversationHandler.END
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("<b>Attaching to group cancelled</b>")
+    await send_queue.submit(update.message.chat_id, update.message.reply_text, "<b>Attaching to group cancelled</b>")
     return ConversationHandler.END
 
 # Responses
@@ -162,7 +238,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     message_type: str = update.message.chat.type
     text: str = update.message.text
 
-    logger_handlers.info(f"User {update.message.chat.id} sent message: {message_type}: '{text}'")
+    logger_chat.info(f"User {update.message.chat.id} sent message: {message_type}: '{text}'")
     response: str = handle_response(text)
-    logger_handlers.info(f"Bot {response}")
+    logger_chat.info(f"Bot {response}")
     await send_html_message(update, response)
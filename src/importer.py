@@ -0,0 +1,142 @@
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence
+
+from db import DBManager, database_manager
+from parser.simple_parser import ScheduleParser
+from utils.metrics import Counter, Histogram
+
+logger_importer = logging.getLogger("importer")
+
+INGEST_FILES = Counter("schedbot_ingest_files_total", "Schedule files checked by the importer", ("result",))
+INGEST_LESSONS = Counter("schedbot_ingest_lessons_total", "Lessons written by schedule imports", ("change",))
+INGEST_DURATION = Histogram("schedbot_ingest_duration_seconds", "Duration of an import_files run",
+                            buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+
+
+def make_digest(*parts) -> str:
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+def get_file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(1 << 16):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_lessons_digest(lessons: List[Dict]) -> str:
+    return make_digest(sorted(
+        (lesson["lesson_number"], str(lesson["lesson_info"]), tuple(map(str, lesson["groups"])))
+        for lesson in lessons
+    ))
+
+
+def to_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def get_changed_blocks(sheet_key: str, groups: List[str], lessons: List[Dict], stored: Dict[str, str],
+                       fingerprints: Dict[str, str]) -> Optional[Dict[date, List[Dict]]]:
+    """Add the sheet and day block fingerprints to fingerprints, return the day blocks that differ
+    from the stored ones or None if the whole sheet is unchanged."""
+    lessons_by_date = defaultdict(list)
+    for lesson in lessons:
+        lesson_date = to_date(lesson["lesson_date"])
+        if lesson_date is None:
+            logger_importer.warning(f"{sheet_key}: lesson without a valid date skipped: {lesson}")
+            continue
+
+        lesson["lesson_date"] = lesson_date
+        lessons_by_date[lesson_date].append(lesson)
+
+    block_digests = {
+        f"{sheet_key}|{lesson_date.isoformat()}": get_lessons_digest(day_lessons)
+        for lesson_date, day_lessons in lessons_by_date.items()
+    }
+    fingerprints[sheet_key] = make_digest(groups, sorted(block_digests.items()))
+    fingerprints.update(block_digests)
+    if stored.get(sheet_key) == fingerprints[sheet_key]:
+        return None
+
+    changed_blocks = {
+        lesson_date: day_lessons
+        for lesson_date, day_lessons in lessons_by_date.items()
+        if stored.get(f"{sheet_key}|{lesson_date.isoformat()}") != block_digests[f"{sheet_key}|{lesson_date.isoformat()}"]
+    }
+    for key in stored:
+        if key.startswith(f"{sheet_key}|") and key not in block_digests:
+            changed_blocks[date.fromisoformat(key.rsplit("|", 1)[1])] = []
+
+    return changed_blocks
+
+
+def import_files(parser: ScheduleParser, file_paths: Sequence[str], manager: DBManager = database_manager,
+                 workers: int = 1) -> List[str]:
+    """Import only what changed since the last run: a file is skipped when its hash matches, otherwise
+    every sheet and every day block of a sheet is compared by content fingerprint and only changed
+    day blocks are synced. Sheets of all changed files are parsed with `workers` processes, the changes of
+    a file are applied in one transaction as soon as its last sheet is parsed. Returns the imported file paths,
+    files whose transaction failed are logged and left out."""
+    started = perf_counter()
+    stored_by_file = {}
+    fingerprints_by_file = {}
+    for file_path in file_paths:
+        stored = manager.get_fingerprints(file_path)
+        fingerprints = {file_path: get_file_digest(file_path)}
+        if stored.get(file_path) == fingerprints[file_path]:
+            logger_importer.info(f"{file_path} is unchanged, skipped.")
+            INGEST_FILES.labels("unchanged").inc()
+            continue
+
+        stored_by_file[file_path] = stored
+        fingerprints_by_file[file_path] = fingerprints
+
+    imported = []
+
+    def apply_file(file_path: str, changed_sheets: List) -> None:
+        changes = manager.apply_schedule_changes(file_path, fingerprints_by_file.pop(file_path), changed_sheets)
+        if changes is None:
+            # the fingerprints were rolled back with the lessons, the next run tries the file again
+            logger_importer.error(f"{file_path} was not imported, its changes were rolled back.")
+            INGEST_FILES.labels("failed").inc()
+            return
+
+        imported.append(file_path)
+        INGEST_FILES.labels("imported").inc()
+        for change, count in zip(("inserted", "updated", "deleted"), changes):
+            INGEST_LESSONS.labels(change).inc(count)
+
+    # sheets arrive in file order, every file is applied before the sheets of the next one are kept, so only
+    # the changed sheets of one file are held at a time
+    sheets = parser.iter_sheets(list(fingerprints_by_file), workers)
+    for file_path, file_sheets in groupby(sheets, key=itemgetter(0)):
+        changed_sheets = []
+        for _, title, sheet in file_sheets:
+            changed_blocks = get_changed_blocks(f"{file_path}|{title}", sheet['groups'], sheet['lessons'],
+                                                stored_by_file[file_path], fingerprints_by_file[file_path])
+            if changed_blocks is not None:
+                changed_sheets.append((sheet['groups'], changed_blocks))
+        apply_file(file_path, changed_sheets)
+
+    # files without a sheet to parse still get their fingerprints stored
+    for file_path in list(fingerprints_by_file):
+        apply_file(file_path, [])
+
+    INGEST_DURATION.observe(perf_counter() - started)
+    return imported
+
+
+def import_file(parser: ScheduleParser, file_path: str, manager: DBManager = database_manager) -> bool:
+    """Incrementally import one file, returns False if it was skipped as unchanged or failed."""
+    return bool(import_files(parser, [file_path], manager))
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ASYNC_DATABASE_URL", "sqlite+aiosqlite://")
+
+import openpyxl
+from sqlalchemy import select, func
+
+from db import DBManager
+from importer import import_file, import_files
+from models.lesson import Lesson
+from models.timetable import GroupTimetable
+from parser.simple_parser import ScheduleParser
+
+SCHEDULE_PATH = "schedules/Schedule.xlsx"
+
+
+class TestIncrementalImport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = DBManager(f"sqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}")
+        self.file_path = os.path.join(self.directory.name, "Schedule.xlsx")
+        shutil.copy(SCHEDULE_PATH, self.file_path)
+        self.parser = ScheduleParser()
+
+    def tearDown(self):
+        self.manager.engine.dispose()
+        self.directory.cleanup()
+
+    def count_lessons(self) -> int:
+        with self.manager.atomic() as session:
+            return session.scalar(select(func.count()).select_from(Lesson))
+
+    def test_unchanged_file_is_skipped(self):
+        self.assertTrue(import_file(self.parser, self.file_path, self.manager))
+        lessons = self.count_lessons()
+        self.assertGreater(lessons, 0)
+
+        self.assertFalse(import_file(self.parser, self.file_path, self.manager))
+        self.assertEqual(lessons, self.count_lessons())
+
+    def test_only_changed_lessons_are_applied(self):
+        import_file(self.parser, self.file_path, self.manager)
+        lessons = self.count_lessons()
+
+        workbook = openpyxl.load_workbook(self.file_path)
+        worksheet = workbook.worksheets[0]
+        lesson_cell = next(
+            cell for row in worksheet.iter_rows(min_row=10, min_col=6) for cell in row
+            if isinstance(cell.value, str) and cell.coordinate not in worksheet.merged_cells
+        )
+        lesson_cell.value = "Renamed subject"
+        workbook.save(self.file_path)
+
+        self.assertTrue(import_file(self.parser, self.file_path, self.manager))
+        self.assertEqual(lessons, self.count_lessons())
+        with self.manager.atomic() as session:
+            self.assertEqual(1, session.scalar(
+                select(func.count()).select_from(Lesson).where(Lesson.subject.has(name="Renamed subject"))
+            ))
+            self.assertEqual(1, session.scalar(
+                select(func.count(func.distinct(GroupTimetable.lesson_id)))
+                .where(GroupTimetable.subject_name == "Renamed subject")
+            ))
+
+    def test_failed_file_is_not_counted_as_imported(self):
+        def failing_refresh(session, group_ids):
+            raise ValueError("value too long for type character varying(100)")
+
+        self.manager.refresh_timetable = failing_refresh
+        with self.assertLogs("importer", level="ERROR"):
+            self.assertFalse(import_file(self.parser, self.file_path, self.manager))
+        self.assertEqual(0, self.count_lessons())
+
+        # nothing was stored, not even the fingerprints, so the next run imports the file
+        del self.manager.refresh_timetable
+        self.assertTrue(import_file(self.parser, self.file_path, self.manager))
+        self.assertGreater(self.count_lessons(), 0)
+
+    def test_files_are_applied_one_by_one(self):
+        second_path = os.path.join(self.directory.name, "Schedule 2.xlsx")
+        shutil.copy(SCHEDULE_PATH, second_path)
+        events = []
+        iter_sheets = self.parser.iter_sheets
+        apply_schedule_changes = self.manager.apply_schedule_changes
+
+        def recording_iter_sheets(*args):
+            for file_path, title, sheet in iter_sheets(*args):
+                events.append(("parsed", file_path))
+                yield file_path, title, sheet
+
+        def recording_apply(source, *args):
+            events.append(("applied", source))
+            return apply_schedule_changes(source, *args)
+
+        self.parser.iter_sheets = recording_iter_sheets
+        self.manager.apply_schedule_changes = recording_apply
+        self.assertEqual([self.file_path, second_path],
+                         import_files(self.parser, [self.file_path, second_path], self.manager))
+
+        # the first file is written as soon as the first sheet of the second one shows its end
+        sheets = len(self.parser.get_sheet_titles(self.file_path))
+        self.assertEqual([("parsed", self.file_path)] * sheets + [("parsed", second_path), ("applied", self.file_path)]
+                         + [("parsed", second_path)] * (sheets - 1) + [("applied", second_path)], events)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import io
+import json
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from logging.handlers import RotatingFileHandler
+
+from utils.logger import DroppingQueueHandler, SamplingFilter, build_pipeline, parse_levels
+
+
+class TestLogger(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("logger_test")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(self.logger.handlers.clear)
+        self.addCleanup(self.logger.filters.clear)
+
+    def test_parse_levels(self):
+        self.assertEqual({"aiosqlite": "INFO", "handlers.chat": "WARNING"},
+                         parse_levels(" aiosqlite=INFO, handlers.chat=warning,,broken"))
+        self.assertEqual({}, parse_levels(""))
+
+    def test_rotating_json_pipeline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bot.log")
+            file_handler = RotatingFileHandler(path, maxBytes=300, backupCount=2, encoding="utf-8")
+            queue_handler, listener = build_pipeline([file_handler], "json")
+            self.logger.addHandler(queue_handler)
+            listener.start()
+            try:
+                for number in range(20):
+                    self.logger.info(f"Повідомлення {number}")
+                self.logger.debug("below the logger level")
+            finally:
+                listener.stop()
+                file_handler.close()
+
+            self.assertEqual(["bot.log", "bot.log.1", "bot.log.2"], sorted(os.listdir(directory)))
+            with open(path, encoding="utf-8") as file:
+                entries = [json.loads(line) for line in file]
+            self.assertEqual("Повідомлення 19", entries[-1]["message"])
+            self.assertEqual({"time", "level", "logger", "message"}, set(entries[-1]))
+            self.assertEqual("logger_test", entries[-1]["logger"])
+
+    def test_json_keeps_exception(self):
+        stream = io.StringIO()
+        queue_handler, listener = build_pipeline([logging.StreamHandler(stream)], "json")
+        self.logger.addHandler(queue_handler)
+        listener.start()
+        try:
+            try:
+                raise ValueError("broken sheet")
+            except ValueError:
+                self.logger.exception("Import failed for %s", "schedule.xlsx")
+        finally:
+            listener.stop()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual("Import failed for schedule.xlsx", entry["message"])
+        self.assertIn("ValueError: broken sheet", entry["exception"])
+
+    def test_full_queue_drops_records(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        self.logger.addHandler(handler)
+        for number in range(5):
+            self.logger.info(f"message {number}")
+
+        self.assertEqual(2, handler.queue.qsize())
+        self.assertEqual(3, handler.dropped)
+
+    def test_sampling(self):
+        handler = DroppingQueueHandler(queue.Queue())
+        self.logger.addHandler(handler)
+        self.logger.addFilter(SamplingFilter(0.1))
+        for number in range(2000):
+            self.logger.info(f"message {number}")
+
+        self.assertLess(100, handler.queue.qsize())
+        self.assertGreater(300, handler.queue.qsize())
+
+
+if __name__ == '__main__':
+    unittest.main()
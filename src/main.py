@@ -1,46 +1,168 @@
+import asyncio
+import secrets
+
 from telegram.ext import CommandHandler, MessageHandler, filters, ConversationHandler, \
-    CallbackQueryHandler, Application
+    CallbackQueryHandler, Application, ApplicationBuilder
 from handlers import start_command, help_command, set_group_command, today_command, tomorrow_command, receive_group_callback, \
-    handle_message, week_command, two_week_command, error_handler
+    handle_message, week_command, two_week_command, remind_command, error_handler
 from utils.logger import logger
 import logging
 
-from config import BOT_TOKEN
+from config import BOT_TOKEN, BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, \
+    WEBHOOK_SECRET_TOKEN, POLL_INTERVAL, MAX_CONCURRENT_UPDATES, UPDATE_STATS_INTERVAL, METRICS_LISTEN, METRICS_PORT
+from db import database_manager, async_database_manager
+from reminders import reminder_scheduler
+from utils.cache import rendered_messages, group_keyboards
+from utils.metrics import collect_stats, instrument_handler, metrics_server
+from utils.send_queue import send_queue
+from utils.update_processor import OrderedUpdateProcessor
 
 logger_bot = logging.getLogger("src")
 
 WAITING_FOR_GROUP = 1
 
 
-if __name__ == "__main__":
-    logger_bot.info("Bot is started")
-    app = Application.builder().token(BOT_TOKEN).build()
+def get_update_stats(application: Application) -> dict:
+    return {
+        "queue_depth": application.update_queue.qsize(),
+        **application.update_processor.get_stats(),
+        "send_queue": send_queue.get_stats(),
+        "db_pool": async_database_manager.get_pool_stats(),
+        "single_flight": async_database_manager.single_flight.get_stats(),
+    }
+
+
+async def log_update_stats(application: Application) -> None:
+    while True:
+        await asyncio.sleep(UPDATE_STATS_INTERVAL)
+        logger_bot.info(f"Updates: {get_update_stats(application)}")
+
+
+def register_metrics(application: Application) -> None:
+    collect_stats("schedbot_cache", "Cache", "cache", {
+        "rendered_messages": rendered_messages.get_stats,
+        "group_keyboards": group_keyboards.get_stats,
+        "user_groups": async_database_manager.user_groups.get_stats,
+    }, {"size": "gauge", "hits": "counter", "misses": "counter", "evictions": "counter"})
+    # lesson queries shared by concurrent identical requests, coalesced / calls is the share saved
+    collect_stats("schedbot_single_flight", "Coalesced lesson queries", "queries", {
+        "lessons": async_database_manager.single_flight.get_stats,
+    }, {"calls": "counter", "coalesced": "counter", "in_flight": "gauge"})
+    collect_stats("schedbot_db_pool", "Database connection pool", "engine", {
+        "sync": database_manager.get_pool_stats,
+        "async": async_database_manager.get_pool_stats,
+    }, {"checked_out": "gauge", "utilisation": "gauge", "wait_avg_ms": "gauge", "wait_max_ms": "gauge",
+        "checkouts": "counter", "timeouts": "counter", "connects": "counter", "closes": "counter",
+        "invalidations": "counter"})
+    collect_stats("schedbot_updates", "Update processing", "processor", {
+        "bot": lambda: get_update_stats(application),
+    }, {"queue_depth": "gauge", "in_flight": "gauge", "waiting": "gauge", "processed": "counter"})
+    collect_stats("schedbot_send_queue", "Outbound message queue", "queue", {
+        "bot": send_queue.get_stats,
+    }, {"outstanding": "gauge", "sent": "counter", "retried": "counter", "failed": "counter",
+        "throttled": "counter"})
+    collect_stats("schedbot_reminders", "Lesson reminders", "scheduler", {
+        "bot": reminder_scheduler.get_stats,
+    }, {"scheduled": "gauge", "reminders_sent": "counter"})
+
+
+async def start_metrics_server(application: Application) -> None:
+    if BOT_MODE == "webhook" and WEBHOOK_URL and METRICS_PORT == WEBHOOK_PORT:
+        logger_bot.error(f"Metrics endpoint not started: port {METRICS_PORT} serves the webhook")
+        return
+    register_metrics(application)
+    try:
+        await metrics_server.start(METRICS_LISTEN, METRICS_PORT)
+    except OSError as e:
+        logger_bot.error(f"Metrics endpoint not started: {e}")
+
+
+async def post_init(application: Application) -> None:
+    await async_database_manager.warm_user_groups()
+    if METRICS_PORT > 0:
+        await start_metrics_server(application)
+    send_queue.start()
+
+    async def send_reminder(chat_id: int, text: str) -> None:
+        await send_queue.submit(chat_id, application.bot.send_message, chat_id, text, parse_mode='HTML')
+
+    reminder_scheduler.start(send_reminder)
+    if UPDATE_STATS_INTERVAL > 0:
+        application.bot_data["stats_task"] = asyncio.create_task(log_update_stats(application))
 
-    receive_group_callback = CallbackQueryHandler(receive_group_callback)
+
+async def post_shutdown(application: Application) -> None:
+    stats_task = application.bot_data.pop("stats_task", None)
+    if stats_task:
+        stats_task.cancel()
+    reminder_scheduler.stop()
+    await send_queue.stop()
+    await metrics_server.stop()
+    await async_database_manager.dispose()
+
+
+def build_application(builder: ApplicationBuilder) -> Application:
+    app = (
+        builder
+        .concurrent_updates(OrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+
+    def command(name: str, callback) -> CommandHandler:
+        return CommandHandler(name, instrument_handler(name, callback))
+
+    group_callback_handler = CallbackQueryHandler(instrument_handler("group_callback", receive_group_callback))
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler("set_group", set_group_command)],
+        entry_points=[command("set_group", set_group_command)],
         states={
-            WAITING_FOR_GROUP: [receive_group_callback],
+            WAITING_FOR_GROUP: [group_callback_handler],
         },
         fallbacks=[],
         per_message=True
     )
 
     # Commands
-    app.add_handler(receive_group_callback)
+    app.add_handler(group_callback_handler)
 
     app.add_handler(conv_handler)
-    app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("today", today_command))
-    app.add_handler(CommandHandler("tomorrow", tomorrow_command))
-    app.add_handler(CommandHandler("set_group", set_group_command))
-    app.add_handler(CommandHandler("week", week_command))
-    app.add_handler(CommandHandler("two_weeks", two_week_command))
+    app.add_handler(command("start", start_command))
+    app.add_handler(command("help", help_command))
+    app.add_handler(command("today", today_command))
+    app.add_handler(command("tomorrow", tomorrow_command))
+    app.add_handler(command("set_group", set_group_command))
+    app.add_handler(command("week", week_command))
+    app.add_handler(command("two_weeks", two_week_command))
+    app.add_handler(command("remind", remind_command))
     app.add_error_handler(error_handler)
 
     # Messages
-    app.add_handler(MessageHandler(filters.TEXT, handle_message))
+    app.add_handler(MessageHandler(filters.TEXT, instrument_handler("message", handle_message)))
+    return app
+
+
+def run(app: Application) -> None:
+    if BOT_MODE == "webhook" and WEBHOOK_URL:
+        # telegram sends the token back in X-Telegram-Bot-Api-Secret-Token, a fresh one is set on every start
+        secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        logger_bot.info(f"Bot webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=secret_token,
+        )
+        return
+
+    if BOT_MODE == "webhook":
+        logger_bot.warning("BOT_MODE is webhook but WEBHOOK_URL is not set, falling back to polling")
 
     logger_bot.info("Bot polling")
-    app.run_polling(poll_interval=1)
\ No newline at end of file
+    app.run_polling(poll_interval=POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    logger_bot.info("Bot is started")
+    run(build_application(Application.builder().token(BOT_TOKEN)))
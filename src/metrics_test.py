@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from utils.metrics import (Counter, Histogram, MetricsServer, Registry, SQL_DURATION, SQL_ERRORS, HANDLER_DURATION,
+                           HANDLER_ERRORS, collect_stats, instrument_engine, instrument_handler)
+
+
+class TestExposition(unittest.TestCase):
+    def test_counter_histogram_and_collected_stats(self):
+        registry = Registry()
+        counter = Counter("test_events_total", "Events", ("kind",), registry=registry)
+        histogram = Histogram("test_duration_seconds", "Duration", buckets=(0.1, 1.0), registry=registry)
+        collect_stats("test_cache", "Cache", "cache", {"messages": lambda: {"size": 3, "hits": 7}},
+                      {"size": "gauge", "hits": "counter"}, registry=registry)
+
+        counter.labels('say "hi"').inc(2)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        self.assertEqual([
+            "# HELP test_events_total Events",
+            "# TYPE test_events_total counter",
+            'test_events_total{kind="say \\"hi\\""} 2',
+            "# HELP test_duration_seconds Duration",
+            "# TYPE test_duration_seconds histogram",
+            'test_duration_seconds_bucket{le="0.1"} 2',
+            'test_duration_seconds_bucket{le="1"} 3',
+            'test_duration_seconds_bucket{le="+Inf"} 4',
+            "test_duration_seconds_sum 3.65",
+            "test_duration_seconds_count 4",
+            "# HELP test_cache_size Cache (size)",
+            "# TYPE test_cache_size gauge",
+            'test_cache_size{cache="messages"} 3',
+            "# HELP test_cache_hits_total Cache (hits)",
+            "# TYPE test_cache_hits_total counter",
+            'test_cache_hits_total{cache="messages"} 7',
+        ], registry.render().splitlines())
+
+
+class TestInstrumentation(unittest.IsolatedAsyncioTestCase):
+    async def test_handler_duration_and_errors(self):
+        async def handler(update, context):
+            if update == "bad":
+                raise ValueError(update)
+            return 1
+
+        wrapped = instrument_handler("test_handler", handler)
+        self.assertEqual(1, await wrapped("good", None))
+        with self.assertRaises(ValueError):
+            await wrapped("bad", None)
+        self.assertEqual(2, HANDLER_DURATION.labels("test_handler").count)
+        self.assertEqual(1, HANDLER_ERRORS.labels("test_handler").value)
+
+    async def test_sql_statements(self):
+        engine = create_engine("sqlite://")
+        instrument_engine(engine, "test")
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("select 2"))
+            with self.assertRaises(OperationalError):
+                connection.execute(text("SELECT * FROM missing"))
+        engine.dispose()
+
+        # failed statements are timed too
+        self.assertEqual(3, SQL_DURATION.labels("test", "SELECT").count)
+        self.assertEqual(1, SQL_ERRORS.labels("test").value)
+
+    async def test_metrics_endpoint(self):
+        registry = Registry()
+        Counter("test_requests_total", "Requests", registry=registry).inc()
+        server = MetricsServer(registry)
+        await server.start("127.0.0.1", 0)
+        try:
+            responses = []
+            for path in ("/metrics", "/"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+                responses.append((await reader.read()).decode())
+                writer.close()
+        finally:
+            await server.stop()
+
+        self.assertTrue(responses[0].startswith("HTTP/1.1 200 OK"))
+        self.assertIn("text/plain; version=0.0.4", responses[0])
+        self.assertTrue(responses[0].endswith("test_requests_total 1\n"))
+        self.assertTrue(responses[1].startswith("HTTP/1.1 404"))
+
+
+if __name__ == '__main__':
+    unittest.main()
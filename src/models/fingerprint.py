@@ -0,0 +1,12 @@
+from sqlalchemy import String, Text
+from sqlalchemy.orm import mapped_column, Mapped
+
+from models.base import Base
+
+
+class ScheduleFingerprint(Base):
+    __tablename__ = "schedule_fingerprints"
+
+    # "<file>", "<file>|<sheet>" or "<file>|<sheet>|<lesson date>"
+    key: Mapped[str] = mapped_column(Text, nullable=False, unique=True, index=True)
+    digest: Mapped[str] = mapped_column(String(64), nullable=False)
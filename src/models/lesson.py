@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Integer, String, ForeignKey,
-    Time, Date, CheckConstraint, Column
+    Time, Date, CheckConstraint, Column, Index
 )
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -12,6 +12,8 @@ from models.subject import Subject
 class LessonGroup(Base):
     __tablename__ = "group_lesson"
 
+    # (group_id, lesson_id) is the key, no surrogate id
+    id = None
     group_id = Column(ForeignKey("groups.id", ondelete="CASCADE"), primary_key=True)
     lesson_id = Column(ForeignKey("lessons.id", ondelete="CASCADE"), primary_key=True)
 
@@ -19,6 +21,11 @@ class LessonGroup(Base):
     lesson = relationship("Lesson", back_populates="groups")
     group = relationship("Group", back_populates="lessons")
 
+    __table_args__ = (
+        # the primary key serves group_id lookups, this one lesson deletes and their cascade
+        Index("ix_group_lesson_lesson_id", "lesson_id"),
+    )
+
 
 class LessonTime(Base):
     __tablename__ = 'lesson_time'
@@ -48,4 +55,13 @@ class Lesson(Base):
 
     subject: Mapped["Subject"] = relationship()
     lesson_time: Mapped["LessonTime"] = relationship("LessonTime", foreign_keys=[lesson_number])
-    groups: Mapped[list["LessonGroup"]] = relationship("LessonGroup", back_populates="lesson")
\ No newline at end of file
+    groups: Mapped[list["LessonGroup"]] = relationship("LessonGroup", back_populates="lesson")
+
+    __table_args__ = (
+        # schedule reads filter by date range and order by lesson number, the included columns
+        # let postgres answer them from the index alone
+        Index("ix_lessons_lesson_date_lesson_number", "lesson_date", "lesson_number",
+              postgresql_include=["id", "subject_id", "lesson_type"]),
+        # deleting a subject cascades to its lessons, and orphaned subjects are found by subject_id
+        Index("ix_lessons_subject_id", "subject_id"),
+    )
\ No newline at end of file
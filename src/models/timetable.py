@@ -0,0 +1,33 @@
+from datetime import date, time
+from typing import Optional
+
+from sqlalchemy import Column, Date, ForeignKey, Index, Integer, Text, Time
+from sqlalchemy.orm import Mapped, mapped_column
+
+from models.base import Base
+from models.lesson import lesson_type_enum
+
+
+class GroupTimetable(Base):
+    """Denormalized copy of lessons x group_lesson x subjects x lesson_time, rebuilt per group on import.
+    Schedule reads are a range scan of ix_group_timetable_group_date."""
+    __tablename__ = "group_timetable"
+
+    # (group_id, lesson_id) is the key, no surrogate id
+    id = None
+    group_id = Column(ForeignKey("groups.id", ondelete="CASCADE"), primary_key=True)
+    lesson_id = Column(ForeignKey("lessons.id", ondelete="CASCADE"), primary_key=True)
+
+    lesson_date: Mapped[date] = mapped_column(Date, nullable=False)
+    lesson_number: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    lesson_type: Mapped[Optional[str]] = mapped_column(lesson_type_enum, nullable=True)
+    subject_name: Mapped[str] = mapped_column(Text, nullable=False)
+    start_time: Mapped[Optional[time]] = mapped_column(Time, nullable=True)
+    end_time: Mapped[Optional[time]] = mapped_column(Time, nullable=True)
+
+    __table_args__ = (
+        Index("ix_group_timetable_group_date", "group_id", "lesson_date", "lesson_number",
+              postgresql_include=["lesson_type", "subject_name", "start_time", "end_time"]),
+        # the key leads with group_id, lesson deletes and their cascade look rows up by lesson_id
+        Index("ix_group_timetable_lesson_id", "lesson_id"),
+    )
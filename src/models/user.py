@@ -1,3 +1,5 @@
+from typing import Optional
+
 from sqlalchemy import Integer, ForeignKey, DateTime
 from sqlalchemy.orm import relationship, mapped_column, Mapped
 from sqlalchemy.sql import func
@@ -11,5 +13,7 @@ class User(Base):
     created_at: Mapped[DateTime] = mapped_column(DateTime, server_default=func.now())
     tg_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True, unique=True)
     group_id: Mapped[Group] = mapped_column(Integer, ForeignKey("groups.id", ondelete="SET NULL"), nullable=True)
+    # minutes before each lesson to send a reminder, NULL when the user has not opted in
+    reminder_minutes: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     group = relationship("Group")
\ No newline at end of file
@@ -1,10 +1,20 @@
+import logging
+import multiprocessing
 import os
-from typing import Optional, Dict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from typing import Optional, Dict, Iterator, List, Tuple, Sequence
+from xml.etree.ElementTree import iterparse
 
 import openpyxl
+from openpyxl.utils import range_boundaries
 from openpyxl.workbook import Workbook
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
 from openpyxl.worksheet.worksheet import Worksheet
 
+logger_parser = logging.getLogger("parser")
 
 DATE_COLUMN = 0
 GROUP_COLUMN = 0
@@ -23,31 +33,47 @@ def enrich_with(func_to_run):
         return wrapper
     return decorator
 
-def get_date_from_sheet(worksheet: Worksheet, row: int, column: int, flat=True):
-    while worksheet.cell(row, DATE_COLUMN).value is None:
-        row -= 1
+@dataclass
+class SheetLayout:
+    """Per-sheet lookup tables, indexed by row (dates, groups) or column (lesson_numbers)."""
+    worksheet: Worksheet
+    dates: list
+    groups: list
+    lesson_numbers: list
+
+def build_sheet_layout(worksheet: Worksheet) -> SheetLayout:
+    """Forward-fill dates and read group names once, so per-cell lookups are list indexes."""
+    dates = [None]
+    groups = [None]
+    lesson_date = None
+    for values in worksheet.iter_rows(1, worksheet.max_row, 1, max(DATE_COLUMN, GROUP_COLUMN), values_only=True):
+        if values[DATE_COLUMN - 1] is not None:
+            lesson_date = values[DATE_COLUMN - 1]
+        dates.append(lesson_date)
+        groups.append(values[GROUP_COLUMN - 1])
+
+    header, = worksheet.iter_rows(LESSON_NUMBER_ROW, LESSON_NUMBER_ROW, 1, worksheet.max_column, values_only=True)
+    lesson_numbers = [None] + [int(value) if isinstance(value, int) else None for value in header]
+
+    return SheetLayout(worksheet, dates, groups, lesson_numbers)
+
+def get_date_from_sheet(layout: SheetLayout, row: int, column: int, flat=True):
     if flat:
-        return worksheet.cell(row, DATE_COLUMN).value
+        return layout.dates[row]
     else:
-        return {'lesson_date': worksheet.cell(row, DATE_COLUMN).value}
+        return {'lesson_date': layout.dates[row]}
 
-def get_groups(worksheet: Worksheet, row: int, column: int, flat=True):
+def get_groups(layout: SheetLayout, row: int, column: int, flat=True):
     if flat:
-        return worksheet.cell(row, GROUP_COLUMN).value
+        return layout.groups[row]
     else:
-        return {'groups': [worksheet.cell(row, GROUP_COLUMN).value]}
+        return {'groups': [layout.groups[row]]}
 
-def get_lesson_number(worksheet: Worksheet, row: int, column: int, flat=True):
+def get_lesson_number(layout: SheetLayout, row: int, column: int, flat=True):
     if flat:
-        if isinstance(worksheet.cell(LESSON_NUMBER_ROW, column).value, int):
-            return int(worksheet.cell(LESSON_NUMBER_ROW, column).value)
-        else:
-            return None
+        return layout.lesson_numbers[column]
     else:
-        if isinstance(worksheet.cell(LESSON_NUMBER_ROW, column).value, int):
-            return {'lesson_number': int(worksheet.cell(LESSON_NUMBER_ROW, column).value)}
-        else:
-            return {'lesson_number': None}
+        return {'lesson_number': layout.lesson_numbers[column]}
 
 
 # cell_content = subject type auditorium
@@ -61,8 +87,8 @@ def get_lesson_number(worksheet: Worksheet, row: int, column: int, flat=True):
 @enrich_with(get_date_from_sheet)
 @enrich_with(get_groups)
 @enrich_with(get_lesson_number)
-def get_lesson_info(worksheet: Worksheet, row: int, column: int, flat=True) -> Optional[Dict]:
-    lesson_info: str = worksheet.cell(row, column).value
+def get_lesson_info(layout: SheetLayout, row: int, column: int, flat=True) -> Optional[Dict]:
+    lesson_info: str = layout.worksheet.cell(row, column).value
     if not lesson_info:
         return {'lesson_info': None}
 
@@ -94,53 +120,130 @@ def find_anchors(worksheet: Worksheet):
     DATE_COLUMN = get_cell_with_text(worksheet, 'vilnius time', 1, 1, 10, 10).column
     LESSON_NUMBER_ROW = group_cell.row
 
-def get_lesson_info_from_merged_cells(worksheet: Worksheet):
+MergedIndex = Dict[Tuple[int, int], Tuple[int, int, int, int]]
+
+def build_merged_index(worksheet: Worksheet) -> MergedIndex:
+    """Map every (row, column) covered by a merged range to the range bounds, built once per sheet."""
+    index = {}
+    for merged_range in worksheet.merged_cells.ranges:
+        left, up, right, down = bounds = merged_range.bounds
+        for row in range(up, down + 1):
+            for column in range(left, right + 1):
+                index[(row, column)] = bounds
+    return index
+
+def get_lesson_info_from_merged_cells(layout: SheetLayout, merged_index: MergedIndex):
     results = []
-    for merged_range in tuple(worksheet.merged_cells.ranges):
-        left, up, right, down = merged_range.bounds
+    for left, up, right, down in dict.fromkeys(merged_index.values()):
         if down < FIRST_WEEK_ROW:
             continue
 
-        value = worksheet.cell(row=up, column=left).value
+        value = layout.worksheet.cell(row=up, column=left).value
         result = {
             'lesson_info': value,
-            'lesson_number': get_lesson_number(worksheet, up, left),
-            'groups': [get_groups(worksheet, row, left) for row in range(up, down + 1)],
-            'lesson_date': get_date_from_sheet(worksheet, up, left),
+            'lesson_number': get_lesson_number(layout, up, left),
+            'groups': layout.groups[up:down + 1],
+            'lesson_date': get_date_from_sheet(layout, up, left),
         }
         if all(result.values()):
             results.append(result)
         else:
-            print(result)
+            logger_parser.warning(f"Incomplete lesson skipped: {result}")
 
-        worksheet.unmerge_cells(start_row=up, start_column=left, end_row=down, end_column=right)
-        for row in worksheet.iter_rows(up, down, left, right):
-            for cell in row:
-                cell.value = None
     return results
 
-def expand_merged_cells(worksheet: Worksheet):
-    for merged_range in tuple(worksheet.merged_cells.ranges):
-        left, up, right, down = merged_range.bounds
-        value = worksheet.cell(row=up, column=left).value
-        worksheet.unmerge_cells(start_row=up, start_column=left, end_row=down, end_column=right)
+def get_all_groups(worksheet: Worksheet):
+    groups = []
+    for (value,) in worksheet.iter_rows(FIRST_WEEK_ROW, None, GROUP_COLUMN, GROUP_COLUMN, values_only=True):
+        if str(value) in groups:
+            break
+        groups.append(str(value))
 
-        for row in worksheet.iter_rows(up, down, left, right):
-            for cell in row:
-                cell.value = value
+    return groups
 
+MERGE_CELL_TAG = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}mergeCell'
+
+def open_sheet_xml(worksheet: ReadOnlyWorksheet):
+    # openpyxl has no public way to reach the xml of a read-only sheet, and read-only sheets never load
+    # merged_cells. _get_source() opens the sheet's part of the archive, the only place merged ranges can be
+    # read from without loading the whole sheet. Kept in one place in case openpyxl renames it.
+    return worksheet._get_source()
+
+def read_merged_ranges(worksheet: ReadOnlyWorksheet) -> Iterator[Tuple[int, int, int, int]]:
+    # read-only worksheets don't expose merged_cells, so <mergeCell> elements are streamed from the sheet xml
+    with open_sheet_xml(worksheet) as source:
+        for _, element in iterparse(source):
+            if element.tag == MERGE_CELL_TAG:
+                yield range_boundaries(element.get('ref'))
+            element.clear()
+
+def is_complete(lesson: Dict) -> bool:
+    if all(lesson.values()):
+        return True
+
+    logger_parser.warning(f"Incomplete lesson skipped: {lesson}")
+    return False
+
+def iter_worksheet_lessons(worksheet: ReadOnlyWorksheet) -> Iterator[Dict]:
+    find_anchors(worksheet)
+    date_column, group_column, lesson_number_row, first_week_row = (
+        DATE_COLUMN, GROUP_COLUMN, LESSON_NUMBER_ROW, FIRST_WEEK_ROW
+    )
+
+    merged_by_top_row = defaultdict(list)
+    covered_columns = defaultdict(set)
+    for left, up, right, down in read_merged_ranges(worksheet):
+        if down < first_week_row:
+            continue
 
-def get_all_groups(worksheet: Worksheet):
-    first_week_row = FIRST_WEEK_ROW
-    group_column = GROUP_COLUMN
-    groups = [str(worksheet.cell(first_week_row, group_column).value)]
-    first_week_row += 1
+        merged_by_top_row[up].append((left, down))
+        for row in range(up, down + 1):
+            covered_columns[row].update(range(left, right + 1))
+
+    lesson_numbers = {}
+    lesson_date = None
+    open_merged_lessons: List[Tuple[int, Dict]] = []
+    rows = worksheet.iter_rows(1, None, 1, worksheet.max_column, values_only=True)
+    for row, values in enumerate(rows, start=1):
+        if row == lesson_number_row:
+            lesson_numbers = {column: int(value) for column, value in enumerate(values, start=1)
+                              if isinstance(value, int)}
+
+        if values[date_column - 1] is not None:
+            lesson_date = values[date_column - 1]
+        group = values[group_column - 1]
+
+        for left, down in merged_by_top_row.pop(row, ()):
+            open_merged_lessons.append((down, {
+                'lesson_info': values[left - 1],
+                'lesson_number': lesson_numbers.get(left),
+                'groups': [],
+                'lesson_date': lesson_date,
+            }))
+
+        for down, lesson in open_merged_lessons:
+            lesson['groups'].append(group)
+            if down == row and is_complete(lesson):
+                yield lesson
+        open_merged_lessons = [(down, lesson) for down, lesson in open_merged_lessons if down > row]
+
+        if row < first_week_row:
+            continue
 
-    while str(worksheet.cell(first_week_row, group_column).value) not in groups:
-        groups.append(str(worksheet.cell(first_week_row, group_column).value))
-        first_week_row += 1
+        covered = covered_columns.pop(row, ())
+        for column in range(group_column + 1, len(values) + 1):
+            value = values[column - 1]
+            if value is None or column in covered:
+                continue
 
-    return groups
+            lesson = {
+                'lesson_info': value,
+                'lesson_number': lesson_numbers.get(column),
+                'groups': [group],
+                'lesson_date': lesson_date,
+            }
+            if is_complete(lesson):
+                yield lesson
 
 def merge_dicts(dictionary1, dictionary2):
     for key, value in dictionary2.items():
@@ -149,6 +252,42 @@ def merge_dicts(dictionary1, dictionary2):
         else:
             dictionary1[key] = value
 
+def load_sheet(file_path: str, title: str) -> Dict[str, list]:
+    """Parse one worksheet of a file in read-only mode, top-level so it can run in a worker process.
+    The lessons come back as one list: the importer fingerprints and diffs a sheet as a whole, and a result
+    has to be pickled to cross the process boundary anyway. Memory grows with the largest sheet times the
+    results iter_sheets keeps in flight, not with the workbook."""
+    workbook: Workbook = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        worksheet = workbook[title]
+        # iter_worksheet_lessons finds the anchors get_all_groups reads
+        lessons = list(iter_worksheet_lessons(worksheet))
+        return {'lessons': lessons, 'groups': get_all_groups(worksheet)}
+    finally:
+        workbook.close()
+
+class RecordCollector(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # formatted here, the arguments of a record may not survive pickling
+        record.msg, record.args, record.exc_info = record.getMessage(), None, None
+        self.records.append(record)
+
+def load_sheet_in_worker(file_path: str, title: str) -> Tuple[Dict[str, list], List[logging.LogRecord]]:
+    """load_sheet for a pool worker: its parser log records are returned with the sheet and logged by the
+    parent, worker processes have no logging pipeline of their own."""
+    collector = RecordCollector()
+    logger_parser.addHandler(collector)
+    logger_parser.propagate = False
+    try:
+        return load_sheet(file_path, title), collector.records
+    finally:
+        logger_parser.removeHandler(collector)
+        logger_parser.propagate = True
+
 class ScheduleParser:
     def __init__(self) -> None:
         self.__ignore_words: tuple = ('holiday',)
@@ -171,24 +310,108 @@ class ScheduleParser:
     def load_worksheet(self, worksheet: Worksheet) -> Dict[str, ...]:
         result = {}
         find_anchors(worksheet)
-        result['lessons'] = get_lesson_info_from_merged_cells(worksheet)
-        result['lessons'].extend(self.get_all_lessons(worksheet))
+        merged_index = build_merged_index(worksheet)
+        layout = build_sheet_layout(worksheet)
+        result['lessons'] = get_lesson_info_from_merged_cells(layout, merged_index)
+        result['lessons'].extend(self.get_all_lessons(layout, merged_index))
         result['groups'] = get_all_groups(worksheet)
         return result
 
-    def get_all_lessons(self, worksheet: Worksheet):
+    def get_all_lessons(self, layout: SheetLayout, merged_index: MergedIndex):
         result = []
-        for row in range(FIRST_WEEK_ROW, worksheet.max_row + 1):
-            for col in range(GROUP_COLUMN + 1, worksheet.max_column + 1):
-                if worksheet.cell(row, col).value is not None:
-                    info = get_lesson_info(worksheet, row, col, flat=False)
+        worksheet = layout.worksheet
+        rows = worksheet.iter_rows(FIRST_WEEK_ROW, worksheet.max_row, GROUP_COLUMN + 1, worksheet.max_column,
+                                   values_only=True)
+        for row, values in enumerate(rows, start=FIRST_WEEK_ROW):
+            for col, value in enumerate(values, start=GROUP_COLUMN + 1):
+                if (row, col) in merged_index:
+                    continue
+
+                if value is not None:
+                    info = get_lesson_info(layout, row, col, flat=False)
                     if all(info.values()):
                         result.append(info)
                     else:
-                        print(info)
+                        logger_parser.warning(f"Incomplete lesson skipped: {info}")
 
         return result
 
+    def iter_file(self, file_path: str) -> Iterator[Dict]:
+        """Streaming counterpart of load_file: the workbook is opened read-only and complete lessons
+        are yielded one by one in sheet row order, without touching the worksheet."""
+        for _, _, lessons in self.iter_worksheets(file_path):
+            yield from lessons
+
+    def iter_worksheets(self, file_path: str) -> Iterator[Tuple[str, List[str], Iterator[Dict]]]:
+        """Yield (title, groups, lessons) per worksheet, lessons have to be consumed before the next sheet."""
+        workbook: Workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            for worksheet in workbook.worksheets:
+                if worksheet.title in self.__ignore_worksheet:
+                    continue
+
+                find_anchors(worksheet)
+                yield worksheet.title, get_all_groups(worksheet), iter_worksheet_lessons(worksheet)
+        finally:
+            workbook.close()
+
+    def get_sheet_titles(self, file_path: str) -> List[str]:
+        workbook: Workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            return [title for title in workbook.sheetnames if title not in self.__ignore_worksheet]
+        finally:
+            workbook.close()
+
+    def iter_sheets(self, file_paths: Sequence[str], workers: int = 1) -> Iterator[Tuple[str, str, Dict[str, list]]]:
+        """Yield (file_path, title, sheet) for every sheet of every file in file and sheet order.
+        With workers > 1 sheets are parsed in a process pool, the order of results stays the same and at most
+        2 * workers sheets are submitted ahead of the one being consumed."""
+        tasks = [(file_path, title) for file_path in file_paths for title in self.get_sheet_titles(file_path)]
+
+        if workers <= 1 or len(tasks) <= 1:
+            for file_path, title in tasks:
+                yield file_path, title, load_sheet(file_path, title)
+            return
+
+        workers = min(workers, len(tasks))
+        # spawned, not forked: a fork would copy the logging queue and its lock without the thread draining it
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # executor.map would submit every sheet at once and hold all parsed results until the consumer,
+            # which writes to the database, catches up
+            remaining = iter(tasks)
+            pending = deque((file_path, title, executor.submit(load_sheet_in_worker, file_path, title))
+                            for file_path, title in islice(remaining, 2 * workers))
+            while pending:
+                file_path, title, future = pending.popleft()
+                sheet, records = future.result()
+                for record in records:
+                    if logger_parser.isEnabledFor(record.levelno):
+                        logger_parser.handle(record)
+                for next_path, next_title in islice(remaining, 1):
+                    pending.append((next_path, next_title,
+                                    executor.submit(load_sheet_in_worker, next_path, next_title)))
+                yield file_path, title, sheet
+
+    def load_files(self, file_paths: Sequence[str], workers: int = 1) -> Dict[str, list]:
+        data: dict[str, ...] = {}
+        for _, _, sheet in self.iter_sheets(file_paths, workers):
+            merge_dicts(data, sheet)
+        return data
+
+    def get_file_groups(self, file_path: str) -> List[str]:
+        workbook: Workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            groups = []
+            for worksheet in workbook.worksheets:
+                if worksheet.title in self.__ignore_worksheet:
+                    continue
+
+                find_anchors(worksheet)
+                groups.extend(get_all_groups(worksheet))
+            return groups
+        finally:
+            workbook.close()
+
 def get_all_file_paths(directory):
     file_paths = []
     for root, dirs, files in os.walk(directory):
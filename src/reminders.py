@@ -0,0 +1,152 @@
+"""
+Pre-lesson reminders: once a day the subscribers of every lesson are read from group_timetable and turned
+into one batch per (group, lesson, lead time), kept in a heap ordered by fire time. A single task sleeps
+until the earliest batch is due and fans it out to the subscribed chats.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import now_local, tz
+from db import QueryFailed, async_database_manager, format_time
+
+logger_reminders = logging.getLogger("reminders")
+
+
+class ReminderBatch(NamedTuple):
+    fire_at: datetime
+    group_id: int
+    lesson_number: Optional[int]
+    minutes: int
+    text: str
+    chat_ids: Tuple[int, ...]
+
+
+def make_reminder_text(minutes: int, start_time: time, subject_names: List[str]) -> str:
+    return (f"Your next lesson starts in <b>{minutes} min</b> at {format_time(start_time)}:\n"
+            + "\n".join(f"<b>{subject_name}</b>" for subject_name in subject_names))
+
+
+def build_reminder_batches(rows, day: date) -> List[ReminderBatch]:
+    """rows as returned by AsyncDBManager.get_reminder_subscribers"""
+    slots: Dict[tuple, Tuple[time, Dict[str, None], Dict[int, None]]] = {}
+    for group_id, lesson_number, start_time, subject_name, tg_id, minutes in rows:
+        # a group may have several lessons (subgroups) in one slot, they share one reminder
+        slot = slots.setdefault((group_id, lesson_number, minutes), (start_time, {}, {}))
+        slot[1][subject_name] = None
+        slot[2][tg_id] = None
+
+    return [
+        ReminderBatch(
+            fire_at=tz.localize(datetime.combine(day, start_time)) - timedelta(minutes=minutes),
+            group_id=group_id,
+            lesson_number=lesson_number,
+            minutes=minutes,
+            text=make_reminder_text(minutes, start_time, list(subject_names)),
+            chat_ids=tuple(chat_ids),
+        )
+        for (group_id, lesson_number, minutes), (start_time, subject_names, chat_ids) in slots.items()
+    ]
+
+
+class ReminderScheduler:
+    def __init__(self, manager=async_database_manager, retry_delay: float = 5.0,
+                 max_retry_delay: float = 300.0) -> None:
+        self.manager = manager
+        # a failed load is retried after retry_delay seconds, doubled up to max_retry_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._heap: List[Tuple[datetime, int, ReminderBatch]] = []
+        self._wakeup = asyncio.Event()
+        self._reload_needed = True
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Set[asyncio.Task] = set()
+        self.batches_fired = 0
+        self.reminders_sent = 0
+
+    async def load(self, day: date, after: datetime) -> None:
+        """Schedule the batches of day that fire after the given moment."""
+        batches = build_reminder_batches(await self.manager.get_reminder_subscribers(day), day)
+        self._heap = [(batch.fire_at, index, batch) for index, batch in enumerate(batches) if batch.fire_at > after]
+        heapq.heapify(self._heap)
+        logger_reminders.info(f"{len(self._heap)} reminder batches scheduled for {day}.")
+
+    def pop_due(self, now: datetime) -> List[ReminderBatch]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def reload(self) -> None:
+        """Re-read today's subscribers, e.g. after a user changed reminders or group."""
+        self._reload_needed = True
+        self._wakeup.set()
+
+    async def fire(self, batch: ReminderBatch, send: Callable[[int, str], Awaitable]) -> None:
+        self.batches_fired += 1
+        # submitted together, so the send queue can batch and pace them under its rate limits
+        results = await asyncio.gather(*(send(chat_id, batch.text) for chat_id in batch.chat_ids),
+                                       return_exceptions=True)
+        for chat_id, result in zip(batch.chat_ids, results):
+            if isinstance(result, Exception):
+                logger_reminders.error(f"Reminder to {chat_id} failed: {result}")
+            else:
+                self.reminders_sent += 1
+
+    async def run(self, send: Callable[[int, str], Awaitable]) -> None:
+        day = None
+        # everything up to checked_at has been fired, reminders missed while the bot was down are dropped
+        checked_at = now_local()
+        retry_delay = self.retry_delay
+        retry_at = None
+        while True:
+            now = now_local()
+            if (now.date() != day or self._reload_needed) and (retry_at is None or now >= retry_at):
+                day = now.date()
+                self._reload_needed = False
+                try:
+                    await self.load(day, checked_at)
+                    retry_at, retry_delay = None, self.retry_delay
+                except QueryFailed:
+                    # the batches loaded before stay scheduled until the day is read again
+                    self._reload_needed = True
+                    retry_at = now + timedelta(seconds=retry_delay)
+                    logger_reminders.warning(f"Reminders of {day} not loaded, retrying in {retry_delay:.0f} s.")
+                    retry_delay = min(retry_delay * 2, self.max_retry_delay)
+
+            checked_at = now
+            for batch in self.pop_due(now):
+                # a slow fan-out must not delay the next batch
+                task = asyncio.create_task(self.fire(batch, send))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+            next_day = tz.localize(datetime.combine(day + timedelta(days=1), time(0)))
+            next_at = min(self._heap[0][0], next_day) if self._heap else next_day
+            if retry_at is not None:
+                next_at = min(next_at, retry_at)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max((next_at - now).total_seconds(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, send: Callable[[int, str], Awaitable]) -> None:
+        self._task = asyncio.create_task(self.run(send))
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "scheduled": len(self._heap),
+            "batches_fired": self.batches_fired,
+            "reminders_sent": self.reminders_sent,
+        }
+
+
+reminder_scheduler = ReminderScheduler()
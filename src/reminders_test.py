@@ -0,0 +1,130 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import date, datetime, time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ASYNC_DATABASE_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import text
+
+from config import tz
+from db import AsyncDBManager, QueryFailed
+from models.lesson import LessonTime
+from reminders import ReminderBatch, ReminderScheduler, build_reminder_batches
+
+DAY = date(2025, 3, 3)
+
+
+class TestReminders(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = AsyncDBManager(f"sqlite+aiosqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}")
+        await self.manager.create_all()
+        async with self.manager.atomic() as session:
+            session.add_all([
+                LessonTime(lesson_number=1, start_time=time(9, 0), end_time=time(10, 30)),
+                LessonTime(lesson_number=2, start_time=time(10, 40), end_time=time(12, 10)),
+            ])
+        await self.manager.create_group(name="Group A")
+        await self.manager.create_group(name="Group B")
+        await self.manager.create_lesson_and_add_groups(["Group A", "Group B"], DAY, 1, "Math", None)
+        await self.manager.create_lesson_and_add_groups(["Group A"], DAY, 2, "Physics", None)
+        await self.manager.create_lesson_and_add_groups(["Group A"], DAY, 2, "Chemistry", None)
+        await self.manager.create_lesson_and_add_groups(["Group A"], date(2025, 3, 4), 1, "Math", None)
+
+        for tg_id, group_name, minutes in ((1, "Group A", 10), (2, "Group A", 10), (3, "Group A", 30),
+                                           (4, "Group B", None), (5, "Group B", 5)):
+            await self.manager.attach_user_to_group(tg_id, group_name)
+            if minutes:
+                self.assertTrue(await self.manager.set_user_reminder(tg_id, minutes))
+
+    async def asyncTearDown(self):
+        await self.manager.dispose()
+        self.directory.cleanup()
+
+    async def test_one_batch_per_group_lesson_and_lead_time(self):
+        batches = build_reminder_batches(await self.manager.get_reminder_subscribers(DAY), DAY)
+        summary = sorted((batch.fire_at, batch.lesson_number, batch.minutes, batch.chat_ids) for batch in batches)
+        self.assertEqual([
+            (tz.localize(datetime(2025, 3, 3, 8, 30)), 1, 30, (3,)),
+            (tz.localize(datetime(2025, 3, 3, 8, 50)), 1, 10, (1, 2)),
+            (tz.localize(datetime(2025, 3, 3, 8, 55)), 1, 5, (5,)),
+            (tz.localize(datetime(2025, 3, 3, 10, 10)), 2, 30, (3,)),
+            (tz.localize(datetime(2025, 3, 3, 10, 30)), 2, 10, (1, 2)),
+        ], summary)
+        text = next(batch.text for batch in batches if batch.lesson_number == 2 and batch.minutes == 10)
+        self.assertIn("<b>Physics</b>\n<b>Chemistry</b>", text)
+
+    async def test_scheduler_fires_due_batches_in_order(self):
+        scheduler = ReminderScheduler(self.manager)
+        await scheduler.load(DAY, after=tz.localize(datetime(2025, 3, 3, 8, 40)))
+        self.assertEqual(4, scheduler.get_stats()["scheduled"])
+
+        due = scheduler.pop_due(tz.localize(datetime(2025, 3, 3, 10, 15)))
+        self.assertEqual([(1, 10), (1, 5), (2, 30)], [(batch.lesson_number, batch.minutes) for batch in due])
+
+        sent = []
+
+        async def send(chat_id, text):
+            sent.append(chat_id)
+
+        for batch in due:
+            await scheduler.fire(batch, send)
+        self.assertEqual([1, 2, 5, 3], sent)
+        self.assertEqual({"scheduled": 1, "batches_fired": 3, "reminders_sent": 4}, scheduler.get_stats())
+
+    async def test_fire_sends_batch_concurrently(self):
+        scheduler = ReminderScheduler(self.manager)
+        batch = ReminderBatch(tz.localize(datetime(2025, 3, 3, 9)), 1, 1, 10, "text", (1, 2, 3))
+        started = []
+        seen = []
+
+        async def send(chat_id, text):
+            started.append(chat_id)
+            await asyncio.sleep(0)
+            seen.append(len(started))
+            if chat_id == 2:
+                raise RuntimeError("blocked")
+
+        await scheduler.fire(batch, send)
+        # every send has started before the first one finishes
+        self.assertEqual([3, 3, 3], seen)
+        self.assertEqual({"batches_fired": 1, "reminders_sent": 2}, {
+            key: value for key, value in scheduler.get_stats().items() if key != "scheduled"
+        })
+
+    async def test_failed_load_is_retried(self):
+        async with self.manager.engine.begin() as connection:
+            await connection.execute(text("ALTER TABLE group_timetable RENAME TO group_timetable_moved"))
+        scheduler = ReminderScheduler(self.manager, retry_delay=0.01)
+        with self.assertRaises(QueryFailed):
+            await scheduler.load(DAY, after=tz.localize(datetime(2025, 3, 3, 8, 40)))
+
+        attempts = []
+        loaded = asyncio.Event()
+        load = scheduler.load
+
+        async def recording_load(day, after):
+            attempts.append(day)
+            await load(day, after)
+            loaded.set()
+
+        async def send(chat_id, text):
+            pass
+
+        scheduler.load = recording_load
+        task = asyncio.create_task(scheduler.run(send))
+        try:
+            await asyncio.sleep(0.1)
+            async with self.manager.engine.begin() as connection:
+                await connection.execute(text("ALTER TABLE group_timetable_moved RENAME TO group_timetable"))
+            await asyncio.wait_for(loaded.wait(), timeout=5)
+        finally:
+            task.cancel()
+        self.assertGreater(len(attempts), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Retention of past lessons, run once a day by the celery beat entry of celery_configs.tasks.daily_task.
+Lessons older than RETENTION_DAYS are deleted in batches of short transactions while the bot keeps serving,
+optionally appended to a gzipped CSV archive first, then subjects no lesson refers to are deleted and postgres
+is asked to vacuum the tables so the freed space is reused instead of growing them.
+"""
+import csv
+import gzip
+import logging
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+from config import (now_local, RETENTION_DAYS, RETENTION_BATCH_SIZE, RETENTION_BATCH_PAUSE,
+                    RETENTION_ARCHIVE)
+from db import DBManager, ARCHIVE_COLUMNS
+
+logger_retention = logging.getLogger("retention")
+
+VACUUM_TABLES = ("group_timetable", "group_lesson", "lessons", "subjects")
+
+
+class LessonArchive:
+    """Appends the rows of deleted lessons to a gzipped CSV, every run adds a gzip member so the file stays
+    readable as one stream (zcat, gzip.open)."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = None
+        self.writer = None
+        self.written = 0
+
+    def __enter__(self) -> "LessonArchive":
+        new_file = not self.exists()
+        self.file = gzip.open(self.path, "at", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        if new_file:
+            self.writer.writerow(ARCHIVE_COLUMNS)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.file.close()
+
+    def exists(self) -> bool:
+        try:
+            with open(self.path, "rb") as file:
+                return bool(file.read(1))
+        except FileNotFoundError:
+            return False
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.writer.writerow(
+                ";".join(row[column]) if column == "groups" else row[column] for column in ARCHIVE_COLUMNS
+            )
+        # the batch is committed right after, keep it on disk before its rows are gone
+        self.file.flush()
+        self.written += len(rows)
+
+
+def run_retention(manager: DBManager, today: Optional[date] = None, days: int = RETENTION_DAYS,
+                  batch_size: int = RETENTION_BATCH_SIZE, pause: float = RETENTION_BATCH_PAUSE,
+                  archive_path: str = RETENTION_ARCHIVE) -> Dict[str, Any]:
+    if days <= 0:
+        logger_retention.info("Retention is turned off")
+        return {"before": None, "lessons": 0, "subjects": 0, "seconds": 0.0}
+
+    before = (today or now_local().date()) - timedelta(days=days)
+    started = perf_counter()
+    if archive_path:
+        with LessonArchive(archive_path) as archive:
+            lessons = manager.delete_lessons_before_date(before, batch_size, archive.write, pause)
+    else:
+        lessons = manager.delete_lessons_before_date(before, batch_size, pause=pause)
+    subjects = manager.delete_orphan_subjects(batch_size)
+    if lessons or subjects:
+        manager.vacuum(VACUUM_TABLES)
+
+    stats = {"before": before, "lessons": lessons, "subjects": subjects, "seconds": perf_counter() - started}
+    logger_retention.info(f"Retention before {before}: {lessons} lessons, {subjects} subjects deleted "
+                          f"in {stats['seconds']:.1f} s")
+    return stats
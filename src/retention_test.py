@@ -0,0 +1,83 @@
+import csv
+import gzip
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("ASYNC_DATABASE_URL", "sqlite+aiosqlite://")
+
+from sqlalchemy import select, func
+
+from db import DBManager
+from models.lesson import Lesson, LessonGroup
+from models.subject import Subject
+from models.timetable import GroupTimetable
+from retention import run_retention
+
+
+class TestRetention(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manager = DBManager(f"sqlite:///{os.path.join(self.directory.name, 'test.sqlite3')}")
+        start = date(2025, 3, 3)
+        # 10 old days of an old subject, the shared subject is kept by the lesson after the cutoff
+        lessons = [
+            {'lesson_info': 'Old subject', 'lesson_number': 1, 'groups': ['Group A', 'Group B'],
+             'lesson_date': start + timedelta(days=day)}
+            for day in range(10)
+        ]
+        lessons += [
+            {'lesson_info': 'Math', 'lesson_number': 2, 'groups': ['Group A'], 'lesson_date': start},
+            {'lesson_info': 'Math', 'lesson_number': 2, 'groups': ['Group A'], 'lesson_date': date(2025, 4, 1)},
+        ]
+        self.manager.bulk_create_lessons(['Group A', 'Group B'], lessons)
+
+    def tearDown(self):
+        self.manager.engine.dispose()
+        self.directory.cleanup()
+
+    def count(self, model) -> int:
+        with self.manager.atomic() as session:
+            return session.scalar(select(func.count()).select_from(model))
+
+    def test_batches_archive_and_orphans(self):
+        archive_path = os.path.join(self.directory.name, "archive.csv.gz")
+        stats = run_retention(self.manager, today=date(2025, 3, 31), days=1, batch_size=3, pause=0,
+                              archive_path=archive_path)
+
+        self.assertEqual((date(2025, 3, 30), 11, 1), (stats["before"], stats["lessons"], stats["subjects"]))
+        self.assertEqual(1, self.count(Lesson))
+        self.assertEqual(1, self.count(LessonGroup))
+        self.assertEqual(1, self.count(GroupTimetable))
+        with self.manager.atomic() as session:
+            self.assertEqual(["Math"], session.scalars(select(Subject.name)).all())
+
+        with gzip.open(archive_path, "rt", encoding="utf-8", newline="") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual(11, len(rows))
+        self.assertEqual({"Old subject": 10, "Math": 1}, {
+            subject: sum(row["subject"] == subject for row in rows) for subject in ("Old subject", "Math")
+        })
+        old = next(row for row in rows if row["subject"] == "Old subject" and row["lesson_date"] == "2025-03-03")
+        self.assertEqual(("1", "Group A;Group B"), (old["lesson_number"], old["groups"]))
+
+        # a second run appends to the archive without a second header
+        self.manager.bulk_create_lessons(['Group A'], [
+            {'lesson_info': 'Physics', 'lesson_number': 1, 'groups': ['Group A'], 'lesson_date': date(2025, 3, 4)},
+        ])
+        run_retention(self.manager, today=date(2025, 3, 31), days=1, batch_size=3, pause=0,
+                      archive_path=archive_path)
+        with gzip.open(archive_path, "rt", encoding="utf-8", newline="") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual(12, len(rows))
+        self.assertEqual("Physics", rows[-1]["subject"])
+
+    def test_turned_off(self):
+        self.assertEqual(0, run_retention(self.manager, today=date(2025, 3, 31), days=0)["lessons"])
+        self.assertEqual(12, self.count(Lesson))
+
+
+if __name__ == '__main__':
+    unittest.main()
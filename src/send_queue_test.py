@@ -0,0 +1,115 @@
+import asyncio
+import time
+import unittest
+from datetime import timedelta
+
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+from utils.send_queue import SendQueue, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate_and_burst(self):
+        bucket = TokenBucket(rate=10, capacity=2, now=0.0)
+        self.assertEqual(0, bucket.take(0.0))
+        self.assertEqual(0, bucket.take(0.0))
+        self.assertAlmostEqual(0.1, bucket.take(0.0))
+        self.assertEqual(0, bucket.take(0.1))
+
+        bucket.block(0.1, 1.0)
+        self.assertAlmostEqual(0.5, bucket.delay(0.6))
+        self.assertFalse(bucket.is_idle(0.6))
+        self.assertTrue(bucket.is_idle(1.5))
+
+
+class TestSendQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncTearDown(self):
+        await self.queue.stop()
+
+    def start(self, **kwargs) -> SendQueue:
+        settings = dict(rate=1000, burst=1000, chat_rate=1000, chat_burst=1000, workers=2, batch_size=4,
+                        max_retries=2, max_size=100)
+        settings.update(kwargs)
+        self.queue = SendQueue(**settings)
+        self.queue.start()
+        return self.queue
+
+    async def test_per_chat_order_and_result(self):
+        queue = self.start()
+        sent = []
+
+        async def send(chat_id, text):
+            await asyncio.sleep(0.001 * (3 - text % 3))
+            sent.append((chat_id, text))
+            return text
+
+        results = await asyncio.gather(*(queue.submit(chat_id, send, chat_id, text)
+                                         for text in range(6) for chat_id in (1, 2)))
+        self.assertEqual([text for text in range(6) for _ in (1, 2)], results)
+        for chat_id in (1, 2):
+            self.assertEqual(list(range(6)), [text for chat, text in sent if chat == chat_id])
+        self.assertEqual({"outstanding": 0, "chats": 0, "sent": 12, "retried": 0, "failed": 0, "throttled": 0},
+                         queue.get_stats())
+
+    async def test_global_and_chat_rate(self):
+        queue = self.start(rate=100, burst=1, chat_rate=20, chat_burst=1)
+        sent_at = {1: [], 2: []}
+
+        async def send(chat_id):
+            sent_at[chat_id].append(time.perf_counter())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(queue.submit(chat_id, send, chat_id) for _ in range(5) for chat_id in (1, 2)))
+        # 10 sends at 100/s overall, but each chat only gets 20/s: 4 gaps of 50 ms
+        self.assertGreaterEqual(time.perf_counter() - started, 0.19)
+        for times in sent_at.values():
+            self.assertTrue(all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:])))
+
+    async def test_retry_after_pauses_sends(self):
+        queue = self.start()
+        attempts = []
+
+        async def send(text):
+            attempts.append(time.perf_counter())
+            if len(attempts) == 1:
+                raise RetryAfter(timedelta(milliseconds=100))
+            return text
+
+        self.assertEqual("hello", await queue.submit(1, send, "hello"))
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.09)
+        self.assertEqual(1, queue.get_stats()["retried"])
+
+    async def test_network_errors_are_retried_bad_requests_are_not(self):
+        queue = self.start(max_retries=1)
+
+        async def timed_out():
+            raise TimedOut()
+
+        async def bad_request():
+            raise BadRequest("Message is not modified")
+
+        with self.assertRaises(TimeoutError):
+            await queue.submit(1, timed_out)
+        with self.assertRaises(BadRequest):
+            await queue.submit(2, bad_request)
+        self.assertEqual({"retried": 1, "failed": 2},
+                         {key: queue.get_stats()[key] for key in ("retried", "failed")})
+
+    async def test_back_pressure(self):
+        queue = self.start(max_size=2)
+        release = asyncio.Event()
+
+        async def send():
+            await release.wait()
+
+        submitted = [asyncio.ensure_future(queue.submit(chat_id, send)) for chat_id in range(3)]
+        await asyncio.sleep(0.01)
+        # the third submit waits for a free slot before it is even queued
+        self.assertEqual(2, queue.get_stats()["chats"])
+        release.set()
+        await asyncio.gather(*submitted)
+        self.assertEqual(3, queue.get_stats()["sent"])
+
+
+if __name__ == '__main__':
+    unittest.main()
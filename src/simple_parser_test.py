@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+import openpyxl
+
+from benchmarks.workbook_generator import generate_workbook
+from parser.simple_parser import ScheduleParser, build_merged_index
+
+SCHEDULE_PATH = "schedules/Schedule.xlsx"
+
+
+def lesson_key(lesson: dict) -> tuple:
+    return lesson['lesson_info'], lesson['lesson_number'], tuple(lesson['groups']), lesson['lesson_date']
+
+
+class TestStreamingParser(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parser = ScheduleParser()
+        cls.expected = cls.parser.load_file(SCHEDULE_PATH)
+
+    def test_iter_file_yields_same_lessons(self):
+        lessons = Counter(lesson_key(lesson) for lesson in self.parser.iter_file(SCHEDULE_PATH))
+        self.assertEqual(Counter(lesson_key(lesson) for lesson in self.expected['lessons']), lessons)
+
+    def test_get_file_groups(self):
+        self.assertEqual(self.expected['groups'], self.parser.get_file_groups(SCHEDULE_PATH))
+
+    def test_parallel_load_files_matches_serial(self):
+        serial = self.parser.load_files([SCHEDULE_PATH, SCHEDULE_PATH], workers=1)
+        self.assertEqual(serial, self.parser.load_files([SCHEDULE_PATH, SCHEDULE_PATH], workers=2))
+        self.assertEqual(self.expected['groups'] * 2, serial['groups'])
+
+    def test_worker_warnings_reach_the_parent(self):
+        with self.assertLogs("parser", level="WARNING") as serial:
+            list(self.parser.iter_sheets([SCHEDULE_PATH], workers=1))
+        with self.assertLogs("parser", level="WARNING") as parallel:
+            list(self.parser.iter_sheets([SCHEDULE_PATH], workers=2))
+        self.assertEqual(serial.output, parallel.output)
+
+
+class TestGeneratedWorkbook(unittest.TestCase):
+    def test_parser_reads_generated_workbook(self):
+        with tempfile.TemporaryDirectory() as directory:
+            workbook = generate_workbook(os.path.join(directory, "Schedule.xlsx"), groups=5, weeks=2, sheets=2)
+            parser = ScheduleParser()
+            data = parser.load_file(workbook.path)
+            streamed = list(parser.iter_file(workbook.path))
+
+        self.assertEqual(workbook.groups, data['groups'])
+        self.assertEqual(workbook.lessons, len(data['lessons']))
+        self.assertEqual(workbook.merged_lessons, sum(len(lesson['groups']) > 1 for lesson in data['lessons']))
+        self.assertEqual(Counter(map(lesson_key, data['lessons'])), Counter(map(lesson_key, streamed)))
+
+
+class TestMergedIndex(unittest.TestCase):
+    def setUp(self):
+        self.workbook = openpyxl.Workbook()
+        self.worksheet = self.workbook.active
+        self.worksheet.cell(2, 3, "Math")
+        self.worksheet.merge_cells(start_row=2, start_column=3, end_row=4, end_column=3)
+
+    def test_merged_cells_map_to_range(self):
+        merged_index = build_merged_index(self.worksheet)
+        self.assertEqual((3, 2, 3, 4), merged_index[(4, 3)])
+        self.assertNotIn((4, 4), merged_index)
+
+    def test_worksheet_is_not_mutated(self):
+        worksheet = openpyxl.load_workbook(SCHEDULE_PATH).worksheets[0]
+        merged_ranges = len(worksheet.merged_cells.ranges)
+        parser = ScheduleParser()
+        first = parser.load_worksheet(worksheet)
+        self.assertEqual(first, parser.load_worksheet(worksheet))
+        self.assertEqual(merged_ranges, len(worksheet.merged_cells.ranges))
+
+
+if __name__ == '__main__':
+    unittest.main()
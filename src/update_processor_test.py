@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from telegram import Chat, Message, Update, User
+
+from utils.update_processor import OrderedUpdateProcessor
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    return Update(update_id, message=Message(
+        message_id=update_id, date=datetime(2025, 3, 3), chat=Chat(chat_id, Chat.PRIVATE),
+        from_user=User(chat_id, "Student", False), text="/today",
+    ))
+
+
+class TestOrderedUpdateProcessor(unittest.IsolatedAsyncioTestCase):
+    async def test_same_chat_in_order_other_chats_concurrently(self):
+        processor = OrderedUpdateProcessor(max_concurrent_updates=4)
+        release = asyncio.Event()
+        handled = []
+
+        async def handle(update_id: int, blocking: bool = False):
+            if blocking:
+                await release.wait()
+            handled.append(update_id)
+
+        tasks = [
+            asyncio.ensure_future(processor.process_update(make_update(1, 10), handle(1, blocking=True))),
+            asyncio.ensure_future(processor.process_update(make_update(2, 10), handle(2))),
+            asyncio.ensure_future(processor.process_update(make_update(3, 20), handle(3))),
+        ]
+        await asyncio.sleep(0.01)
+        self.assertEqual([3], handled)
+        self.assertEqual({"limit": 4, "in_flight": 1, "waiting": 1, "active_keys": 1, "processed": 1},
+                         processor.get_stats())
+
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual([3, 1, 2], handled)
+        self.assertEqual({"limit": 4, "in_flight": 0, "waiting": 0, "active_keys": 0, "processed": 3},
+                         processor.get_stats())
+
+    async def test_concurrency_limit(self):
+        processor = OrderedUpdateProcessor(max_concurrent_updates=2)
+        running = []
+        peak = 0
+
+        async def handle():
+            nonlocal peak
+            running.append(None)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        await asyncio.gather(*(
+            processor.process_update(make_update(chat_id, chat_id), handle()) for chat_id in range(1, 7)
+        ))
+        self.assertEqual(2, peak)
+        self.assertEqual(6, processor.get_stats()["processed"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Dict, Hashable, Iterable
+
+from config import MESSAGE_CACHE_SIZE, GROUP_KEYBOARD_CACHE_SIZE
+
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded mapping that evicts the least recently used key once maxsize is reached."""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MessageCache(LRUCache):
+    """Rendered schedule messages keyed by (group_id, start date, view)."""
+
+    def invalidate_groups(self, group_ids: Iterable[int]) -> None:
+        group_ids = set(group_ids)
+        for key in [key for key in self._data if key[0] in group_ids]:
+            del self._data[key]
+
+    def invalidate_before(self, before: date) -> None:
+        for key in [key for key in self._data if key[1] < before]:
+            del self._data[key]
+
+
+rendered_messages = MessageCache(MESSAGE_CACHE_SIZE)
+# group list and built group picker keyboards, cleared whenever groups are added
+group_keyboards = LRUCache(GROUP_KEYBOARD_CACHE_SIZE)
@@ -1,7 +1,20 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import sys
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+
 import pytz
-from config import tz
+from config import (tz, LOG_LEVEL, LOG_LEVELS, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_FORMAT, LOG_QUEUE_SIZE,
+                    LOG_CHAT_SAMPLE_RATE)
+
+# per-message logs of the handlers, the only ones that are sampled
+CHAT_LOGGER = "handlers.chat"
 
 
 class LocalTimezoneFormatter(logging.Formatter):
@@ -13,22 +26,113 @@ class LocalTimezoneFormatter(logging.Formatter):
         dt = self.converter(record.created)
         return dt.strftime("%Y-%m-%d - %H:%M:%S")
 
-formatter = LocalTimezoneFormatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 
-file_handler = logging.FileHandler("bot.log", encoding="utf-8")
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(formatter)
+class JsonFormatter(LocalTimezoneFormatter):
+    """One compact JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps about rate of the records, attached to a logger so dropped records never reach the queue."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when the writer thread falls behind."""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler.prepare folds the traceback into the message and clears exc_info, the records only cross
+        # threads, so they keep it and the formatters of the writer thread put it where their format wants it
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    """"aiosqlite=INFO, handlers=warning" -> {"aiosqlite": "INFO", "handlers": "WARNING"}"""
+    result = {}
+    for item in levels.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            result[name.strip()] = level.strip().upper()
+    return result
+
+
+def make_formatter(log_format: str) -> logging.Formatter:
+    if log_format == "json":
+        return JsonFormatter()
+    return LocalTimezoneFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def build_pipeline(handlers: List[logging.Handler], log_format: str = "text",
+                   queue_size: int = LOG_QUEUE_SIZE) -> "tuple[DroppingQueueHandler, QueueListener]":
+    """The handler to attach to loggers and the listener that writes its records with handlers in a thread."""
+    formatter = make_formatter(log_format)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(queue_size)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    return DroppingQueueHandler(log_queue), listener
+
+
+def configure_logging(file_path: Optional[str] = LOG_FILE, level: str = LOG_LEVEL, levels: str = LOG_LEVELS,
+                      log_format: str = LOG_FORMAT, chat_sample_rate: float = LOG_CHAT_SAMPLE_RATE) -> QueueListener:
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if file_path:
+        handlers.append(RotatingFileHandler(file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                            encoding="utf-8"))
+    queue_handler, listener = build_pipeline(handlers, log_format)
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    for name, logger_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    chat_logger = logging.getLogger(CHAT_LOGGER)
+    for old_filter in [old for old in chat_logger.filters if isinstance(old, SamplingFilter)]:
+        chat_logger.removeFilter(old_filter)
+    if chat_sample_rate < 1:
+        chat_logger.addFilter(SamplingFilter(chat_sample_rate))
+
+    listener.start()
+    # flush what is still queued when the process exits
+    atexit.register(listener.stop)
+    return listener
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(formatter)
 
+listener = configure_logging()
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-logger.handlers.clear()
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
 
 logger.info("Logger initialized")
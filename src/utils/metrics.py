@@ -0,0 +1,314 @@
+"""
+In-process metrics exported in the Prometheus text format (version 0.0.4) by MetricsServer on GET /metrics.
+
+Counters and histograms are updated on the hot path, so they are plain attribute updates without locks, values
+read by other threads may lag by an update. Metrics backed by existing stats (caches, pools, queues) are
+CollectedMetric instances that read the stats only when scraped. Values are per process: lessons imported by
+setup.py before the bot starts are not seen by the bot's endpoint.
+"""
+import asyncio
+import functools
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger_metrics = logging.getLogger("metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "PRAGMA"}
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        # registering a name again replaces the metric, so collected metrics can be bound to a new application
+        self._metrics[metric.name] = metric
+
+    def unregister(self, name: str) -> None:
+        self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger_metrics.error(f"Metric {metric.name} failed to render: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple, object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def make_child(self):
+        """The value object labels() returns for a new set of label values."""
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            child = self._children[values] = self.make_child()
+        return child
+
+    @abstractmethod
+    def render_child(self, labels: Tuple, child) -> List[str]:
+        """The sample lines of child, the value of the label values labels."""
+
+    def samples(self) -> Iterable[Tuple[Tuple, Any]]:
+        return list(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, child in self.samples():
+            lines.extend(self.render_child(labels, child))
+        return lines
+
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def make_child(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def render_child(self, labels: Tuple, child: CounterValue) -> List[str]:
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(child.value)}"]
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        # the last slot counts observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def make_child(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render_child(self, labels: Tuple, child: HistogramValue) -> List[str]:
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{format_labels(names, labels + (format_value(bound),))} {cumulative}")
+        label_text = format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {format_value(child.sum)}")
+        lines.append(f"{self.name}_count{label_text} {child.count}")
+        return lines
+
+
+class CollectedMetric(Metric):
+    """Gauge or counter read from collect() at scrape time, collect returns {label values: value}."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[Tuple, float]], metric_type: str = "gauge",
+                 registry: Optional[Registry] = REGISTRY) -> None:
+        self.type = metric_type
+        self.collect = collect
+        super().__init__(name, documentation, labelnames, registry)
+
+    def make_child(self):
+        raise TypeError(f"{self.name} is collected at scrape time, its values can't be set through labels()")
+
+    def samples(self) -> Iterable[Tuple[Tuple, Any]]:
+        return self.collect().items()
+
+    def render_child(self, labels: Tuple, value: Optional[float]) -> List[str]:
+        if value is None:
+            return []
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"]
+
+
+def collect_stats(name: str, documentation: str, label: str, sources: Dict[str, Callable[[], dict]],
+                  fields: Dict[str, str], registry: Optional[Registry] = REGISTRY) -> None:
+    """Export the get_stats() dicts of several objects: every field becomes the metric <name>_<field> (counters
+    get a _total suffix) of type fields[field], with the source name in the label."""
+    for field, metric_type in fields.items():
+        def collect(field=field) -> Dict[Tuple, float]:
+            return {(source,): get_stats().get(field) for source, get_stats in sources.items()}
+
+        suffix = "_total" if metric_type == "counter" else ""
+        CollectedMetric(f"{name}_{field}{suffix}", f"{documentation} ({field})", (label,), collect, metric_type,
+                        registry)
+
+
+HANDLER_DURATION = Histogram("schedbot_handler_duration_seconds", "Time spent in a bot handler", ("command",))
+HANDLER_ERRORS = Counter("schedbot_handler_errors_total", "Bot handlers that raised", ("command",))
+SQL_DURATION = Histogram("schedbot_sql_duration_seconds", "SQL statement execution time", ("engine", "statement"),
+                         buckets=SQL_BUCKETS)
+SQL_ERRORS = Counter("schedbot_sql_errors_total", "SQL statements that failed", ("engine",))
+
+
+def instrument_handler(command: str, callback: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Wrap a handler callback to record its duration and errors under command."""
+    duration = HANDLER_DURATION.labels(command)
+    errors = HANDLER_ERRORS.labels(command)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(perf_counter() - started)
+
+    return wrapper
+
+
+def get_statement_kind(statement: str) -> str:
+    # the first keyword is enough and keeps the label set small
+    words = statement[:16].split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Record the count, duration and failures of every statement executed by engine (the sync_engine of an
+    async one). Connection events (before/after_cursor_execute) would push every execute onto sqlalchemy's
+    slower event path, the dialect's do_execute hooks time the DBAPI call itself for a fraction of that."""
+    errors = SQL_ERRORS.labels(name)
+
+    def timed(execute: Callable) -> Callable:
+        def listener(cursor, statement, *args):
+            started = perf_counter()
+            try:
+                execute(cursor, statement, *args)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                SQL_DURATION.labels(name, get_statement_kind(statement)).observe(perf_counter() - started)
+            # the statement has been executed, the dialect must not run it again
+            return True
+
+        return listener
+
+    dialect = engine.dialect
+    event.listen(engine, "do_execute", timed(dialect.do_execute))
+    event.listen(engine, "do_executemany", timed(dialect.do_executemany))
+    event.listen(engine, "do_execute_no_params", timed(dialect.do_execute_no_params))
+
+
+class MetricsServer:
+    """Serves registry.render() on GET /metrics with asyncio streams, one request per connection."""
+
+    def __init__(self, registry: Registry = REGISTRY) -> None:
+        self.registry = registry
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def port(self) -> Optional[int]:
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self.handle, host, port)
+        logger_metrics.info(f"Metrics on {host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            while (await asyncio.wait_for(reader.readline(), timeout=10)).strip():
+                pass
+
+            method, path = (request_line.decode("latin-1").split() + ["", ""])[:2]
+            if method == "GET" and path.split("?", 1)[0] in ("/metrics", "/metrics/"):
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = MetricsServer()
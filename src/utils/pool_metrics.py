@@ -0,0 +1,106 @@
+from threading import Lock
+from time import perf_counter
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+
+class PoolMetrics:
+    """Connection pool counters fed by the pool events of engine.
+
+    The pool has no event before a checkout, so the wait (queueing for a free connection plus opening a new one)
+    is timed around pool.connect. Churn is the number of connections opened and closed, a healthy pool opens
+    about pool size connections once and then reuses them.
+    """
+
+    def __init__(self, engine: Engine, capacity: Optional[int] = None) -> None:
+        # None for pools without a fixed size (in-memory sqlite)
+        self.capacity = capacity
+        # sync engines check connections out from several threads
+        self._lock = Lock()
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "close", self._on_close)
+        event.listen(engine, "close_detached", self._on_close)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        # dispose() replaces the pool
+        event.listen(engine, "engine_disposed", lambda disposed: self._time_checkouts(disposed.pool))
+        self._time_checkouts(engine.pool)
+
+    def _time_checkouts(self, pool: Pool) -> None:
+        connect = pool.connect
+
+        def timed_connect():
+            started = perf_counter()
+            try:
+                return connect()
+            except PoolTimeoutError:
+                self._observe_timeout()
+                raise
+            finally:
+                self._observe_wait(perf_counter() - started)
+
+        pool.connect = timed_connect
+
+    def _on_connect(self, *args: Any) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def _on_close(self, *args: Any) -> None:
+        with self._lock:
+            self.closes += 1
+
+    def _on_invalidate(self, *args: Any) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def _on_checkout(self, *args: Any) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, *args: Any) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def _observe_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def _observe_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "capacity": self.capacity,
+                "utilisation": round(self.checked_out / self.capacity, 3) if self.capacity else None,
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "closes": self.closes,
+                "invalidations": self.invalidations,
+            }
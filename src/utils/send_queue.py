@@ -0,0 +1,229 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, NamedTuple, Optional
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from config import SEND_RATE, SEND_BURST, CHAT_SEND_RATE, CHAT_SEND_BURST, SEND_WORKERS, SEND_BATCH_SIZE, \
+    SEND_MAX_RETRIES, SEND_QUEUE_SIZE
+
+logger_send_queue = logging.getLogger("send_queue")
+
+
+class TokenBucket:
+    """rate tokens per second, at most capacity of them saved up."""
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> float:
+        """Take a token if one is available, returns delay(now)."""
+        delay = self.delay(now)
+        if not delay:
+            self.tokens -= 1
+        return delay
+
+    def block(self, now: float, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class Outgoing(NamedTuple):
+    function: Callable[..., Awaitable[Any]]
+    args: tuple
+    kwargs: dict
+    future: asyncio.Future
+    attempt: int = 0
+
+
+def get_retry_after(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+class SendQueue:
+    """Outbound Bot API calls, limited by a global and a per-chat token bucket.
+
+    Calls of one chat go out one at a time in submission order, chats with something to send take turns.
+    A 429 pauses the whole bot for retry_after seconds, network errors are retried with exponential backoff.
+    submit() waits while max_size calls are outstanding, which is the back-pressure for broadcasts."""
+
+    def __init__(self, rate: float = SEND_RATE, burst: float = SEND_BURST, chat_rate: float = CHAT_SEND_RATE,
+                 chat_burst: float = CHAT_SEND_BURST, workers: int = SEND_WORKERS, batch_size: int = SEND_BATCH_SIZE,
+                 max_retries: int = SEND_MAX_RETRIES, max_size: int = SEND_QUEUE_SIZE) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.max_size = max_size
+
+        self._global: Optional[TokenBucket] = None
+        self._chat_buckets: Dict[Hashable, TokenBucket] = {}
+        # chat -> calls waiting to be sent, a chat is in _ready (or on a timer) while its deque is not empty
+        self._chats: Dict[Hashable, Deque[Outgoing]] = {}
+        self._ready: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.throttled = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._global = TokenBucket(self.rate, self.burst, loop.time())
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for outgoing_calls in self._chats.values():
+            for outgoing in outgoing_calls:
+                outgoing.future.cancel()
+        self._chats.clear()
+
+    async def submit(self, chat_id: Hashable, function: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Run function(*args, **kwargs) once the rate limits allow it and return its result."""
+        if not self.running:
+            return await function(*args, **kwargs)
+
+        await self._slots.acquire()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._slots.release())
+        self.push(chat_id, Outgoing(function, args, kwargs, future))
+        return await future
+
+    def push(self, chat_id: Hashable, outgoing: Outgoing) -> None:
+        outgoing_calls = self._chats.get(chat_id)
+        if outgoing_calls is None:
+            outgoing_calls = self._chats[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        outgoing_calls.append(outgoing)
+
+    def get_chat_bucket(self, chat_id: Hashable, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_size:
+                # forget chats that have been quiet long enough to be back at a full bucket
+                self._chat_buckets = {
+                    key: value for key, value in self._chat_buckets.items() if not value.is_idle(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def schedule(self, chat_id: Hashable, delay: float) -> None:
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    async def worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_ids = [await self._ready.get()]
+            while len(chat_ids) < self.batch_size and not self._ready.empty():
+                chat_ids.append(self._ready.get_nowait())
+
+            sends = []
+            for chat_id in chat_ids:
+                now = loop.time()
+                delay = self.get_chat_bucket(chat_id, now).delay(now)
+                if delay:
+                    self.throttled += 1
+                    self.schedule(chat_id, delay)
+                    continue
+
+                while delay := self._global.take(now):
+                    await asyncio.sleep(delay)
+                    now = loop.time()
+                self.get_chat_bucket(chat_id, now).take(now)
+                # start now, not after the batch has waited for the global tokens of the others
+                sends.append(asyncio.ensure_future(self.deliver(chat_id)))
+
+            await asyncio.gather(*sends)
+
+    async def deliver(self, chat_id: Hashable) -> None:
+        outgoing_calls = self._chats[chat_id]
+        outgoing = outgoing_calls.popleft()
+        retry_delay = None
+        if not outgoing.future.done():
+            try:
+                result = await outgoing.function(*outgoing.args, **outgoing.kwargs)
+            except RetryAfter as e:
+                retry_delay = get_retry_after(e)
+                self._global.block(asyncio.get_running_loop().time(), retry_delay)
+                logger_send_queue.warning(f"Flood control, pausing sends for {retry_delay}s.")
+            except NetworkError as e:
+                if isinstance(e, BadRequest):
+                    self.fail(outgoing, e)
+                else:
+                    retry_delay = 0.5 * 2 ** outgoing.attempt
+                    logger_send_queue.warning(f"Send to {chat_id} failed: {e}, retrying in {retry_delay}s.")
+            except Exception as e:
+                self.fail(outgoing, e)
+            else:
+                self.sent += 1
+                if not outgoing.future.done():
+                    outgoing.future.set_result(result)
+
+        if retry_delay is not None:
+            if outgoing.attempt < self.max_retries and not outgoing.future.done():
+                self.retried += 1
+                outgoing_calls.appendleft(outgoing._replace(attempt=outgoing.attempt + 1))
+            else:
+                self.fail(outgoing, TimeoutError(f"Send to {chat_id} gave up after {outgoing.attempt} retries"))
+
+        if outgoing_calls:
+            self.schedule(chat_id, retry_delay or 0)
+        else:
+            del self._chats[chat_id]
+
+    def fail(self, outgoing: Outgoing, error: Exception) -> None:
+        self.failed += 1
+        if not outgoing.future.done():
+            outgoing.future.set_exception(error)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "outstanding": sum(len(outgoing_calls) for outgoing_calls in self._chats.values()),
+            "chats": len(self._chats),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "throttled": self.throttled,
+        }
+
+
+send_queue = SendQueue()
@@ -0,0 +1,85 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# the base class semaphore only bounds how many updates wait for their chat, the real limit is applied
+# after the per-chat lock so updates of one busy chat never hold slots other chats could run in
+MAX_PENDING_UPDATES = 2 ** 16
+
+
+def get_update_key(update: object) -> Optional[Hashable]:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return "chat", update.effective_chat.id
+    if update.effective_user:
+        return "user", update.effective_user.id
+    return None
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs up to max_concurrent_updates handlers at once, updates of the same chat (or user, for
+    updates without a chat) one after another in arrival order."""
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(MAX_PENDING_UPDATES)
+        self.limit = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        # key -> [lock, number of updates holding or waiting for it]
+        self._locks: Dict[Hashable, list] = {}
+        self.in_flight = 0
+        self.waiting = 0
+        self.processed = 0
+
+    async def initialize(self) -> None:
+        return None
+
+    async def shutdown(self) -> None:
+        return None
+
+    @asynccontextmanager
+    async def key_lock(self, key: Optional[Hashable]):
+        if key is None:
+            yield
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters first in, first out, and nothing is awaited before acquire,
+            # so updates of one key run in the order the application handed them over
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self.waiting += 1
+        running = False
+        try:
+            async with self.key_lock(get_update_key(update)), self._running:
+                self.waiting -= 1
+                running = True
+                self.in_flight += 1
+                try:
+                    await coroutine
+                finally:
+                    self.in_flight -= 1
+                    self.processed += 1
+        finally:
+            if not running:
+                self.waiting -= 1
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "active_keys": len(self._locks),
+            "processed": self.processed,
+        }